@@ -0,0 +1,204 @@
+# coding: utf-8
+import atexit
+import os
+import sqlite3
+import subprocess
+import threading
+import logging
+from . import timings
+
+log = logging.getLogger(__name__)
+
+
+class ActivityIndex:
+    """
+    Index of the commits authored by the user in the git repositories of all
+    projects, stored in <statedir>/activity.sqlite.
+
+    For each repository, the index remembers the ref tips it has seen, and
+    updating it only walks the history added since.
+    """
+    # Open indices, by state directory
+    _indices = {}
+
+    def __init__(self, statedir):
+        self.statedir = statedir
+        self.pathname = self.get_pathname(statedir)
+        # Log enrichment may run in several threads
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.pathname, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS repos (
+                gitdir TEXT PRIMARY KEY,
+                project TEXT NOT NULL,
+                email TEXT,
+                abbrev INTEGER NOT NULL,
+                tips TEXT NOT NULL)
+        """)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS commits (
+                gitdir TEXT NOT NULL,
+                sha TEXT NOT NULL,
+                author_time INTEGER NOT NULL,
+                summary TEXT NOT NULL,
+                PRIMARY KEY (gitdir, sha))
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS commits_time ON commits (author_time)")
+        self.db.commit()
+
+    @classmethod
+    def get_pathname(cls, statedir):
+        return os.path.join(statedir, "activity.sqlite")
+
+    @classmethod
+    def get(cls, statedir):
+        """
+        Return the index for the given state directory, creating it if needed
+        """
+        res = cls._indices.get(statedir)
+        if res is None:
+            if not cls._indices:
+                atexit.register(cls.close_all)
+            res = cls._indices[statedir] = cls(statedir)
+        return res
+
+    @classmethod
+    def get_existing(cls, statedir):
+        """
+        Return the index for the given state directory, or None if no index
+        has been created yet
+        """
+        res = cls._indices.get(statedir)
+        if res is not None: return res
+        if not os.path.exists(cls.get_pathname(statedir)): return None
+        return cls.get(statedir)
+
+    @classmethod
+    def close_all(cls):
+        for index in cls._indices.values():
+            index.close()
+        cls._indices = {}
+
+    def close(self):
+        if self.db is None: return
+        self.db.close()
+        self.db = None
+
+    def _git(self, gitdir, *args):
+        res = subprocess.run(["git", "--git-dir", gitdir] + list(args),
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        if res.returncode != 0: return None
+        return res.stdout.decode("utf-8", errors="replace")
+
+    def update_project(self, proj):
+        """
+        Index the new commits in all the git repositories of a project
+        """
+        for gitdir in proj.gitdirs():
+            self.update_repo(gitdir, proj.name)
+
+    def update_repo(self, gitdir, project):
+        """
+        Index the commits added to a git repository since the last update
+        """
+        with timings.phase("git"):
+            self._update_repo(os.path.abspath(gitdir), project)
+
+    def _update_repo(self, gitdir, project):
+        out = self._git(gitdir, "for-each-ref", "--format=%(objectname)", "refs/heads", "refs/tags")
+        if out is None: return
+        tips = sorted(set(out.split()))
+        email = None
+        abbrev = 7
+        for line in (self._git(gitdir, "config", "--get-regexp", r"^(user\.email|core\.abbrev)$") or "").splitlines():
+            key, value = line.partition(" ")[::2]
+            if key == "user.email":
+                email = value.strip()
+            elif key == "core.abbrev" and value.strip().isdigit():
+                abbrev = int(value)
+
+        with self.lock:
+            row = self.db.execute("SELECT email, abbrev, tips FROM repos WHERE gitdir=?", (gitdir,)).fetchone()
+        if row is not None and row[0] == email:
+            old_tips = row[2].split()
+        else:
+            old_tips = []
+        if row is not None and tips == old_tips and row[1] == abbrev:
+            return
+
+        commits = []
+        if tips and email:
+            # Only walk what is reachable from the new tips but not from the
+            # old ones. Old tips may have been garbage collected, in which
+            # case --ignore-missing skips them
+            args = ["log", "-z", "--ignore-missing", "--format=%H%x1f%ae%x1f%at%x1f%B"] + tips
+            if old_tips:
+                args.append("--not")
+                args.extend(old_tips)
+            out = self._git(gitdir, *args)
+            for rec in (out or "").split("\0"):
+                if not rec: continue
+                sha, author_email, date, message = rec.split("\x1f", 3)
+                if author_email != email: continue
+                commits.append((gitdir, sha, int(date), message.split("\n", 1)[0]))
+            # Insert oldest first, so that rowid can sort commits with the
+            # same author time
+            commits.reverse()
+
+        with self.lock:
+            if row is not None and row[0] != email:
+                # The user changed: the commits indexed so far are not theirs
+                self.db.execute("DELETE FROM commits WHERE gitdir=?", (gitdir,))
+            self.db.executemany("INSERT OR IGNORE INTO commits (gitdir, sha, author_time, summary) VALUES (?, ?, ?, ?)", commits)
+            self.db.execute("INSERT OR REPLACE INTO repos (gitdir, project, email, abbrev, tips) VALUES (?, ?, ?, ?, ?)",
+                            (gitdir, project, email, abbrev, " ".join(tips)))
+            self.db.commit()
+        log.debug("%s: indexed %d new commits", gitdir, len(commits))
+
+    def abbrev_size(self, gitdir):
+        """
+        Return the length of abbreviated commit hashes configured for the
+        repository
+        """
+        with self.lock:
+            row = self.db.execute("SELECT abbrev FROM repos WHERE gitdir=?", (os.path.abspath(gitdir),)).fetchone()
+        return row[0] if row is not None else 7
+
+    def reachable(self, gitdir, rev="HEAD", since=None):
+        """
+        Return the set of hashes of the commits reachable from rev, optionally
+        only those committed since the given UNIX timestamp
+        """
+        args = ["rev-list"]
+        if since is not None: args.append("--since={}".format(int(since)))
+        args.append(rev)
+        out = self._git(os.path.abspath(gitdir), *args)
+        return set((out or "").split())
+
+    def commits(self, since=None, until=None, gitdirs=None):
+        """
+        Return (project, gitdir, sha, author_time, summary) tuples for the
+        indexed commits, newest first.
+
+        since and until are optional UNIX timestamps limiting the author
+        time; gitdirs optionally restricts the results to the given
+        repositories.
+        """
+        query = ["SELECT r.project, c.gitdir, c.sha, c.author_time, c.summary"
+                 " FROM commits c JOIN repos r ON r.gitdir = c.gitdir WHERE 1"]
+        params = []
+        if since is not None:
+            query.append("AND c.author_time >= ?")
+            params.append(since)
+        if until is not None:
+            query.append("AND c.author_time < ?")
+            params.append(until)
+        if gitdirs is not None:
+            gitdirs = [os.path.abspath(x) for x in gitdirs]
+            query.append("AND c.gitdir IN ({})".format(",".join("?" * len(gitdirs))))
+            params.extend(gitdirs)
+        query.append("ORDER BY c.author_time DESC, c.rowid DESC")
+        with self.lock:
+            return self.db.execute(" ".join(query), params).fetchall()
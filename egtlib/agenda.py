@@ -0,0 +1,215 @@
+# coding: utf-8
+import atexit
+import datetime
+import json
+import os
+import sqlite3
+import logging
+from . import timings
+
+log = logging.getLogger(__name__)
+
+
+class AgendaIndex:
+    """
+    Index of the dated items and contexts of all projects, stored in
+    <statedir>/agenda.sqlite.
+
+    Events are the dates of tasks (due, scheduled, and the other TaskWarrior
+    date attributes) and the Start-date and End-date of projects. Contexts
+    are the tags used by tasks.
+
+    A project is indexed again only if its file, or the task dates saved in
+    its state by the last TaskWarrior sync, changed.
+    """
+    # Open indices, by state directory
+    _indices = {}
+
+    def __init__(self, statedir):
+        self.statedir = statedir
+        self.pathname = os.path.join(statedir, "agenda.sqlite")
+        self.db = sqlite3.connect(self.pathname)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                abspath TEXT PRIMARY KEY,
+                project TEXT NOT NULL,
+                archived INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL,
+                task_dates TEXT NOT NULL)
+        """)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                abspath TEXT NOT NULL,
+                date TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                lineno INTEGER NOT NULL,
+                text TEXT NOT NULL)
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS events_date ON events (date)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS events_abspath ON events (abspath)")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS contexts (
+                abspath TEXT NOT NULL,
+                context TEXT NOT NULL,
+                PRIMARY KEY (abspath, context))
+        """)
+        self.db.commit()
+
+    @classmethod
+    def get(cls, statedir):
+        """
+        Return the index for the given state directory, opening it if needed
+        """
+        res = cls._indices.get(statedir)
+        if res is None:
+            if not cls._indices:
+                atexit.register(cls.close_all)
+            res = cls._indices[statedir] = cls(statedir)
+        return res
+
+    @classmethod
+    def close_all(cls):
+        for index in cls._indices.values():
+            index.close()
+        cls._indices = {}
+
+    def close(self):
+        if self.db is None: return
+        self.db.commit()
+        self.db.close()
+        self.db = None
+
+    def _project_task_dates(self):
+        """
+        Return a dict mapping project names to the task dates saved in their
+        state, as JSON strings
+        """
+        from .statestore import ProjectStateStore
+        res = {}
+        for name, state in ProjectStateStore.get(self.statedir).load_all().items():
+            tasks = state.get("tasks")
+            if not tasks: continue
+            res[name] = json.dumps(tasks.get("dates", {}), sort_keys=True)
+        return res
+
+    def update(self, fnames):
+        """
+        Make sure the index is up to date for the given project files,
+        indexing again those that changed since the last time
+        """
+        from .project import Project
+        with timings.phase("agenda.update"):
+            all_dates = self._project_task_dates()
+            indexed = {}
+            for abspath, project, mtime, size, task_dates in self.db.execute(
+                    "SELECT abspath, project, mtime, size, task_dates FROM files"):
+                indexed[abspath] = (project, mtime, size, task_dates)
+            for fname in fnames:
+                try:
+                    st = os.stat(fname)
+                except FileNotFoundError:
+                    self.remove(fname)
+                    continue
+                old = indexed.get(fname)
+                if old is not None and old[1:] == (st.st_mtime, st.st_size, all_dates.get(old[0], "{}")):
+                    continue
+                try:
+                    proj = Project.from_file(fname, statedir=self.statedir)
+                except Exception as e:
+                    log.exception("%s: failed to parse: %s", fname, str(e))
+                    continue
+                self.index_project(proj, st)
+            self.db.commit()
+
+    def remove(self, fname):
+        """
+        Remove a project file from the index
+        """
+        self.db.execute("DELETE FROM events WHERE abspath=?", (fname,))
+        self.db.execute("DELETE FROM contexts WHERE abspath=?", (fname,))
+        self.db.execute("DELETE FROM files WHERE abspath=?", (fname,))
+
+    def prune(self, fnames):
+        """
+        Remove from the index all files not in fnames
+        """
+        fnames = set(fnames)
+        for abspath, in self.db.execute("SELECT abspath FROM files").fetchall():
+            if abspath not in fnames:
+                self.remove(abspath)
+        self.db.commit()
+
+    def index_project(self, proj, st=None):
+        """
+        Index a loaded project. The change is committed by the caller.
+        """
+        if st is None: st = os.stat(proj.abspath)
+        tasks_state = proj.state.get("tasks") or {}
+        saved_dates = {str(k): v for k, v in tasks_state.get("dates", {}).items()}
+
+        events = []
+        for kind in ("start-date", "end-date"):
+            val = proj.meta.get(kind, None)
+            if val is None: continue
+            try:
+                date = datetime.datetime.strptime(val, "%Y-%m-%d").date()
+            except ValueError:
+                log.warning("%s: cannot parse %s: %s", proj.abspath, kind, val)
+                continue
+            events.append((proj.abspath, date.strftime("%Y-%m-%d"), kind, proj.meta._lineno + 1, proj.name))
+
+        contexts = set()
+        body_lineno = proj.body._lineno or 0
+        tasks = set(id(t) for t in proj.body.tasks)
+        for idx, el in enumerate(proj.body.content):
+            if id(el) not in tasks: continue
+            contexts |= el.tags
+            if el.id is not None and str(el.id) in saved_dates:
+                dates = saved_dates[str(el.id)]
+            else:
+                dates = {k: v.strftime("%Y-%m-%d") for k, v in el.dates.items()}
+            for kind, date in dates.items():
+                events.append((proj.abspath, date, kind, body_lineno + idx + 1, el.desc))
+
+        self.remove(proj.abspath)
+        self.db.executemany("INSERT INTO events (abspath, date, kind, lineno, text) VALUES (?, ?, ?, ?, ?)", events)
+        self.db.executemany("INSERT INTO contexts (abspath, context) VALUES (?, ?)", ((proj.abspath, c) for c in contexts))
+        self.db.execute("INSERT INTO files (abspath, project, archived, mtime, size, task_dates) VALUES (?, ?, ?, ?, ?, ?)",
+                        (proj.abspath, proj.name, proj.archived, st.st_mtime, st.st_size,
+                         json.dumps(saved_dates, sort_keys=True)))
+
+    def events(self, since=None, until=None, fnames=None, archived=False):
+        """
+        Generate (date, kind, project, abspath, lineno, text) for the events
+        between since and until (both included, and both optional), sorted
+        by date
+        """
+        sql = ["SELECT e.date, e.kind, f.project, e.abspath, e.lineno, e.text"
+               " FROM events e JOIN files f ON f.abspath = e.abspath WHERE 1"]
+        params = []
+        if since is not None:
+            sql.append("AND e.date >= ?")
+            params.append(since.strftime("%Y-%m-%d"))
+        if until is not None:
+            sql.append("AND e.date <= ?")
+            params.append(until.strftime("%Y-%m-%d"))
+        if not archived:
+            sql.append("AND NOT f.archived")
+        sql.append("ORDER BY e.date, f.project, e.lineno")
+        fnames = set(fnames) if fnames is not None else None
+        for date, kind, project, abspath, lineno, text in self.db.execute(" ".join(sql), params):
+            if fnames is not None and abspath not in fnames: continue
+            yield datetime.datetime.strptime(date, "%Y-%m-%d").date(), kind, project, abspath, lineno, text
+
+    def contexts(self, fnames=None, archived=False):
+        """
+        Return the set of all contexts
+        """
+        sql = "SELECT c.abspath, c.context FROM contexts c JOIN files f ON f.abspath = c.abspath"
+        if not archived:
+            sql += " WHERE NOT f.archived"
+        fnames = set(fnames) if fnames is not None else None
+        return set(context for abspath, context in self.db.execute(sql) if fnames is None or abspath in fnames)
@@ -3,13 +3,17 @@
 import re
 import sys
 import shlex
-import taskw
+import datetime
+from . import timings
+from .taskwarrior import AsyncTaskWarrior
 
 
 class Line:
     """
     One line of text
     """
+    __slots__ = ("line",)
+
     def __init__(self, line):
         self.line = line
 
@@ -18,9 +22,14 @@ class Line:
 
 
 class Task:
+    __slots__ = ("body", "indent", "task", "depends", "is_new", "id", "desc",
+                 "tags", "attributes", "is_orphan")
+
     re_attribute = re.compile(r"^(?P<key>[^:]+):(?P<val>[^:]+)$")
     task_attributes = ["start", "end", "due", "until",
                        "wait", "scheduled", "priority"]
+    date_attributes = ["start", "end", "due", "until", "wait", "scheduled"]
+    re_date = re.compile(r"^(?P<date>\d{4}-\d{2}-\d{2})(?:T[0-9:]+Z?)?$")
     """
     A TaskWarrior task
     """
@@ -84,14 +93,73 @@ class Task:
         if not self.is_new: return
         tags = self.body.project.tags | self.tags
         # the following lines are a workaround for https://github.com/ralphbean/taskw/issues/111
-        self.body.tw._marshal = False
-        newtask = self.body.tw.task_add(self.desc, project=self.body.project.name, tags=sorted(tags), **self.attributes)
-        self.body.tw._marshal = True
-        id, task = self.body.tw.get_task(uuid=newtask["id"])
+        with timings.phase("taskwarrior"):
+            self.body.tw._marshal = False
+            newtask = self.body.tw.task_add(self.desc, project=self.body.project.name, tags=sorted(tags), **self.attributes)
+            self.body.tw._marshal = True
+            id, task = self.body.tw.get_task(uuid=newtask["id"])
+        self.set_created(task)
+
+    def set_created(self, task):
+        """
+        Map this task to the TaskWarrior task just created for it
+        """
         self.set_twtask(task)
         self.id = self.task["id"]
         self.is_new = None
 
+    @property
+    def can_import(self):
+        """
+        Check if the task can be created with a TaskWarrior JSON import.
+
+        Attribute values and quoted descriptions need the parsing done by
+        'task add', so tasks using them need to be created one by one.
+        """
+        if self.attributes: return False
+        return " ".join(shlex.split(self.desc)) == self.desc
+
+    def import_record(self):
+        """
+        Return the TaskWarrior JSON import record for creating this task
+        """
+        tags = self.body.project.tags | self.tags
+        return {
+            "description": self.desc,
+            "project": self.body.project.name,
+            "tags": sorted(tags),
+            "entry": datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ"),
+        }
+
+    @property
+    def dates(self):
+        """
+        Return a dict mapping date attribute names to datetime.date objects.
+
+        Dates come from TaskWarrior if the task has been resolved, else from
+        the attributes in the project file. TaskWarrior date expressions like
+        'tomorrow' are only understood by TaskWarrior, and are skipped.
+        """
+        res = {}
+        if self.task:
+            for name in self.date_attributes:
+                val = self.task.get(name)
+                if isinstance(val, datetime.datetime):
+                    # TaskWarrior dates are in UTC
+                    if val.tzinfo is not None: val = val.astimezone()
+                    res[name] = val.date()
+        else:
+            for name in self.date_attributes:
+                val = self.attributes.get(name)
+                if val is None: continue
+                mo = self.re_date.match(val)
+                if mo is None: continue
+                try:
+                    res[name] = datetime.datetime.strptime(mo.group("date"), "%Y-%m-%d").date()
+                except ValueError:
+                    pass
+        return res
+
     def resolve_task(self):
         """
         Resolve a task ID from a project file into a TaskWarrior task.
@@ -108,7 +176,8 @@ class Task:
             ids = tasks.get("ids", None)
             uuid = ids.get(str(self.id), None)
             if uuid is not None:
-                id, task = self.body.tw.get_task(uuid=uuid)
+                with timings.phase("taskwarrior"):
+                    id, task = self.body.tw.get_task(uuid=uuid)
                 if task:
                     self.set_twtask(task)
                     self.id = task["id"] if task["id"] != 0 else None
@@ -118,7 +187,8 @@ class Task:
                     return
 
         # Looking up by uuid failed, try looking up by description
-        id, task = self.body.tw.get_task(description=self.desc)
+        with timings.phase("taskwarrior"):
+            id, task = self.body.tw.get_task(description=self.desc)
         if task:
             self.set_twtask(task)
             return
@@ -133,7 +203,8 @@ class Task:
         if task:
             if "depends" in task:
                 depends_uuids = set(task["depends"])
-                self.depends = set(self.body.tw.get_task(uuid=t)[0] for t in depends_uuids)
+                with timings.phase("taskwarrior"):
+                    self.depends = set(self.body.tw.get_task(uuid=t)[0] for t in depends_uuids)
         return
 
     def print(self, file):
@@ -180,12 +251,12 @@ class Body:
         This is used in tests to instantiate TaskWarrior objects pointing to
         the test TaskWarrior configuration.
         """
-        self._tw = taskw.TaskWarrior(marshal=True, **kw)
+        self._tw = AsyncTaskWarrior(marshal=True, **kw)
 
     @property
     def tw(self):
         if self._tw is None:
-            self._tw = taskw.TaskWarrior(marshal=True)
+            self._tw = AsyncTaskWarrior(marshal=True)
         return self._tw
 
     def parse(self, lines):
@@ -204,17 +275,43 @@ class Body:
             else:
                 self.content.append(Line(line))
 
+    def prefetch_tasks(self):
+        """
+        Load from TaskWarrior, concurrently and in as few calls as possible,
+        the tasks that sync_tasks is going to look up
+        """
+        tasks = self.project.state.get("tasks")
+        ids = tasks.get("ids", {}) if tasks is not None else {}
+        uuids = []
+        descriptions = []
+        for t in self.tasks:
+            if t.is_new: continue
+            uuid = ids.get(str(t.id), None)
+            if uuid is not None:
+                uuids.append(uuid)
+            else:
+                descriptions.append(t.desc)
+        self.tw.prefetch(uuids=uuids, descriptions=descriptions, projects=[self.project.name])
+
     def sync_tasks(self):
         """
         Sync the tasks in the body with TaskWarrior
         """
+        self.prefetch_tasks()
+
         # Load task information from TaskWarrior, for tasks that are already in
         # TaskWarrior
         for t in self.tasks:
             t.resolve_task()
 
-        # Iterate self.tasks creating new tasks in taskwarrior
-        for t in self.tasks:
+        # Create new tasks in taskwarrior, with a single import when possible
+        new_tasks = [t for t in self.tasks if t.is_new]
+        batch = [t for t in new_tasks if t.can_import]
+        if len(batch) > 1:
+            created = self.tw.import_tasks([t.import_record() for t in batch])
+            for t, task in zip(batch, created):
+                t.set_created(task)
+        for t in new_tasks:
             if t.is_new:
                 t.create()
 
@@ -226,7 +323,9 @@ class Body:
 
         # Add all the Taskwarrior tasks not present in self.tasks
         new = []
-        for task in self.tw.filter_tasks({"project": self.project.name}):
+        with timings.phase("taskwarrior"):
+            project_tasks = self.tw.filter_tasks({"project": self.project.name})
+        for task in project_tasks:
             if task["id"] == 0 or str(task["uuid"]) in known_uuids: continue
             task = Task(self, task["id"], task=task)
             new.append(task)
@@ -239,11 +338,16 @@ class Body:
 
         # Rebuild state and save it
         ids = {}
+        # Task dates are only known to TaskWarrior: keep a copy for the agenda
+        dates = {}
         for t in self.tasks:
             if t.is_orphan: continue
             if t.id is None: continue
             ids[t.id] = str(t.task["uuid"])
-        self.project.state.set("tasks", {"ids": ids})
+            task_dates = t.dates
+            if task_dates:
+                dates[t.id] = {k: v.strftime("%Y-%m-%d") for k, v in task_dates.items()}
+        self.project.state.set("tasks", {"ids": ids, "dates": dates})
 
     def print(self, file):
         """
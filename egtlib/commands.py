@@ -1,5 +1,7 @@
 import egtlib
 from .utils import format_duration
+from . import timings
+from . import utils
 from configparser import RawConfigParser
 import os
 import datetime
@@ -24,7 +26,17 @@ class Command:
         self.config.read([os.path.expanduser("~/.egt.conf")])
 
     def make_egt(self, filter=[]):
-        return egtlib.Egt(config=self.config, filter=filter, show_archived=self.args.archived)
+        from .query import QueryError
+        try:
+            return egtlib.Egt(config=self.config, filter=filter, show_archived=self.args.archived)
+        except QueryError as e:
+            raise CommandError(str(e))
+
+    def parse_date(self, val):
+        try:
+            return datetime.datetime.strptime(val, "%Y-%m-%d").date()
+        except ValueError:
+            raise CommandError("cannot parse date {}: please use YYYY-MM-DD".format(val))
 
     @classmethod
     def add_args(cls, subparser):
@@ -33,6 +45,7 @@ class Command:
     @classmethod
     def register(cls, c):
         cls.COMMANDS.append(c)
+        return c
 
 
 @Command.register
@@ -40,18 +53,29 @@ class Scan(Command):
     """
     Update the list of known project files, by scanning everything below the
     home directory.
+
+    Directories listed in .egtignore files, using gitignore syntax, are
+    skipped, as well as those matching the patterns in 'scan-exclude' in the
+    [config] section of the configuration, which are anchored to each root
+    directory if they contain a slash.
     """
     def main(self):
         if self.args.roots:
             dirs = self.args.roots
         else:
             dirs = [os.path.expanduser("~")]
+        excludes = self.config.get("config", "scan-exclude", fallback="").splitlines()
+        excludes.extend(self.args.exclude)
         from .state import State
-        State.rescan(dirs)
+        State.rescan(dirs, excludes=excludes, one_file_system=self.args.one_file_system,
+                     max_depth=self.args.max_depth)
 
     @classmethod
     def add_args(cls, subparser):
         super().add_args(subparser)
+        subparser.add_argument("-x", "--one-file-system", action="store_true", help="do not descend into directories on other file systems")
+        subparser.add_argument("--max-depth", type=int, metavar="N", help="do not descend more than N directories below the roots")
+        subparser.add_argument("--exclude", action="append", metavar="PATTERN", default=[], help="skip paths matching this gitignore-style pattern (can be given multiple times)")
         subparser.add_argument("roots", nargs="*", help="root directories to search (default: the home directory)")
 
 
@@ -107,13 +131,13 @@ class Summary(Command):
         blanks.sort(key=lambda p: p.name)
         worked.sort(key=lambda p: p.last_updated)
 
-        now = datetime.datetime.now()
+        now = utils.now()
 
         def add_summary(p):
             table.add_row((
                 p.name,
                 " ".join(sorted(p.tags)),
-                len(list(p.log.entries)),
+                p.log.entry_count,
                 format_duration(p.elapsed, tabular=True) if p.last_updated else "--",
                 "%s ago" % format_td(now - p.last_updated, tabular=True) if p.last_updated else "--",
             ))
@@ -129,7 +153,8 @@ class Summary(Command):
         for p in blanks: add_summary(p)
         for p in worked: add_summary(p)
 
-        print(table.draw())
+        with timings.phase("render"):
+            print(table.draw())
 
     @classmethod
     def add_args(cls, subparser):
@@ -192,7 +217,7 @@ class Grep(Command):
     """
     def main(self):
         e = self.make_egt(self.args.projects)
-        for proj in e.projects:
+        for proj in e.iter_projects(order="name", bounded=True):
             proj.run_grep([self.args.pattern])
 
     @classmethod
@@ -202,6 +227,34 @@ class Grep(Command):
         subparser.add_argument("projects", nargs="*", help="project(s) to work on")
 
 
+@Command.register
+class Search(Command):
+    """
+    Search the contents of project files
+    """
+    def main(self):
+        from .search import SearchIndex
+        from .state import State
+        e = self.make_egt(self.args.projects or [])
+        index = SearchIndex.get(e.statedir or State.get_state_dir())
+        if self.args.projects:
+            fnames = [p.abspath for p in e.projects]
+        else:
+            # Without a filter, avoid loading projects that did not change
+            fnames = [info["fname"] for info in e.state.projects.values()]
+        index.update(fnames, statedir=e.statedir)
+        for name, abspath, lineno, section, text in index.search(
+                self.args.terms, fnames=fnames, sections=self.args.sections, archived=self.args.archived):
+            print("{}:{}: {}".format(name, lineno, text))
+
+    @classmethod
+    def add_args(cls, subparser):
+        super().add_args(subparser)
+        subparser.add_argument("terms", nargs="+", help="words to look for; a trailing '*' matches any word starting with the rest")
+        subparser.add_argument("--project", "-p", dest="projects", action="append", help="project(s) to search, or project filter (default: all)")
+        subparser.add_argument("--in", dest="sections", action="append", choices=("meta", "log", "body"), help="only search in the given section of project files (can be given multiple times)")
+
+
 @Command.register
 class MrConfig(Command):
     """
@@ -228,15 +281,14 @@ class Weekrpt(Command):
     """
     def main(self):
         from egtlib.texttable import Texttable
+        from egtlib.egt import WeeklyReport
         import shutil
         # egt weekrpt also showing stats by project, and by tags
         e = self.make_egt(self.args.projects)
-        # TODO: add an option to choose the current time
-        # if self.args.projects:
-        #     end = datetime.datetime.strptime(self.args.projects[0], "%Y-%m-%d").date()
-        # else:
-        #     end = None
-        end = None
+        end = self.parse_date(self.args.end) if self.args.end else None
+        days = self.args.days
+        if days < 1:
+            raise CommandError("--days must be at least 1")
 
         termsize = shutil.get_terminal_size((80, 25))
         table = Texttable(max_width=termsize.columns)
@@ -244,7 +296,7 @@ class Weekrpt(Command):
         table.set_cols_align(("l", "r", "r", "r", "r"))
         table.set_cols_dtype(('t', "i", "i", "i", "i"))
         table.add_row(("Tag", "Entries", "Hours", "h/day", "h/wday"))
-        rep = e.weekrpt(end=end)
+        rep = e.weekrpt(end=end, days=days)
         print()
         print(" * Activity from %s to %s" % (rep["begin"], rep["until"]))
         print()
@@ -254,15 +306,14 @@ class Weekrpt(Command):
         table.add_row(("(any)", rep["count"], rep["hours"], rep["hours_per_day"], rep["hours_per_workday"]))
 
         # Per-tag stats
-        all_tags = set()
-        for p in e.projects:
-            all_tags |= p.tags
-        for t in sorted(all_tags):
-            rep = e.weekrpt(end=end, tags=frozenset((t,)))
-            table.add_row((t, rep["count"], rep["hours"], rep["hours_per_day"], rep["hours_per_workday"]))
+        empty = WeeklyReport.stats(0, 0, days, rep["workdays"])
+        for t in e.all_tags:
+            st = rep["tags"].get(t, empty)
+            table.add_row((t, st["count"], st["hours"], st["hours_per_day"], st["hours_per_workday"]))
 
-        print(table.draw())
-        print()
+        with timings.phase("render"):
+            print(table.draw())
+            print()
 
         # Per-package stats
         table = Texttable(max_width=termsize.columns)
@@ -270,21 +321,77 @@ class Weekrpt(Command):
         table.set_cols_align(("l", "r", "r", "r", "r"))
         table.set_cols_dtype(('t', "i", "i", "i", "i"))
         table.add_row(("Project", "Entries", "Hours", "h/day", "h/wday"))
-        for p in e.projects:
-            rep = e.weekrpt(end=end, projs=[p])
-            if not rep["count"]: continue
-            table.add_row((p.name, rep["count"], rep["hours"], rep["hours_per_day"], rep["hours_per_workday"]))
+        for name, st in sorted(rep["projects"].items()):
+            table.add_row((name, st["count"], st["hours"], st["hours_per_day"], st["hours_per_workday"]))
+
+        with timings.phase("render"):
+            print(table.draw())
+            print()
+
+            log.sort(key=lambda x: x[0].begin)
+            for l, p in log:
+                l.print(sys.stdout, project=p.name)
+
+    @classmethod
+    def add_args(cls, subparser):
+        super().add_args(subparser)
+        subparser.add_argument("--end", metavar="YYYY-MM-DD", help="last day of the report (default: today)")
+        subparser.add_argument("--days", type=int, default=7, help="number of days covered by the report, ending on the --end day included (default: %(default)s)")
+        subparser.add_argument("projects", nargs="*", help="project(s) to work on")
 
-        print(table.draw())
-        print()
 
-        log.sort(key=lambda x: x[0].begin)
-        for l, p in log:
-            l.print(sys.stdout, project=p.name)
+@Command.register
+class Trend(Command):
+    """
+    Show, day by day, the hours logged in a rolling window
+    """
+    def parse_window(self, val):
+        units = {"d": 1, "w": 7}
+        try:
+            if val[-1:] in units:
+                res = int(val[:-1]) * units[val[-1]]
+            else:
+                res = int(val)
+        except ValueError:
+            res = 0
+        if res < 1:
+            raise CommandError("cannot parse window {}: please use a number of days, like 7d, or of weeks, like 2w".format(val))
+        return res
+
+    def main(self):
+        from egtlib.texttable import Texttable
+        from .timeseries import ActivitySeries, TimeSeries
+        import shutil
+        window = self.parse_window(self.args.window)
+        until = self.parse_date(self.args.end) if self.args.end else utils.today()
+        e = self.make_egt(self.args.projects)
+        activity = ActivitySeries(e.iter_projects(bounded=True))
+        if self.args.tag:
+            series = activity.tags.get(self.args.tag, TimeSeries())
+        else:
+            series = activity.total
+
+        termsize = shutil.get_terminal_size((80, 25))
+        table = Texttable(max_width=termsize.columns)
+        table.set_deco(Texttable.HEADER)
+        table.set_cols_align(("l", "l", "r", "r", "r", "r"))
+        table.set_cols_dtype(("t", "t", "i", "f", "f", "f"))
+        table.set_precision(1)
+        table.add_row(("From", "To", "Entries", "Hours", "h/day", "h/wday"))
+        for begin, end, count, mins in series.rolling(window, until, self.args.days):
+            workdays = e.calendar.workdays(begin, end)
+            table.add_row((begin.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"), count, mins / 60, mins / 60 / window,
+                           mins / 60 / workdays if workdays else 0))
+        with timings.phase("render"):
+            print(table.draw())
 
     @classmethod
     def add_args(cls, subparser):
         super().add_args(subparser)
+        subparser.add_argument("--window", default="7d", help="length of the rolling window, in days (7d) or weeks (2w) (default: %(default)s)")
+        subparser.add_argument("--days", type=int, default=28, help="number of days to show (default: %(default)s)")
+        subparser.add_argument("--end", metavar="YYYY-MM-DD", help="last day to show (default: today)")
+        subparser.add_argument("--tag", help="only count the projects with this tag")
         subparser.add_argument("projects", nargs="*", help="project(s) to work on")
 
 
@@ -295,27 +402,145 @@ class PrintLog(Command):
     """
     NAME = "print_log"
 
+    @classmethod
+    def iter_entries(cls, project, since=None, until=None):
+        """
+        Return an iterator of (begin, entry) for the log entries of a project
+        that begin between since and until (both optional and included), in
+        chronological order.
+
+        The entries are taken from the project right away, so that the
+        project itself does not need to be kept in memory.
+        """
+        entries = list(project.log.entries)
+        # Logs are normally written in chronological order: only sort those
+        # that are not
+        if any(a.begin > b.begin for a, b in zip(entries, entries[1:])):
+            entries.sort(key=lambda e: e.begin)
+        return cls._entries_between(entries, since, until)
+
+    @classmethod
+    def _entries_between(cls, entries, since, until):
+        for entry in entries:
+            day = entry.begin.date()
+            if since is not None and day < since: continue
+            # Nothing after this can be in range
+            if until is not None and day > until: break
+            yield entry.begin, entry
+
     def main(self):
+        import heapq
+        since = self.parse_date(self.args.since) if self.args.since else None
+        until = self.parse_date(self.args.until) if self.args.until else None
         e = self.make_egt(self.args.projects)
-        log = []
-        projs = set()
+        # The first entry to print can come from any project, so all logs
+        # are read before printing. Only their entries are kept: each project
+        # is released as soon as the next one is loaded
+        logs = [self.iter_entries(p, since, until) for p in e.iter_projects(order="name", bounded=True)]
+        # Merge the logs of all projects, which are already sorted. Ties are
+        # resolved in project name order
+        merged = heapq.merge(*logs, key=lambda x: x[0])
+        with timings.phase("render"):
+            for begin, entry in merged:
+                entry.print(sys.stdout)
+
+    @classmethod
+    def add_args(cls, subparser):
+        super().add_args(subparser)
+        subparser.add_argument("--since", metavar="YYYY-MM-DD", help="only print entries from this day")
+        subparser.add_argument("--until", metavar="YYYY-MM-DD", help="only print entries until this day, included")
+        subparser.add_argument("projects", nargs="*", help="project(s) to work on")
+
+
+@Command.register
+class Commits(Command):
+    """
+    Compare, day by day, the git commits you authored with the time you
+    logged
+    """
+    def main(self):
+        from egtlib.texttable import Texttable
+        from .activity import ActivityIndex
+        from .state import State
+        import shutil
+        e = self.make_egt(self.args.projects)
+        index = ActivityIndex.get(e.statedir or State.get_state_dir())
+
+        until = utils.today() + datetime.timedelta(days=1)
+        since = until - datetime.timedelta(days=self.args.days)
+        ts_since = datetime.datetime.combine(since, datetime.time(0)).timestamp()
+        ts_until = datetime.datetime.combine(until, datetime.time(0)).timestamp()
+
+        # Map (date, project name) to [commit count, logged minutes]
+        stats = {}
         for p in e.projects:
-            for l in p.log.entries:
-                log.append((l, p))
-            projs.add(p)
+            index.update_project(p)
+            gitdirs = list(p.gitdirs())
+            if gitdirs:
+                for name, gitdir, sha, author_time, summary in index.commits(since=ts_since, until=ts_until, gitdirs=gitdirs):
+                    day = datetime.date.fromtimestamp(author_time)
+                    stats.setdefault((day, p.name), [0, 0])[0] += 1
+            for entry in p.log.entries:
+                day = entry.begin.date()
+                if day < since or day >= until: continue
+                stats.setdefault((day, p.name), [0, 0])[1] += entry.duration
 
-        log.sort(key=lambda x: x[0].begin)
-        if len(projs) == 1:
-            for l, p in log:
-                l.print(sys.stdout)
+        termsize = shutil.get_terminal_size((80, 25))
+        table = Texttable(max_width=termsize.columns)
+        table.set_deco(Texttable.HEADER)
+        table.set_cols_align(("l", "l", "r", "r", "l"))
+        table.set_cols_dtype(("t", "t", "i", "t", "t"))
+        table.add_row(("Date", "Project", "Commits", "Logged", "Notes"))
+        for (day, name), (count, mins) in sorted(stats.items()):
+            if count and not mins:
+                note = "not logged"
+            elif mins and not count:
+                note = "no commits"
+            else:
+                note = ""
+            table.add_row((day.strftime("%Y-%m-%d"), name, count, format_duration(mins) if mins else "-", note))
+
+        with timings.phase("render"):
+            print(table.draw())
+
+    @classmethod
+    def add_args(cls, subparser):
+        super().add_args(subparser)
+        subparser.add_argument("projects", nargs="*", help="project(s) to work on")
+        subparser.add_argument("--days", type=int, default=7, help="number of days to report, ending today (default: %(default)s)")
+
+
+@Command.register
+class Agenda(Command):
+    """
+    Show dated tasks and project start and end dates in a period
+    """
+    def main(self):
+        from .agenda import AgendaIndex
+        from .state import State
+        since = self.parse_date(self.args.since) if self.args.since else utils.today()
+        until = self.parse_date(self.args.until) if self.args.until else since + datetime.timedelta(days=7)
+
+        e = self.make_egt(self.args.projects)
+        index = AgendaIndex.get(e.statedir or State.get_state_dir())
+        if self.args.projects:
+            fnames = [p.abspath for p in e.projects]
         else:
-            for l, p in log:
-                l.print(sys.stdout)
+            # Without a filter, avoid loading projects that did not change
+            fnames = [info["fname"] for info in e.state.projects.values()]
+        index.update(fnames)
+
+        with timings.phase("render"):
+            for date, kind, name, abspath, lineno, text in index.events(
+                    since=since, until=until, fnames=fnames, archived=self.args.archived):
+                print("{} {:10} {}:{}: {}".format(date.strftime("%Y-%m-%d"), kind, name, lineno, text))
 
     @classmethod
     def add_args(cls, subparser):
         super().add_args(subparser)
         subparser.add_argument("projects", nargs="*", help="project(s) to work on")
+        subparser.add_argument("--since", metavar="YYYY-MM-DD", help="start of the period to show (default: today)")
+        subparser.add_argument("--until", metavar="YYYY-MM-DD", help="end of the period to show (default: a week after the start)")
 
 
 @Command.register
@@ -323,10 +548,29 @@ class Annotate(Command):
     """
     Print a project file on stdout, annotating its contents with anything
     useful that can be computed.
+
+    With --all, annotate in place all projects, or those matching the given
+    filter, rewriting only the files whose contents changed.
     """
+    def set_locale(self, lang):
+        import locale
+        try:
+            locname = locale.normalize(lang + ".UTF-8")
+            locale.setlocale(locale.LC_ALL, locname)
+        except locale.Error as e:
+            log.warn("Cannot set locale %s: %s", locname, e)
+
     def main(self):
+        if self.args.all:
+            self.annotate_all()
+            return
+
+        if len(self.args.project) != 1:
+            raise CommandError("please give exactly one project to annotate, or use --all")
+        name = self.args.project[0]
+
         egt = egtlib.Egt(config=self.config)
-        abspath = os.path.abspath(self.args.project)
+        abspath = os.path.abspath(name)
         if os.path.exists(abspath):
             if self.args.stdin:
                 proj = egt.load_project(abspath, project_fd=sys.stdin)
@@ -334,32 +578,68 @@ class Annotate(Command):
                 proj = egt.load_project(abspath)
         else:
             if self.args.stdin:
-                proj = egt.project(self.args.project, project_fd=sys.stdin)
+                proj = egt.project(name, project_fd=sys.stdin)
             else:
-                proj = egt.project(self.args.project)
+                proj = egt.project(name)
         if proj is None:
             return
 
         proj.body.sync_tasks()
 
         lang = proj.meta.get("lang")
-        if lang:
-            import locale
-            try:
-                locname = locale.normalize(lang + ".UTF-8")
-                locale.setlocale(locale.LC_ALL, locname)
-            except locale.Error as e:
-                log.warn("Cannot set locale %s: %s", locname, e)
+        if lang: self.set_locale(lang)
 
         # Sync logs after setting locale, so we get the right day/month names
         proj.log.sync()
         proj.print(sys.stdout)
 
+    def annotate_all(self):
+        import locale
+        from concurrent.futures import ThreadPoolExecutor
+        from .taskwarrior import AsyncTaskWarrior
+
+        if self.args.stdin:
+            raise CommandError("--stdin cannot be used with --all")
+
+        e = self.make_egt(filter=self.args.project)
+        projects = e.projects
+        if not projects: return
+
+        # Load all tasks with one query, and share them among all projects
+        tw = AsyncTaskWarrior(marshal=True)
+        tw.snapshot()
+        for proj in projects:
+            proj.body._tw = tw
+            proj.body.sync_tasks()
+
+        # Log sync formats day and month names according to the locale, which
+        # is process-wide: sync one language at a time, running projects in
+        # parallel within each language. Projects without a language go
+        # first, with the locale we started with.
+        by_lang = {}
+        for proj in projects:
+            by_lang.setdefault(proj.meta.get("lang") or "", []).append(proj)
+        orig_locale = locale.setlocale(locale.LC_ALL)
+        try:
+            with ThreadPoolExecutor(max_workers=self.args.jobs) as executor:
+                for lang, projs in sorted(by_lang.items()):
+                    if lang: self.set_locale(lang)
+                    # Wait for all of them before changing locale
+                    list(executor.map(lambda p: p.log.sync(), projs))
+        finally:
+            locale.setlocale(locale.LC_ALL, orig_locale)
+
+        for proj in projects:
+            if proj.rewrite():
+                print(proj.abspath)
+
     @classmethod
     def add_args(cls, subparser):
         super().add_args(subparser)
-        subparser.add_argument("project", help="project to work on")
+        subparser.add_argument("project", nargs="*", help="project to work on; with --all, optional filter for the projects to annotate")
         subparser.add_argument("--stdin", action="store_true", help="read project file data from stdin")
+        subparser.add_argument("--all", action="store_true", help="annotate in place all the projects matching the filter, printing the names of the files that changed")
+        subparser.add_argument("--jobs", "-j", type=int, default=4, help="number of projects to process in parallel with --all (default: %(default)s)")
 
 
 @Command.register
@@ -418,7 +698,7 @@ class Archive(Command):
     def add_args(cls, subparser):
         super().add_args(subparser)
         subparser.add_argument("projects", nargs="*", help="project(s) to work on")
-        last_month = datetime.date.today().replace(day=1) - datetime.timedelta(days=1)
+        last_month = utils.today().replace(day=1) - datetime.timedelta(days=1)
         subparser.add_argument("--month", "-m", action="store", default=last_month.strftime("%Y-%m"), help="print log until the given month (default: %(default)s)")
 
 
@@ -431,7 +711,7 @@ class Backup(Command):
         out = self.config.get("config", "backup-output", fallback=None)
         e = self.make_egt(self.args.projects)
         if out:
-            out = datetime.datetime.now().strftime(out)
+            out = utils.now().strftime(out)
             with open(out, "wb") as fd:
                 e.backup(fd)
         else:
@@ -453,22 +733,20 @@ class Completion(Command):
             raise CommandError("Usage: egt completion {projects|tags|contexts}")
         if self.args.subcommand == "projects":
             e = self.make_egt()
-            names = sorted(e.projects.keys())
-            for n in names:
+            for n in e.projects.keys():
                 print(n)
         elif self.args.subcommand == "tags":
             e = self.make_egt()
-            res = set()
-            for p in e.projects:
-                res |= p.tags
-            for n in sorted(res):
+            for n in e.all_tags:
                 print(n)
         elif self.args.subcommand == "contexts":
+            from .agenda import AgendaIndex
+            from .state import State
             e = self.make_egt()
-            res = set()
-            for p in e.projects:
-                res |= p.contexts
-            for n in sorted(res):
+            index = AgendaIndex.get(e.statedir or State.get_state_dir())
+            fnames = [info["fname"] for info in e.state.projects.values()]
+            index.update(fnames)
+            for n in sorted(index.contexts(fnames=fnames, archived=self.args.archived)):
                 print(n)
         else:
             raise CommandError("Usage: egt completion {projects|tags|contexts}")
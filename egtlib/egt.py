@@ -1,26 +1,57 @@
 import logging
+import bisect
+import os
 import datetime
 import sys
 import re
 from .state import State
-from .utils import intervals_intersect
+from .tags import tag_dictionary
+from . import utils
 
 log = logging.getLogger(__name__)
 
 
 class WeeklyReport(object):
-    def __init__(self):
+    def __init__(self, calendar=None):
         self.projs = []
+        # WorkdayCalendar used to compute hours per workday
+        if calendar is None:
+            from .workdays import WorkdayCalendar
+            calendar = WorkdayCalendar()
+        self.calendar = calendar
 
     def add(self, p):
         self.projs.append(p)
 
+    @classmethod
+    def stats(cls, count, mins, days, workdays):
+        """
+        Return a dict with the statistics for count log entries worth mins
+        minutes over the given number of days, of which workdays are worked
+        """
+        return dict(
+            count=count,
+            hours=mins / 60,
+            hours_per_day=mins / 60 / days,
+            hours_per_workday=mins / 60 / workdays if workdays else 0,
+        )
+
     def report(self, end=None, days=7):
+        """
+        Compute statistics for the log entries in the given period.
+
+        Besides the totals, the result has statistics by project name in
+        'projects' and by tag in 'tags', for the projects and tags with
+        entries in the period. Totals come from range queries on the
+        activity time series of each project, and only the logs of projects
+        with entries in the period are read to list them.
+        """
         if end is None:
-            d_until = datetime.date.today()
+            d_until = utils.today()
         else:
             d_until = end
-        d_begin = d_until - datetime.timedelta(days=days)
+        # The period has 'days' days, ending with d_until
+        d_begin = d_until - datetime.timedelta(days=days - 1)
 
         res = dict(
             begin=d_begin,
@@ -30,20 +61,38 @@ class WeeklyReport(object):
         log = []
         count = 0
         mins = 0
-        from .log import Entry
+        # (project, count, mins) by project name, and (count, mins) by
+        # project tag mask
+        by_project = {}
+        by_mask = {}
         for p in self.projs:
-            for l in p.log.entries:
-                if intervals_intersect(l.begin.date(), l.until.date() if l.until else datetime.date.today(), d_begin, d_until):
-                    log.append((l, p))
-                    count += 1
-                    mins += l.duration
+            p_count, p_mins = p.activity.total(d_begin, d_until)
+            if not p_count: continue
+            for entry in p.log.entries:
+                if d_begin <= entry.begin.date() <= d_until:
+                    log.append((entry, p))
+            count += p_count
+            mins += p_mins
+            by_project[p.name] = (p, p_count, p_mins)
+            mask = p.tag_mask
+            old = by_mask.get(mask)
+            by_mask[mask] = (p_count, p_mins) if old is None else (old[0] + p_count, old[1] + p_mins)
 
+        # Add the totals of each combination of tags to each of its tags
+        by_tag = {}
+        for mask, (m_count, m_mins) in by_mask.items():
+            for pos in tag_dictionary.iter_bits(mask):
+                old = by_tag.get(pos)
+                by_tag[pos] = (m_count, m_mins) if old is None else (old[0] + m_count, old[1] + m_mins)
+
+        workdays = self.calendar.workdays(d_begin, d_until)
+        res.update(self.stats(count, mins, days, workdays))
         res.update(
-            count=count,
-            hours=mins / 60,
-            hours_per_day=mins / 60 / days,
-            hours_per_workday=mins / 60 / 5,  # FIXME: properly compute work days in period
+            workdays=workdays,
             log=log,
+            projects={name: self.stats(c, m, days, self.calendar.for_project(p).workdays(d_begin, d_until))
+                      for name, (p, c, m) in by_project.items()},
+            tags={tag_dictionary.names[pos]: self.stats(c, m, days, workdays) for pos, (c, m) in by_tag.items()},
         )
 
         return res
@@ -61,12 +110,24 @@ class ProjectFilter:
     A project matches the filter if its name is explicitly listed. If it is
     not, it matches if its tag set contains all the +tag tags, and does not
     contain any of the -tag tags.
+
+    If the keywords use the query syntax (see egtlib.query.Query), they are
+    compiled into a query instead. That happens if a keyword has a field
+    prefix like tag: or name:, if there are parentheses, if 'and' or 'or'
+    is between two other keywords, or if 'not' comes before another keyword.
+    In those cases 'and', 'or' and 'not' are operators, not project names.
     """
     def __init__(self, args):
+        from .query import Query
         self.args = args
         self.names = set()
         self.tags_wanted = set()
         self.tags_unwanted = set()
+        self.query = None
+
+        if Query.is_query(args):
+            self.query = Query(args)
+            args = ()
 
         for f in args:
             if f.startswith("+"):
@@ -76,27 +137,306 @@ class ProjectFilter:
             else:
                 self.names.add(f)
 
+        # Tag sets as bitmasks, to compare with Project.tag_mask
+        self.mask_wanted = tag_dictionary.mask(self.tags_wanted)
+        self.mask_unwanted = tag_dictionary.mask(self.tags_unwanted)
+
     def matches(self, project):
         """
         Check if this project matches the filter.
         """
+        if self.query is not None: return self.query.match(project)
         if self.names and project.name not in self.names: return False
-        if self.tags_wanted and self.tags_wanted.isdisjoint(project.tags): return False
-        if self.tags_unwanted and not self.tags_unwanted.isdisjoint(project.tags): return False
+        if not self.mask_wanted and not self.mask_unwanted: return True
+        mask = project.tag_mask
+        if self.mask_wanted and not mask & self.mask_wanted: return False
+        if mask & self.mask_unwanted: return False
         return True
 
+    def matches_info(self, info):
+        """
+        Check if a project matches the filter, using only the information
+        stored about it in the state: a dict with any of 'name', 'path',
+        'group', 'tags' and 'archived'.
+
+        Returns True or False, or None if the information is not enough to
+        decide.
+        """
+        if self.query is not None: return self.query.match_info(info)
+        res = True
+        if self.names:
+            name = info.get("name")
+            if name is None:
+                res = None
+            elif name not in self.names:
+                return False
+        if self.mask_wanted or self.mask_unwanted:
+            tags = info.get("tags")
+            if tags is None: return None
+            mask = tag_dictionary.lookup_mask(tags)
+            if self.mask_wanted and not mask & self.mask_wanted: return False
+            if mask & self.mask_unwanted: return False
+        return res
+
+
+class ProjectCatalog:
+    """
+    Collection of loaded projects, kept sorted by name, with indices by tag,
+    group, path and archived state.
+
+    Indices are updated as projects are added, and list project names in
+    sorted order, so that looking up the k projects with a given tag costs
+    O(k).
+    """
+    def __init__(self, projects=()):
+        # Map project names to projects
+        self._by_name = {}
+        # Sorted list of project names
+        self._names = []
+        # Map tags, groups, paths and archived state to sorted lists of
+        # project names
+        self._by_tag = {}
+        self._by_group = {}
+        self._by_path = {}
+        self._by_archived = {}
+        # Map project names to the keys they were indexed with, to remove
+        # them from the indices: tag mask, group, path, archived
+        self._keys = {}
+        for p in projects:
+            self.add(p)
+
+    def _index(self, index, key, name):
+        bisect.insort(index.setdefault(key, []), name)
+
+    def _unindex(self, index, key, name):
+        names = index[key]
+        del names[bisect.bisect_left(names, name)]
+        if not names: del index[key]
+
+    def add(self, proj):
+        """
+        Add a project, replacing an existing project with the same name
+        """
+        name = proj.name
+        if name in self._by_name: self.remove(name)
+        tags = proj.tag_mask
+        group = proj.group
+        path = proj.path
+        archived = bool(proj.archived)
+        self._by_name[name] = proj
+        bisect.insort(self._names, name)
+        for tag in proj.tagset:
+            self._index(self._by_tag, tag, name)
+        self._index(self._by_group, group, name)
+        self._index(self._by_path, path, name)
+        self._index(self._by_archived, archived, name)
+        self._keys[name] = (tags, group, path, archived)
+
+    def remove(self, name):
+        """
+        Remove a project by name
+        """
+        proj = self._by_name.pop(name)
+        tags, group, path, archived = self._keys.pop(name)
+        del self._names[bisect.bisect_left(self._names, name)]
+        for tag in tag_dictionary.tags(tags):
+            self._unindex(self._by_tag, tag, name)
+        self._unindex(self._by_group, group, name)
+        self._unindex(self._by_path, path, name)
+        self._unindex(self._by_archived, archived, name)
+        return proj
+
+    def __len__(self):
+        return len(self._names)
+
+    def __iter__(self):
+        """
+        Iterate projects sorted by name
+        """
+        by_name = self._by_name
+        return (by_name[n] for n in self._names)
+
+    def __contains__(self, name):
+        return name in self._by_name
+
+    def get(self, name, default=None):
+        """
+        Return a project by name
+        """
+        return self._by_name.get(name, default)
+
+    def keys(self):
+        """
+        Return the sorted list of project names
+        """
+        return list(self._names)
+
+    def values(self):
+        """
+        Return the list of projects, sorted by name
+        """
+        return list(self)
+
+    def items(self):
+        """
+        Return the list of (name, project) pairs, sorted by name
+        """
+        by_name = self._by_name
+        return [(n, by_name[n]) for n in self._names]
+
+    def _lookup(self, index, key):
+        by_name = self._by_name
+        return [by_name[n] for n in index.get(key, ())]
+
+    def with_tag(self, tag):
+        """
+        Return the projects with the given tag, sorted by name
+        """
+        return self._lookup(self._by_tag, tag)
+
+    def with_tags(self, tags):
+        """
+        Return the projects that have all the given tags, sorted by name
+        """
+        tags = list(tags)
+        if not tags: return self.values()
+        # Start from the least common tag, and check the others with the tag
+        # masks
+        lists = sorted((self._by_tag.get(t, ()) for t in tags), key=len)
+        mask = tag_dictionary.mask(tags)
+        by_name = self._by_name
+        keys = self._keys
+        return [by_name[name] for name in lists[0] if keys[name][0] & mask == mask]
+
+    def in_group(self, group):
+        """
+        Return the projects in the given group, sorted by name
+        """
+        return self._lookup(self._by_group, group)
+
+    def with_path(self, path):
+        """
+        Return the projects with the given path, sorted by name
+        """
+        return self._lookup(self._by_path, path)
+
+    def archived(self, archived=True):
+        """
+        Return the archived projects, or the non archived ones if archived
+        is False, sorted by name
+        """
+        return self._lookup(self._by_archived, bool(archived))
+
+    def tags(self):
+        """
+        Return the sorted list of all the tags of the projects
+        """
+        return sorted(self._by_tag)
+
+    def groups(self):
+        """
+        Return the sorted list of all the project groups
+        """
+        return sorted(self._by_group)
+
+
+class AutoTagger:
+    """
+    Guess project tags from their pathnames, using a list of (tag, regexp)
+    rules: a project gets a tag if its regexp matches somewhere in the
+    pathname.
+
+    Rules are compiled once into a single regular expression, with an
+    optional lookahead and a named group for each rule, so all rules are
+    checked in one match. Results are cached by pathname.
+    """
+    re_plain = re.compile(r"^[^.^$*+?{}\[\]\\|()]*$")
+
+    def __init__(self, rules):
+        # (tag, substring) for rules that do not use regexp syntax
+        self.substrings = []
+        # (tag, compiled regexp) for rules that cannot go in the combined
+        # regexp
+        self.regexps = []
+        # Map group names in the combined regexp to tags
+        self.group_tags = {}
+        combined = []
+        for tag, regexp in rules:
+            if self.re_plain.match(regexp):
+                self.substrings.append((tag, regexp))
+                continue
+            compiled = re.compile(regexp)
+            # Rules with groups could be broken by renumbering or name
+            # clashes in the combined regexp
+            if compiled.groups or "(?" in regexp:
+                self.regexps.append((tag, compiled))
+                continue
+            name = "t{}".format(len(self.group_tags))
+            self.group_tags[name] = tag
+            combined.append("(?=.*?(?P<{}>{}))?".format(name, regexp))
+        if combined:
+            self.combined = re.compile("(?s)" + "".join(combined))
+        else:
+            self.combined = None
+        # Cache pathname -> frozenset of tags
+        self._cache = {}
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Create an AutoTagger from the [autotag] section of the configuration
+        """
+        if config is None: return cls(())
+        if "autotag" not in config: return cls(())
+        autotags = config["autotag"]
+        if autotags is None: return cls(())
+        return cls(autotags.items())
+
+    def tags(self, abspath):
+        """
+        Return the frozenset of tags for the given pathname
+        """
+        res = self._cache.get(abspath)
+        if res is not None: return res
+
+        tags = set()
+        for tag, substring in self.substrings:
+            if substring in abspath:
+                tags.add(tag)
+        for tag, regexp in self.regexps:
+            if regexp.search(abspath):
+                tags.add(tag)
+        if self.combined is not None:
+            mo = self.combined.match(abspath)
+            for name, val in mo.groupdict().items():
+                if val is not None:
+                    tags.add(self.group_tags[name])
+
+        res = self._cache[abspath] = frozenset(tags)
+        return res
+
 
 class Egt:
     def __init__(self, config=None, filter=[], show_archived=False, statedir=None):
         self.config = config
+        self.statedir = statedir
         self.state = State()
         self.state.load(statedir)
         self.show_archived = show_archived
         self.filter = ProjectFilter(filter)
-        # Dict mapping project names to Project objects.
+        # Tagger for default tags, built lazily from config
+        self._autotagger = None
+        # Workday calendar, built lazily from config
+        self._calendar = None
+        # ProjectCatalog with the loaded projects.
         # It is built lazily when needed, and is None when not yet built.
         self._projects = None
 
+        git_backend = config.get("config", "git-backend", fallback=None) if config is not None else None
+        if git_backend:
+            from .git import repo_cache
+            repo_cache.set_backend(git_backend)
+
     def load_project(self, fname, project_fd=None):
         """
         Return a Project object given its file name.
@@ -108,46 +448,88 @@ class Egt:
         if not Project.has_project(fname):
             log.warning("project %s has disappeared: please rerun scan", fname)
             return None
-        proj = Project.from_file(fname, fd=project_fd)
+        proj = Project.from_file(fname, fd=project_fd, statedir=self.statedir)
         if not self.show_archived and proj.archived: return None
         proj.default_tags.update(self._default_tags(fname))
         if not self.filter.matches(proj): return None
         return proj
 
-    def _load_projects(self):
-        projs = {}
-        for name, info in self.state.projects.items():
+    def _may_match(self, name, info):
+        """
+        Check if the project described by a state entry can be selected,
+        before loading it
+        """
+        # The information is valid only if the file did not change since
+        # the last scan
+        mtime = info.get("mtime")
+        if mtime is None: return True
+        try:
+            if os.stat(info["fname"]).st_mtime != mtime: return True
+        except FileNotFoundError:
+            return True
+        if not self.show_archived and info.get("archived"): return False
+        # The name of archived projects can depend on the current date
+        info = dict(info, name=None if info.get("archived") else name)
+        if "tags" in info:
+            info["tags"] = frozenset(info["tags"]) | self._default_tags(info["fname"])
+        return self.filter.matches_info(info) is not False
+
+    def iter_projects(self, order=None, bounded=False):
+        """
+        Generate the selected projects as they are loaded.
+
+        order is None to generate projects in the order they are listed in
+        the state, or "name" to sort them by name.
+
+        If bounded is True, projects are not kept after they are generated,
+        so that going through all of them needs memory for only one project
+        at a time. Otherwise they are kept, and once the iteration is
+        complete they are available in Egt.projects without loading them
+        again.
+        """
+        if order not in (None, "name"):
+            raise ValueError("unsupported project order {}".format(order))
+
+        # Projects have already been loaded: use them
+        if self._projects is not None:
+            yield from self._projects
+            return
+
+        items = self.state.projects.items()
+        if order == "name": items = sorted(items)
+        catalog = None if bounded else ProjectCatalog()
+        for name, info in items:
+            # Skip projects that the state says cannot match
+            if not self._may_match(name, info): continue
             proj = self.load_project(info["fname"])
             if proj is None: continue
-            projs[proj.name] = proj
-        self._projects = projs
+            if catalog is not None: catalog.add(proj)
+            yield proj
+        if catalog is not None: self._projects = catalog
+
+    def _load_projects(self):
+        for proj in self.iter_projects():
+            pass
 
     def _default_tags(self, abspath):
         """
         Guess tags from the project file pathname
         """
-        if self.config is None: return set()
-        if "autotag" not in self.config: return set()
-        autotags = self.config["autotag"]
-        if autotags is None: return set()
-
-        tags = set()
-        for tag, regexp in autotags.items():
-            if re.search(regexp, abspath):
-                tags.add(tag)
-        return tags
+        if self._autotagger is None:
+            self._autotagger = AutoTagger.from_config(self.config)
+        return self._autotagger.tags(abspath)
 
     @property
     def projects(self):
+        """
+        ProjectCatalog with all the projects, iterated in name order
+        """
         if self._projects is None: self._load_projects()
-        return sorted(self._projects.values(), key=lambda p: p.name)
+        return self._projects
 
     @property
     def all_tags(self):
-        res = set()
-        for p in self.projects:
-            res.update(p.tags)
-        return sorted(res)
+        return self.projects.tags()
 
     def project(self, name, project_fd=None):
         """
@@ -162,20 +544,30 @@ class Egt:
         if info is None: return None
         return self.load_project(info["fname"], project_fd=project_fd)
 
+    @property
+    def calendar(self):
+        """
+        WorkdayCalendar configured in the [holidays] section of the
+        configuration
+        """
+        if self._calendar is None:
+            from .workdays import WorkdayCalendar
+            self._calendar = WorkdayCalendar.from_config(self.config)
+        return self._calendar
+
     def weekrpt(self, tags=None, end=None, days=7, projs=None):
-        rep = WeeklyReport()
-        if projs:
+        rep = WeeklyReport(calendar=self.calendar)
+        if projs is not None:
             for p in projs:
                 rep.add(p)
         else:
-            for p in self.projects:
-                if not tags or p.tags.issuperset(tags):
-                    rep.add(p)
+            for p in self.projects.with_tags(tags) if tags else self.projects:
+                rep.add(p)
         return rep.report(end, days)
 
     def backup(self, out=sys.stdout):
         import tarfile
         tarout = tarfile.open(None, "w|", fileobj=out)
-        for p in self.projects:
+        for p in self.iter_projects(order="name", bounded=True):
             p.backup(tarout)
         tarout.close()
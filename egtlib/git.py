@@ -1,38 +1,256 @@
 # coding: utf8
 
-import git
+import abc
+import atexit
 import os
 import re
+import subprocess
+import threading
 import logging
+from collections import OrderedDict
+from . import timings
+
+try:
+    import git
+except ImportError:
+    git = None
 
 log = logging.getLogger(__name__)
 
 re_gitsha = re.compile("^\s+- \[git:(?P<sha>[a-f0-9]{4,})\]\s+")
 
 
+class Commit:
+    """
+    The information about a commit that egt needs
+    """
+    __slots__ = ("hexsha", "author_email", "authored_date", "summary")
+
+    def __init__(self, hexsha, author_email, authored_date, summary):
+        self.hexsha = hexsha
+        self.author_email = author_email
+        self.authored_date = authored_date
+        self.summary = summary
+
+
+class Repo(abc.ABC):
+    """
+    An open repository, with the configuration needed to collect
+    achievements from it
+    """
+    def __init__(self, path):
+        self.path = path
+        # Email of the user, as configured in git
+        self.my_email = None
+        # Length of abbreviated commit hashes
+        self.abbrev_size = 7
+        # Repositories cannot be used by several threads at the same time
+        self.lock = threading.Lock()
+
+    @abc.abstractmethod
+    def iter_commits(self):
+        """
+        Generate Commit objects for the history of HEAD, newest first
+        """
+
+    def close(self):
+        pass
+
+
+class GitPythonRepo(Repo):
+    """
+    Repository accessed through GitPython
+    """
+    def __init__(self, path):
+        super().__init__(path)
+        self.repo = git.Repo(path)
+        gitconfig = self.repo.config_reader()
+        self.my_email = gitconfig.get_value("user", "email", "NOPE")
+        self.abbrev_size = int(gitconfig.get_value("core", "abbrev", "7"))
+
+    def iter_commits(self):
+        for c in self.repo.iter_commits():
+            yield Commit(c.hexsha, c.author.email, c.authored_date, c.summary)
+
+    def close(self):
+        # Terminate the persistent git cat-file processes used by GitPython
+        self.repo.close()
+
+
+class SubprocessRepo(Repo):
+    """
+    Repository accessed by running git log, which starts faster than
+    GitPython and does not keep processes around
+    """
+    def __init__(self, path):
+        super().__init__(path)
+        self.my_email = self._config("user.email") or "NOPE"
+        abbrev = self._config("core.abbrev")
+        if abbrev and abbrev.isdigit():
+            self.abbrev_size = int(abbrev)
+
+    def _config(self, name):
+        res = subprocess.run(["git", "-C", self.path, "config", "--get", name],
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        if res.returncode != 0: return None
+        return res.stdout.decode("utf-8", errors="replace").strip()
+
+    def iter_commits(self):
+        proc = subprocess.Popen(
+            ["git", "-C", self.path, "log", "-z", "--format=%H%x1f%ae%x1f%at%x1f%B"],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        try:
+            buf = b""
+            while True:
+                chunk = proc.stdout.read(65536)
+                if chunk: buf += chunk
+                records = buf.split(b"\0")
+                buf = records.pop() if chunk else b""
+                for rec in records:
+                    if not rec: continue
+                    hexsha, email, date, message = rec.decode("utf-8", errors="replace").split("\x1f", 3)
+                    yield Commit(hexsha, email, int(date), message.split("\n", 1)[0])
+                if not chunk: break
+        finally:
+            # The caller can stop early: do not wait for the full log
+            if proc.poll() is None:
+                proc.kill()
+            proc.stdout.close()
+            proc.wait()
+
+
+BACKENDS = {
+    "gitpython": GitPythonRepo,
+    "subprocess": SubprocessRepo,
+}
+
+
+class RepoCache:
+    """
+    Per-process cache of open repositories, evicting the least recently used
+    when more than max_size are open
+    """
+    def __init__(self, max_size=16):
+        self.max_size = max_size
+        # Repository class used to open repositories
+        self.backend = GitPythonRepo if git is not None else SubprocessRepo
+        # Open repositories by path, least recently used first
+        self.repos = OrderedDict()
+        self.lock = threading.Lock()
+
+    def set_backend(self, name):
+        """
+        Set the backend used for opening repositories, by name
+        """
+        backend = BACKENDS.get(name)
+        if backend is None:
+            log.warning("unknown git backend %s: using %s", name, self.backend.__name__)
+            return
+        if backend is GitPythonRepo and git is None:
+            log.warning("git backend %s requested, but GitPython is not available", name)
+            return
+        if backend is not self.backend:
+            self.close()
+            self.backend = backend
+
+    def get(self, path):
+        """
+        Return the Repo for the repository at path, opening it only if it is
+        not already open
+        """
+        with self.lock:
+            res = self.repos.get(path)
+            if res is not None:
+                self.repos.move_to_end(path)
+                return res
+            res = self.repos[path] = self.backend(path)
+            while len(self.repos) > self.max_size:
+                old_path, old = self.repos.popitem(last=False)
+                self._close(old)
+            return res
+
+    def _close(self, repo):
+        # Wait for other threads to be done with it
+        with repo.lock:
+            repo.close()
+
+    def close(self):
+        """
+        Close all open repositories
+        """
+        with self.lock:
+            while self.repos:
+                path, repo = self.repos.popitem()
+                self._close(repo)
+
+
+repo_cache = RepoCache()
+atexit.register(repo_cache.close)
+
+
 def collect_achievements(proj, entry):
-    if not os.path.exists(os.path.join(proj.path, ".git")): return
+    with timings.phase("git"):
+        _collect_achievements(proj, entry)
 
+
+def _collect_achievements(proj, entry):
     # Build a list of short shasums that we already added
     seen = []
     for line in entry.body:
         mo = re_gitsha.match(line)
         if mo: seen.append(mo.group("sha"))
 
-    repo = git.Repo(proj.path)
-    gitconfig = repo.config_reader()
-    my_email = gitconfig.get_value("user", "email", "NOPE")
-    abbrev_size = int(gitconfig.get_value("core", "abbrev", "7"))
     cutoff = entry.begin.timestamp()
+
+    # If the user created an activity index, use it to look at all the
+    # repositories of the project. The index has the commits of all
+    # branches: only use those reachable from HEAD, as the walk below does
+    from .activity import ActivityIndex
+    statedir = proj.statedir
+    if statedir is None:
+        from .state import State
+        statedir = State.get_state_dir()
+    index = ActivityIndex.get_existing(statedir)
+    if index is not None:
+        gitdirs = list(proj.gitdirs())
+        if not gitdirs: return
+        for gitdir in gitdirs:
+            index.update_repo(gitdir, proj.name)
+        abbrev_sizes = {}
+        heads = {}
+        # Repositories in which we reached commits already in the log
+        done = set()
+        new_lines = []
+        for project, gitdir, sha, author_time, summary in index.commits(since=cutoff, gitdirs=gitdirs):
+            if gitdir in done: continue
+            head = heads.get(gitdir)
+            if head is None:
+                head = heads[gitdir] = index.reachable(gitdir, since=cutoff)
+            if sha not in head: continue
+            # Stop at commits already in the log, as below
+            if any(sha.startswith(x) for x in seen):
+                done.add(gitdir)
+                continue
+            abbrev_size = abbrev_sizes.get(gitdir)
+            if abbrev_size is None:
+                abbrev_size = abbrev_sizes[gitdir] = index.abbrev_size(gitdir)
+            new_lines.append(" - [git:{sha}] {desc}".format(sha=sha[:abbrev_size], desc=summary))
+        entry.body.extend(new_lines[::-1])
+        return
+
+    if not os.path.exists(os.path.join(proj.path, ".git")): return
+
+    repo = repo_cache.get(proj.path)
     new_lines = []
-    for c in repo.iter_commits():
-        if c.author.email != my_email: continue
-        if c.authored_date < cutoff: break
-        # Break at the point where things are already known in the log, to
-        # avoid readding old entries that have been manually deleted
-        if any(c.hexsha.startswith(x) for x in seen): break
-
-        new_lines.append(" - [git:{sha}] {desc}".format(
-            sha=c.hexsha[:abbrev_size],
-            desc=c.summary))
+    with repo.lock:
+        for c in repo.iter_commits():
+            if c.author_email != repo.my_email: continue
+            if c.authored_date < cutoff: break
+            # Break at the point where things are already known in the log, to
+            # avoid readding old entries that have been manually deleted
+            if any(c.hexsha.startswith(x) for x in seen): break
+
+            new_lines.append(" - [git:{sha}] {desc}".format(
+                sha=c.hexsha[:repo.abbrev_size],
+                desc=c.summary))
     entry.body.extend(new_lines[::-1])
@@ -1,7 +1,9 @@
 # coding: utf8
 from __future__ import absolute_import
 from .utils import format_duration
+from . import utils
 from .lang import get_parserinfo
+from . import timings
 import dateutil.parser
 import datetime
 import sys
@@ -17,6 +19,8 @@ def parsetime(s):
 
 
 class EntryBase:
+    __slots__ = ("body",)
+
     re_timebase = re.compile("^(?:(?P<year>\d{4})|-+\s*(?P<date>.+?))\s*$")
     re_entry = re.compile(r"^(?P<date>(?:\S| \d)[^:]*):\s*(?:(?P<start>\d+:\d+)-\s*(?P<end>\d+:\d+)?|$)")
     re_new_time = re.compile(r"^(?P<start>\d{1,2}:\d{2})-?\s*\+?\s*$")
@@ -55,12 +59,15 @@ class EntryBase:
             line = lines.peek()
             if not line: break
             if not line[0].isspace(): break
-            if Entry.is_start_line(line): break
+            # Only lines starting with a space and a digit can be entry heads
+            if line[1:2].isdigit() and line[0] == " " and Entry.is_start_line(line): break
             body.append(lines.next())
         return body
 
 
 class Timebase(EntryBase):
+    __slots__ = ("line", "dt")
+
     def __init__(self, line, dt):
         super().__init__()
         self.line = line
@@ -89,6 +96,8 @@ class Timebase(EntryBase):
 
 
 class Entry(EntryBase):
+    __slots__ = ("begin", "until", "head", "fullday")
+
     re_tail = re.compile(r"(?P<head>:\s*\d+:\d+-\s*\d+:\d+).*")
 
     def __init__(self, begin, until, head, body, fullday):
@@ -108,7 +117,7 @@ class Entry(EntryBase):
         Check if this log entry is still been edited
         """
         if self.fullday:
-            return self.begin.date() == datetime.date.today()
+            return self.begin.date() == utils.today()
         else:
             return self.until is None
 
@@ -124,7 +133,7 @@ class Entry(EntryBase):
         if self.fullday: return 24 * 60
 
         if not self.until:
-            until = datetime.datetime.now()
+            until = utils.now()
         else:
             until = self.until
 
@@ -189,10 +198,14 @@ class Entry(EntryBase):
         """
         Check if the next line looks like the start of a log block
         """
+        # Fast reject for lines that cannot match re_entry
+        if ":" not in line: return None
         return cls.re_entry.match(line)
 
 
 class Command(EntryBase):
+    __slots__ = ("head", "start")
+
     def __init__(self, head, body, start=None):
         super().__init__(body)
         self.head = head
@@ -200,14 +213,14 @@ class Command(EntryBase):
 
     def sync(self, project):
         if self.start is None:
-            begin = datetime.datetime.combine(datetime.date.today(), datetime.time(0))
+            begin = datetime.datetime.combine(utils.today(), datetime.time(0))
             until = begin + datetime.timedelta(days=1)
             head = begin.strftime("%d %B:")
             res = Entry(begin, until, head, self.body, True)
             if self.head == "++":
                 self.body.append(" +")
         else:
-            begin = datetime.datetime.combine(datetime.date.today(), self.start)
+            begin = datetime.datetime.combine(utils.today(), self.start)
             head = begin.strftime("%d %B: %H:%M-")
             res = Entry(begin, None, head, self.body, False)
             if self.head.endswith("+"):
@@ -250,14 +263,21 @@ class LogParser:
     def __init__(self, lang=None):
         self.lang = lang
         # Defaults for missing parsedate values
-        self.default = datetime.datetime(datetime.date.today().year, 1, 1)
+        self.default = datetime.datetime(utils.today().year, 1, 1)
         # Last datetime parsed
         self.last_dt = None
         self.parserinfo = get_parserinfo(lang)
+        # Number of elements generated so far
+        self.count = 0
+        # If not None, parse() appends here the parser state at the start of
+        # each element and at the end of the log, as (offset, lineno,
+        # default, last_dt, count) tuples
+        self.checkpoints = None
 
     def parse_date(self, s, set_default=True):
         try:
-            d = dateutil.parser.parse(s, default=self.default, parserinfo=self.parserinfo)
+            with timings.phase("log.parse_date"):
+                d = dateutil.parser.parse(s, default=self.default, parserinfo=self.parserinfo)
             if set_default:
                 self.default = d.replace(hour=0, minute=0, second=0, microsecond=0)
             self.last_dt = d
@@ -265,22 +285,78 @@ class LogParser:
         except (TypeError, ValueError):
             return None
 
-    def parse(self, lines):
-        components = [Timebase, Entry, Command]
+    def checkpoint(self, lines):
+        """
+        Record the parser state at the current position in lines
+        """
+        if self.checkpoints is None: return
+        self.checkpoints.append((lines.offset, lines.lineno, self.default, self.last_dt, self.count))
+
+    # Log components that can start with a given character, in order of
+    # precedence. Timebase lines start with a year or with dashes, Command
+    # lines with a time or with '+', and Entry lines with anything but
+    # whitespace, or with a space and a digit.
+    _candidates = {}
+
+    @classmethod
+    def candidates(cls, line):
+        """
+        Return the components that may start at this line, in order of
+        precedence
+        """
+        c = line[0]
+        res = cls._candidates.get(c)
+        if res is None:
+            if c.isdigit():
+                res = (Timebase, Entry, Command)
+            elif c == "-":
+                res = (Timebase, Entry)
+            elif c == "+":
+                res = (Entry, Command)
+            elif c == " ":
+                res = (Entry,)
+            elif c.isspace():
+                res = ()
+            else:
+                res = (Entry,)
+            cls._candidates[c] = res
+        return res
 
+    @classmethod
+    def classify(cls, line):
+        """
+        Find which log component starts at this line.
+
+        Returns the component class and the regexp match object, or
+        (None, None) if the line does not start a log component.
+        """
+        for c in cls.candidates(line):
+            mo = c.is_start_line(line)
+            if mo: return c, mo
+        return None, None
+
+    def parse(self, lines):
+        dispatch = self._candidates
         while True:
             line = lines.peek()
             if not line: break
 
-            for c in components:
+            self.checkpoint(lines)
+            # Inlined version of classify()
+            candidates = dispatch.get(line[0])
+            if candidates is None: candidates = self.candidates(line)
+            for c in candidates:
                 mo = c.is_start_line(line)
-                if mo:
-                    el = c.parse(self, lines, **mo.groupdict())
-                    if el is not None: yield el
-                    break
+                if mo: break
             else:
                 log.warn("%s:%d: log parse stops at unrecognised line %r", lines.fname, lines.lineno, line)
                 break
+            el = c.parse(self, lines, **mo.groupdict())
+            if el is not None:
+                self.count += 1
+                yield el
+
+        self.checkpoint(lines)
 
 
 class Log:
@@ -289,6 +365,11 @@ class Log:
         # Line number in the project file where the log starts
         self._lineno = None
         self._entries = []
+        # Incremented at each change, to invalidate values computed from the
+        # log
+        self.version = 0
+        # (version, count) for the last computed entry count
+        self._entry_count = None
 
     @property
     def entries(self):
@@ -299,6 +380,15 @@ class Log:
             if not isinstance(e, Entry): continue
             yield e
 
+    @property
+    def entry_count(self):
+        """
+        Return the number of Entry entries in this log
+        """
+        if self._entry_count is None or self._entry_count[0] != self.version:
+            self._entry_count = (self.version, sum(1 for e in self._entries if isinstance(e, Entry)))
+        return self._entry_count[1]
+
     @property
     def first_entry(self):
         """
@@ -327,12 +417,27 @@ class Log:
         for e in self._entries:
             new_entries.append(e.sync(self.project))
         self._entries = new_entries
+        self.version += 1
 
-    def parse(self, lines, **kw):
+    def parse(self, lines, cache=None, **kw):
+        """
+        Parse the log from a Lines object.
+
+        If cache is a LogCache, reuse the entries parsed in a previous run
+        for the part of the log that has not changed since, and update the
+        cache afterwards.
+        """
         self._lineno = lines.lineno
         lp = LogParser(**kw)
+        if cache is not None:
+            start_offset = lines.offset
+            self._entries, lp.checkpoints = cache.resume(lp, lines)
+            lp.count = len(self._entries)
         for el in lp.parse(lines):
             self._entries.append(el)
+        if cache is not None:
+            cache.update(lp, lines, start_offset, self._lineno, self._entries)
+        self.version += 1
 
     def print(self, file=sys.stdout):
         """
@@ -342,7 +447,7 @@ class Log:
         nothing to print.
         """
         if not self._entries:
-            print(datetime.date.today().year, file=file)
+            print(utils.today().year, file=file)
         else:
             for entry in self._entries:
                 entry.print(file)
@@ -0,0 +1,123 @@
+# coding: utf-8
+import hashlib
+import os
+import pickle
+import logging
+from .utils import atomic_writer
+
+log = logging.getLogger(__name__)
+
+
+class LogCache:
+    """
+    Persistent cache of the parsed log of a project file.
+
+    Together with the parsed entries, it stores a checkpoint at the start of
+    each log element: its position, the LogParser state there, and a hash of
+    the log text before it. When the file is parsed again, parsing resumes
+    from the last checkpoint whose preceding text is unchanged, so appending
+    to the log only costs parsing the new part.
+    """
+    # Change this when changing the format of the cached data
+    VERSION = 1
+
+    def __init__(self, pathname):
+        # Pathname of the cache file
+        self.pathname = pathname
+        # Cached data, as loaded by resume()
+        self._cached = None
+
+    @classmethod
+    def for_project(cls, project):
+        """
+        Return the LogCache for the given project
+        """
+        statedir = project.statedir
+        if statedir is None:
+            from .state import State
+            statedir = State.get_state_dir()
+        key = hashlib.sha1(os.path.abspath(project.abspath).encode("utf-8")).hexdigest()
+        return cls(os.path.join(statedir, "cache", "log-{}.pickle".format(key)))
+
+    def _load(self):
+        try:
+            with open(self.pathname, "rb") as fd:
+                data = pickle.load(fd)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.debug("%s: ignoring unreadable log cache: %s", self.pathname, e)
+            return None
+        if data.get("version") != self.VERSION: return None
+        return data
+
+    def resume(self, logparser, lines):
+        """
+        Look for the last checkpoint that can be reused for the log starting
+        at the current position of lines.
+
+        If one is found, move lines and logparser to it. Returns the list of
+        elements parsed before the checkpoint, and the list of checkpoints
+        before it, in the format used by LogParser.checkpoints.
+        """
+        data = self._cached = self._load()
+        if data is None: return [], []
+        if data["lang"] != logparser.lang or data["default"] != logparser.default: return [], []
+
+        # Count how many checkpoints are preceded by unchanged text
+        start_offset = lines.offset
+        hasher = hashlib.sha1()
+        pos = start_offset
+        matched = 0
+        for offset, lineno, default, last_dt, count, digest in data["checkpoints"]:
+            end = start_offset + offset
+            if end > lines.size: break
+            hasher.update(lines.buf[pos:end])
+            pos = end
+            if hasher.digest() != digest: break
+            matched += 1
+
+        # If the text before checkpoint N is unchanged, the elements before it
+        # are unchanged too, except for the last one, which may now continue
+        # past it: resume from the checkpoint before N
+        if matched < 2: return [], []
+        start_lineno = lines.lineno
+        checkpoints = []
+        for offset, lineno, default, last_dt, count, digest in data["checkpoints"][:matched - 1]:
+            checkpoints.append((start_offset + offset, start_lineno + lineno, default, last_dt, count))
+        offset, lineno, default, last_dt, count = checkpoints.pop()
+        lines.seek(offset, lineno)
+        logparser.default = default
+        logparser.last_dt = last_dt
+        log.debug("%s:%d: reusing %d cached log elements", lines.fname, lineno, count)
+        return data["entries"][:count], checkpoints
+
+    def update(self, logparser, lines, start_offset, start_lineno, entries):
+        """
+        Store the results of a log parse, if they differ from what is in the
+        cache
+        """
+        hasher = hashlib.sha1()
+        pos = start_offset
+        checkpoints = []
+        for offset, lineno, default, last_dt, count in logparser.checkpoints:
+            hasher.update(lines.buf[pos:offset])
+            pos = offset
+            checkpoints.append((offset - start_offset, lineno - start_lineno, default, last_dt, count, hasher.digest()))
+
+        old = self._cached
+        if old is not None and old["checkpoints"] == checkpoints: return
+
+        data = {
+            "version": self.VERSION,
+            "lang": logparser.lang,
+            "default": logparser.checkpoints[0][2] if logparser.checkpoints else None,
+            "checkpoints": checkpoints,
+            "entries": entries,
+        }
+        try:
+            os.makedirs(os.path.dirname(self.pathname), exist_ok=True)
+            with atomic_writer(self.pathname, "wb", sync=False) as fd:
+                pickle.dump(data, fd, pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            log.warning("%s: cannot write log cache: %s", self.pathname, e)
@@ -1,9 +1,61 @@
 # coding: utf8
 
 from collections import OrderedDict
+import itertools
 import re
 import sys
 
+# Lines that can be part of a header block, as in the email package: a field
+# name followed by a colon, a continuation line, or a unix From line
+re_header_line = re.compile(r"[\041-\071\073-\176]*:|[\t ]|From ")
+# Line separators recognised by the email package
+re_line_sep = re.compile(r"(\r\n|\r|\n)")
+
+
+def parse_headers(lines):
+    """
+    Parse 'Field: value' header lines, with the same semantics as
+    email.message_from_string, but without building a Message.
+
+    Lines starting with whitespace continue the value of the previous field.
+    Parsing stops at the first line that is not part of a header.
+
+    Returns a list of (name, value) tuples, in order of appearance. Names
+    are returned unmodified, values are stripped of leading and trailing
+    whitespace.
+    """
+    if any("\r" in line for line in lines):
+        # Split lines also on the other separators known to the email
+        # package, keeping them in the values
+        parts = re_line_sep.split("\n".join(lines))
+        lines = parts[0::2]
+        seps = parts[1::2] + [""]
+    else:
+        seps = itertools.repeat("\n")
+
+    res = []
+    name = None
+    value = None
+    for line, sep in zip(lines, seps):
+        if not line or not re_header_line.match(line): break
+        if line[0] in " \t":
+            # Continuation lines without a field to continue are ignored
+            if name is not None:
+                value += (line, sep)
+            continue
+        if name is not None:
+            res.append((name, "".join(value).strip()))
+            name = None
+        # Unix From lines and lines with an empty field name are ignored
+        if line.startswith("From "): continue
+        pos = line.index(":")
+        if pos == 0: continue
+        name = line[:pos]
+        value = [line[pos + 1:], sep]
+    if name is not None:
+        res.append((name, "".join(value).strip()))
+    return res
+
 
 class Meta:
     """
@@ -26,6 +78,10 @@ class Meta:
         # Set of tags for the project
         self.tags = set()
 
+        # Incremented at each change, to invalidate values computed from the
+        # metadata
+        self.version = 0
+
     def get(self, name, *args):
         """
         Get a metadata element by name, optionally with a default.
@@ -39,6 +95,7 @@ class Meta:
         Set the value of a metadata element
         """
         self._raw[name.lower()] = value
+        self.version += 1
 
     def parse(self, lines):
         """
@@ -55,9 +112,8 @@ class Meta:
             self._lines.append(line)
 
         # Parse fields in the same way as email headers
-        import email
-        for k, v in email.message_from_string("\n".join(self._lines)).items():
-            self._raw[k.lower()] = v.strip()
+        for k, v in parse_headers(self._lines):
+            self._raw[k.lower()] = v
 
         # Extract well known values
 
@@ -66,6 +122,8 @@ class Meta:
         if f is not None:
             self.tags.update(re.split("[ ,\t]+", f))
 
+        self.version += 1
+
     def print(self, file=sys.stdout):
         """
         Write the metadata as a project metadata section to the given output
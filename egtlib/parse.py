@@ -1,47 +1,121 @@
 import re
+import os
+import mmap
 
 
 class Lines:
+    """
+    Cursor over the lines of a project file.
+
+    The file is memory mapped, and each line is located and decoded only when
+    the cursor reaches it: parsing that stops early never reads the rest of
+    the file.
+    """
     def __init__(self, pathname, fd=None):
         # File name being parsed
         self.fname = pathname
         # Current line being parsed
         self.lineno = 0
-        # Read the file, split in trimmed lines
+        # Byte offset of the start of the current line
+        self.offset = 0
+        # Decoded current line, or None if not decoded yet
+        self._line = None
+        # Byte offset of the line after the current one, valid when _line is
+        # not None
+        self._next_offset = None
+        # mmap object, if we are reading a file
+        self._map = None
+
         if fd is None:
-            with open(self.fname, "rt") as fd:
-                self.lines = [x.rstrip() for x in fd]
+            with open(self.fname, "rb") as infd:
+                # mmap refuses to map empty files
+                if os.fstat(infd.fileno()).st_size > 0:
+                    self._map = mmap.mmap(infd.fileno(), 0, access=mmap.ACCESS_READ)
+            self.buf = self._map if self._map is not None else b""
+        else:
+            data = fd.read()
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+            self.buf = data
+        self.size = len(self.buf)
+
+    def close(self):
+        """
+        Release the memory mapping of the file
+        """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self.buf = b""
+        self.size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def _decode_current(self):
+        """
+        Locate the end of the current line and decode it.
+
+        Returns False if we are at the end of the file.
+        """
+        if self.offset >= self.size: return False
+        end = self.buf.find(b"\n", self.offset)
+        if end == -1:
+            end = self.size
+            self._next_offset = end
         else:
-            self.lines = [x.rstrip() for x in fd]
+            self._next_offset = end + 1
+        self._line = self.buf[self.offset:end].decode("utf-8").rstrip()
+        return True
+
+    def seek(self, offset, lineno):
+        """
+        Move the cursor to the line starting at the given byte offset, which
+        is line number lineno
+        """
+        self.offset = offset
+        self.lineno = lineno
+        self._line = None
 
     def peek(self):
         """
         Return the next line to be parsed, without advancing the cursor.
         Return None if we are at the end.
         """
-        if self.lineno < len(self.lines):
-            return self.lines[self.lineno]
-        else:
+        if self._line is None and not self._decode_current():
             return None
+        return self._line
 
     def next(self):
         """
         Return the next line to be parsed, advancing the cursor.
         Return None if we are at the end.
         """
-        if self.lineno < len(self.lines):
-            res = self.lines[self.lineno]
-            self.lineno += 1
-            return res
-        else:
-            return None
+        res = self._line
+        if res is None:
+            if not self._decode_current(): return None
+            res = self._line
+        self.offset = self._next_offset
+        self.lineno += 1
+        self._line = None
+        return res
 
     def discard(self):
         """
         Just advance the cursor to the next line
         """
-        if self.lineno < len(self.lines):
-            self.lineno += 1
+        if self._line is None:
+            # Skip the line without decoding it
+            if self.offset >= self.size: return
+            end = self.buf.find(b"\n", self.offset)
+            self._next_offset = self.size if end == -1 else end + 1
+        self.offset = self._next_offset
+        self.lineno += 1
+        self._line = None
 
     def skip_empty_lines(self):
         while True:
@@ -1,14 +1,19 @@
 import os.path
+import io
+import hashlib
 import subprocess
 import datetime
 import re
 import sys
-import json
 from collections import OrderedDict
-from .utils import format_duration, intervals_intersect
+from .utils import format_duration, intervals_intersect, atomic_writer
+from . import utils
 from .meta import Meta
 from .log import Log
 from .body import Body
+from .statestore import ProjectStateStore
+from .tags import tag_dictionary
+from . import timings
 import logging
 
 log = logging.getLogger(__name__)
@@ -20,8 +25,8 @@ class ProjectState(object):
         if statedir is None:
             from .state import State
             statedir = State.get_state_dir()
-        # TODO: ensure name does not contain '/'
-        self.abspath = os.path.join(statedir, "project-{}.json".format(project.name))
+        self.store = ProjectStateStore.get(statedir)
+        self.name = project.name
         self._state = None
 
     def get(self, name):
@@ -34,16 +39,10 @@ class ProjectState(object):
         self._save()
 
     def _load(self):
-        if not os.path.exists(self.abspath):
-            self._state = {}
-            return
-        with open(self.abspath, "rt") as fd:
-            self._state = json.load(fd)
+        self._state = self.store.load(self.name)
 
     def _save(self):
-        from .utils import atomic_writer
-        with atomic_writer(self.abspath, "wt") as fd:
-            json.dump(self._state, fd, indent=1)
+        self.store.save(self.name, self._state)
 
 
 class Project(object):
@@ -59,10 +58,15 @@ class Project(object):
             self.default_name = os.path.splitext(basename)[0]
         self.default_tags = set()
         self.archived = False
+        # Name used to group archived projects with the same name
+        self.group = self.default_name
 
         # Project state, loaded lazily, None if not loaded
         self._state = None
 
+        # Memoized derived values, as name -> (key, value)
+        self._memo = {}
+
         self.meta = Meta()
         self.log = Log(self)
         self.body = Body(self)
@@ -73,10 +77,30 @@ class Project(object):
             self._state = ProjectState(self)
         return self._state
 
+    def _memoized(self, name, compute, uses_now=True):
+        """
+        Return the value computed by compute(), reusing the one computed in
+        a previous call if the metadata and the log did not change since.
+
+        If the value depends on the current time, it is reused only while
+        utils.now() is frozen, and for the same frozen time.
+        """
+        frozen = utils.get_frozen_now() if uses_now else None
+        if uses_now and frozen is None: return compute()
+        key = (self.meta.version, self.log.version, self.archived, self.default_name, frozen)
+        cached = self._memo.get(name)
+        if cached is not None and cached[0] == key: return cached[1]
+        res = compute()
+        self._memo[name] = (key, res)
+        return res
+
     @property
     def name(self):
+        if not self.archived: return self.meta.get("name", self.default_name)
+        return self._memoized("name", self._compute_name)
+
+    def _compute_name(self):
         name = self.meta.get("name", self.default_name)
-        if not self.archived: return name
 
         since, until = self.formal_period
         if until:
@@ -92,12 +116,41 @@ class Project(object):
 
     @property
     def tags(self):
-        return self.default_tags | self.meta.tags
+        """
+        Set with the project tags, which can be changed by the caller
+        """
+        return set(self.tagset)
+
+    @property
+    def tagset(self):
+        """
+        Frozenset with the project tags, reused until they change
+        """
+        # default_tags is only ever extended, or replaced
+        default_tags = self.default_tags
+        cached = self._memo.get("tagset")
+        if cached is not None and cached[0] == (self.meta.version, id(default_tags), len(default_tags)):
+            return cached[1]
+        res = frozenset(default_tags | self.meta.tags)
+        self._memo["tagset"] = ((self.meta.version, id(default_tags), len(default_tags)), res)
+        return res
+
+    @property
+    def tag_mask(self):
+        """
+        Bitmask of the project tags in the shared tag dictionary
+        """
+        tags = self.tagset
+        cached = self._memo.get("tag_mask")
+        if cached is not None and cached[0] is tags: return cached[1]
+        res = tag_dictionary.mask(tags)
+        self._memo["tag_mask"] = (tags, res)
+        return res
 
     @classmethod
-    def from_file(self, abspath, fd=None):
+    def from_file(self, abspath, fd=None, statedir=None):
         # Default values, can be overridden by file metadata
-        p = Project(abspath)
+        p = Project(abspath, statedir=statedir)
         # Load the actual data
         p.load(fd=fd)
         return p
@@ -106,14 +159,23 @@ class Project(object):
     def mock(self, abspath, name=None, path=None, tags=None):
         p = Project(abspath)
         if path is not None: p.default_path = path
-        if name is not None: p.default_name = name
+        if name is not None: p.default_name = p.group = name
         if tags is not None: p.default_tags = tags
         return p
 
-    def load(self, fd=None):
+    def load(self, fd=None, cache=True):
+        """
+        Load the project from its file, or from the given file descriptor.
+
+        If cache is True, use a LogCache to avoid parsing again the parts of
+        the log that did not change since the last time.
+        """
         from .parse import Lines
-        lines = Lines(self.abspath, fd=fd)
+        with timings.phase("project.load"):
+            with Lines(self.abspath, fd=fd) as lines:
+                self._load(lines, cache)
 
+    def _load(self, lines, cache):
         # Parse optionalmetadata
 
         # If it starts with a log, there is no metadata: stop
@@ -122,7 +184,8 @@ class Project(object):
         if first is None: return
         if not Log.is_start_line(first) and Meta.is_start_line(first):
             log.debug("%s:%d: parsing metadata", lines.fname, lines.lineno)
-            self.meta.parse(lines)
+            with timings.phase("project.load.meta"):
+                self.meta.parse(lines)
 
         lines.skip_empty_lines()
 
@@ -130,12 +193,19 @@ class Project(object):
         if lines.peek() is None: return
         if self.log.is_start_line(lines.peek()):
             log.debug("%s:%d: parsing log", lines.fname, lines.lineno)
-            self.log.parse(lines, lang=self.meta.get("lang", None))
+            with timings.phase("project.load.log"):
+                if cache:
+                    from .logcache import LogCache
+                    log_cache = LogCache.for_project(self)
+                else:
+                    log_cache = None
+                self.log.parse(lines, cache=log_cache, lang=self.meta.get("lang", None))
             lines.skip_empty_lines()
 
         # Parse body
         log.debug("%s:%d: parsing body", lines.fname, lines.lineno)
-        self.body.parse(lines)
+        with timings.phase("project.load.body"):
+            self.body.parse(lines)
 
         # Allow to group archived projects with the same name.
         # Compute it separately to skip the archieve name mangling performed by
@@ -151,31 +221,81 @@ class Project(object):
         Serialize the whole project as a project file to the given file
         descriptor.
         """
-        if self.meta.print(out):
-            print(file=out)
+        with timings.phase("render"):
+            if self.meta.print(out):
+                print(file=out)
+
+            if self.log.print(out):
+                print(file=out)
+
+            self.body.print(out)
 
-        if self.log.print(out):
-            print(file=out)
+    def rewrite(self, sync=True):
+        """
+        Write the project back to its file, if its serialized contents differ
+        from what is on disk.
 
-        self.body.print(out)
+        Leaving unchanged files alone preserves their mtime, which keeps
+        caches, backups and editor buffers valid. Returns True if the file
+        was rewritten.
+        """
+        with io.StringIO() as out:
+            self.print(out)
+            data = out.getvalue().encode("utf-8")
+
+        try:
+            st = os.stat(self.abspath)
+        except FileNotFoundError:
+            st = None
+
+        if st is not None and st.st_size == len(data):
+            hasher = hashlib.sha1()
+            with open(self.abspath, "rb") as fd:
+                while True:
+                    buf = fd.read(65536)
+                    if not buf: break
+                    hasher.update(buf)
+            if hasher.digest() == hashlib.sha1(data).digest(): return False
+
+        osmode = st.st_mode & 0o7777 if st is not None else 0o644
+        with atomic_writer(self.abspath, "wb", osmode=osmode, sync=sync) as fd:
+            fd.write(data)
+        return True
 
     @property
     def last_updated(self):
         """
         Datetime when this project was last updated
         """
+        return self._memoized("last_updated", self._compute_last_updated)
+
+    def _compute_last_updated(self):
         last = self.log.last_entry
         if last is None: return None
         if last.until: return last.until
-        return datetime.datetime.now()
+        return utils.now()
 
     @property
     def elapsed(self):
+        return self._memoized("elapsed", self._compute_elapsed)
+
+    def _compute_elapsed(self):
         mins = 0
         for l in self.log.entries:
             mins += l.duration
         return mins
 
+    @property
+    def activity(self):
+        """
+        TimeSeries with the log entries and minutes logged each day
+        """
+        return self._memoized("activity", self._compute_activity)
+
+    def _compute_activity(self):
+        from .timeseries import TimeSeries
+        return TimeSeries.from_entries(self.log.entries)
+
     @property
     def formatted_elapsed(self):
         return format_duration(self.elapsed)
@@ -186,19 +306,20 @@ class Project(object):
 
     @property
     def next_actions(self):
-        for el in self.body:
-            if el.TAG != "next-actions": continue
-            yield el
+        """
+        Generate the tasks in the project body
+        """
+        return iter(self.body.tasks)
 
     @property
     def contexts(self):
         """
-        Return a set with all contexts in this project
+        Return a set with all contexts in this project, that is, the tags
+        used by its tasks
         """
         res = set()
-        for el in self.body:
-            if el.TAG != "next-actions": continue
-            res |= el.contexts
+        for task in self.body.tasks:
+            res |= task.tags
         return res
 
     @property
@@ -209,6 +330,9 @@ class Project(object):
         If Start-date and End-date are provided in the metadata, return those.
         Else infer them from the first or last log entries.
         """
+        return self._memoized("formal_period", self._compute_formal_period)
+
+    def _compute_formal_period(self):
         since = self.meta.get("start-date", None)
         until = self.meta.get("end-date", None)
         if since is None:
@@ -223,7 +347,7 @@ class Project(object):
                 until = e.until
             if until is None:
                 # Deal with entries that are still open
-                until = datetime.date.today()
+                until = utils.today()
             else:
                 until = until.date()
         elif until is not None:
@@ -232,19 +356,15 @@ class Project(object):
 
     def next_events(self, since=None, until=None):
         """
-        Return the next events within the given date range
+        Return the tasks with dates within the given date range
         """
-        for na in self.next_actions:
-            if na.event is None: continue
-            d_since = na.event.get("start", None)
-            if d_since is not None: d_since = d_since.date()
-            d_until = na.event.get("end", None)
-            if d_until is not None:
-                d_until = d_until.date()
-            else:
-                d_until = d_since
+        for task in self.next_actions:
+            dates = task.dates
+            if not dates: continue
+            d_since = dates.get("start", dates.get("scheduled", dates.get("due")))
+            d_until = dates.get("end", dates.get("due", d_since))
             if not intervals_intersect(d_since, d_until, since, until): continue
-            yield na
+            yield task
 
     def spawn_terminal(self, with_editor=False):
         from .system import run_work_session
@@ -255,6 +375,10 @@ class Project(object):
         run_editor(self)
 
     def run_grep(self, args):
+        with timings.phase("git"):
+            self._run_grep(args)
+
+    def _run_grep(self, args):
         from .utils import stream_output
         for gd in self.gitdirs():
             cwd = os.path.abspath(os.path.join(gd, ".."))
@@ -0,0 +1,322 @@
+# coding: utf-8
+import abc
+import datetime
+import fnmatch
+import os
+import re
+from .tags import tag_dictionary
+
+
+class QueryError(Exception):
+    pass
+
+
+class Node(abc.ABC):
+    """
+    Node of a compiled query
+    """
+    # Relative cost of evaluating the node on a loaded project
+    cost = 1
+
+    @abc.abstractmethod
+    def match(self, project):
+        """
+        Check if a loaded project matches
+        """
+
+    def match_info(self, info):
+        """
+        Check if a project matches, given only the information about it
+        stored in the state.
+
+        Returns True or False, or None if the information is not enough to
+        decide.
+        """
+        return None
+
+
+class Pattern(Node):
+    """
+    Base for nodes matching a project attribute against a shell-style
+    pattern
+    """
+    re_glob = re.compile(r"[*?\[]")
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.is_glob = bool(self.re_glob.search(pattern))
+
+    def match_value(self, value):
+        if value is None: return False
+        if self.is_glob: return fnmatch.fnmatchcase(value, self.pattern)
+        return value == self.pattern
+
+    def match_info(self, info):
+        value = info.get(self.field)
+        if value is None: return None
+        return self.match_value(value)
+
+
+class Name(Pattern):
+    field = "name"
+
+    def match(self, project):
+        return self.match_value(project.name)
+
+
+class Group(Pattern):
+    field = "group"
+
+    def match(self, project):
+        return self.match_value(project.group)
+
+
+class Path(Pattern):
+    """
+    Match the project path. A pattern without wildcards also matches the
+    directories below it.
+    """
+    field = "path"
+
+    def __init__(self, pattern):
+        pattern = os.path.expanduser(pattern)
+        if len(pattern) > 1: pattern = pattern.rstrip("/")
+        super().__init__(pattern)
+
+    def match_value(self, value):
+        if value is None: return False
+        if self.is_glob: return fnmatch.fnmatchcase(value, self.pattern)
+        return value == self.pattern or value.startswith(self.pattern + "/")
+
+    def match(self, project):
+        return self.match_value(project.path)
+
+
+class Tag(Node):
+    def __init__(self, tag):
+        self.tag = tag
+        self.bit = tag_dictionary.bit(tag)
+
+    def match(self, project):
+        return bool(project.tag_mask & self.bit)
+
+    def match_info(self, info):
+        tags = info.get("tags")
+        if tags is None: return None
+        return self.tag in tags
+
+
+class Archived(Node):
+    def match(self, project):
+        return bool(project.archived)
+
+    def match_info(self, info):
+        value = info.get("archived")
+        if value is None: return None
+        return bool(value)
+
+
+class ActiveSince(Node):
+    """
+    Match projects with log entries on or after the given date
+    """
+    # Needs the log
+    cost = 10
+
+    def __init__(self, date):
+        self.date = date
+
+    def match(self, project):
+        last = project.last_updated
+        if last is None: return False
+        return last.date() >= self.date
+
+
+class Not(Node):
+    def __init__(self, node):
+        self.node = node
+        self.cost = node.cost
+
+    def match(self, project):
+        return not self.node.match(project)
+
+    def match_info(self, info):
+        res = self.node.match_info(info)
+        if res is None: return None
+        return not res
+
+
+class And(Node):
+    def __init__(self, nodes):
+        # Evaluate cheap checks first
+        self.nodes = sorted(nodes, key=lambda n: n.cost)
+        self.cost = sum(n.cost for n in nodes)
+
+    def match(self, project):
+        for node in self.nodes:
+            if not node.match(project): return False
+        return True
+
+    def match_info(self, info):
+        res = True
+        for node in self.nodes:
+            val = node.match_info(info)
+            if val is False: return False
+            if val is None: res = None
+        return res
+
+
+class Or(Node):
+    def __init__(self, nodes):
+        # Evaluate cheap checks first
+        self.nodes = sorted(nodes, key=lambda n: n.cost)
+        self.cost = sum(n.cost for n in nodes)
+
+    def match(self, project):
+        for node in self.nodes:
+            if node.match(project): return True
+        return False
+
+    def match_info(self, info):
+        res = False
+        for node in self.nodes:
+            val = node.match_info(info)
+            if val is True: return True
+            if val is None: res = None
+        return res
+
+
+class Query:
+    """
+    Project query, compiled into a tree of Node objects.
+
+    A query is a sequence of terms, combined with 'and', 'or', 'not' and
+    parentheses. Terms next to each other are combined with 'and'. Terms
+    can be:
+
+        tag:foo               projects with the tag foo (also: +foo)
+        name:foo              projects called foo (also: just foo)
+        group:foo             projects in the group foo
+        path:~/work           projects with a path in ~/work
+        archived              archived projects
+        active-since:2016-03  projects with log entries since the given date
+
+    name, group and path accept shell-style wildcards. -foo is the same as
+    'not tag:foo'.
+    """
+    re_token = re.compile(r'\(|\)|(?:[^\s()"]|"[^"]*")+')
+    re_field = re.compile(r"^(tag|name|group|path|active-since):")
+    keywords = ("and", "or", "not", "(", ")")
+    fields = {
+        "tag": Tag,
+        "name": Name,
+        "group": Group,
+        "path": Path,
+    }
+
+    def __init__(self, args):
+        self.tokens = self.tokenize(args)
+        self.pos = 0
+        if not self.tokens:
+            raise QueryError("empty query")
+        self.root = self._parse_or()
+        if self.pos < len(self.tokens):
+            raise QueryError("unexpected '{}' in query".format(self.tokens[self.pos]))
+        del self.tokens
+
+    @classmethod
+    def tokenize(cls, args):
+        return cls.re_token.findall(" ".join(args))
+
+    @classmethod
+    def is_query(cls, args):
+        """
+        Check if a list of filter arguments uses the query syntax.
+
+        Field prefixes and parentheses always do. 'and' and 'or' only do
+        between two other tokens, and 'not' only before another token, so
+        that a lone 'or' is still the name of a project.
+        """
+        tokens = cls.tokenize(args)
+        last = len(tokens) - 1
+        for pos, token in enumerate(tokens):
+            if token in ("(", ")") or cls.re_field.match(token): return True
+            if token in ("and", "or") and 0 < pos < last: return True
+            if token == "not" and pos < last: return True
+        return False
+
+    def match(self, project):
+        return self.root.match(project)
+
+    def match_info(self, info):
+        return self.root.match_info(info)
+
+    def _peek(self):
+        if self.pos >= len(self.tokens): return None
+        return self.tokens[self.pos]
+
+    def _next(self):
+        res = self._peek()
+        if res is None:
+            raise QueryError("query ends unexpectedly")
+        self.pos += 1
+        return res
+
+    def _parse_or(self):
+        nodes = [self._parse_and()]
+        while self._peek() == "or":
+            self.pos += 1
+            nodes.append(self._parse_and())
+        return nodes[0] if len(nodes) == 1 else Or(nodes)
+
+    def _parse_and(self):
+        nodes = [self._parse_not()]
+        while True:
+            token = self._peek()
+            if token is None or token in ("or", ")"): break
+            if token == "and": self.pos += 1
+            nodes.append(self._parse_not())
+        return nodes[0] if len(nodes) == 1 else And(nodes)
+
+    def _parse_not(self):
+        if self._peek() == "not":
+            self.pos += 1
+            return Not(self._parse_not())
+        return self._parse_term()
+
+    def _parse_term(self):
+        token = self._next()
+        if token == "(":
+            res = self._parse_or()
+            if self._next() != ")":
+                raise QueryError("missing ')' in query")
+            return res
+        if token in self.keywords:
+            raise QueryError("unexpected '{}' in query".format(token))
+        if token == "archived":
+            return Archived()
+        if token.startswith("+") and len(token) > 1:
+            return Tag(self._unquote(token[1:]))
+        if token.startswith("-") and len(token) > 1:
+            return Not(Tag(self._unquote(token[1:])))
+        mo = self.re_field.match(token)
+        if not mo:
+            return Name(self._unquote(token))
+        field = mo.group(1)
+        value = self._unquote(token[mo.end():])
+        if not value:
+            raise QueryError("missing value for '{}'".format(token))
+        if field == "active-since":
+            return ActiveSince(self._parse_date(value))
+        return self.fields[field](value)
+
+    def _unquote(self, value):
+        return value.replace('"', "")
+
+    def _parse_date(self, value):
+        for fmt in ("%Y-%m-%d", "%Y-%m", "%Y"):
+            try:
+                return datetime.datetime.strptime(value, fmt).date()
+            except ValueError:
+                pass
+        raise QueryError("cannot parse date '{}': use YYYY-MM-DD, YYYY-MM or YYYY".format(value))
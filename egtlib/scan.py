@@ -1,5 +1,6 @@
 import os
 import os.path
+import re
 import logging
 
 log = logging.getLogger(__name__)
@@ -10,6 +11,9 @@ LEAF_FILE_MARKERS = frozenset((
     "manage.py", "configure.ac", "setup.py", "Rakefile"
 ))
 
+# Name of the files listing paths that scan should skip
+IGNORE_FILE = ".egtignore"
+
 
 def is_script(fname):
     """
@@ -21,20 +25,153 @@ def is_script(fname):
     return False
 
 
-def scan(top):
+class IgnorePatterns:
+    """
+    Compiled gitignore-style patterns, matched against paths relative to a
+    base directory.
+
+    Patterns with a slash other than a trailing one are anchored to the base
+    directory, others match a name at any depth. A trailing slash only
+    matches directories, '**' matches any number of directories, and a
+    leading '!' includes again what a previous pattern excluded. The last
+    pattern that matches decides.
+    """
+    def __init__(self, lines, base):
+        # Prefix of the paths the patterns apply to
+        self.prefix = base if base.endswith("/") else base + "/"
+        # List of (regexp, negate, dir_only), in reverse order
+        self.rules = []
+        for line in lines:
+            rule = self.compile(line)
+            if rule is not None: self.rules.append(rule)
+        self.rules.reverse()
+
+    @classmethod
+    def load(cls, fname):
+        """
+        Read patterns from a file, relative to the directory that contains it
+        """
+        try:
+            with open(fname, "rt") as fd:
+                return cls(fd.read().splitlines(), os.path.dirname(fname))
+        except (OSError, UnicodeDecodeError) as e:
+            log.warning("%s: cannot read ignore file: %s", fname, e)
+            return cls((), os.path.dirname(fname))
+
+    @classmethod
+    def compile(cls, line):
+        """
+        Compile a pattern into a (regexp, negate, dir_only) tuple, or return
+        None if the line has no pattern
+        """
+        line = line.rstrip()
+        if not line or line.startswith("#"): return None
+        negate = line.startswith("!")
+        if negate: line = line[1:]
+        elif line.startswith("\\"): line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line: return None
+        anchored = "/" in line
+        line = line.lstrip("/")
+        regexp = cls.translate(line)
+        if not anchored: regexp = "(?:.*/)?" + regexp
+        return re.compile(regexp + r"\Z"), negate, dir_only
+
+    @classmethod
+    def translate(cls, pattern):
+        """
+        Translate a glob pattern into a regular expression
+        """
+        res = []
+        pos = 0
+        size = len(pattern)
+        while pos < size:
+            c = pattern[pos]
+            if pattern.startswith("**", pos) and (pos == 0 or pattern[pos - 1] == "/"):
+                if pos + 2 == size:
+                    # Trailing '**' matches everything inside
+                    res.append(".*")
+                    pos += 2
+                    continue
+                if pattern[pos + 2] == "/":
+                    # '**/' matches zero or more directories
+                    res.append("(?:.*/)?")
+                    pos += 3
+                    continue
+            if c == "*":
+                res.append("[^/]*")
+            elif c == "?":
+                res.append("[^/]")
+            elif c == "[":
+                end = pattern.find("]", pos + 2)
+                if end == -1:
+                    res.append(re.escape(c))
+                else:
+                    chars = pattern[pos + 1:end]
+                    if chars.startswith("!"): chars = "^" + chars[1:]
+                    res.append("[" + chars.replace("\\", "\\\\") + "]")
+                    pos = end
+            else:
+                res.append(re.escape(c))
+            pos += 1
+        return "".join(res)
+
+    def match(self, path, is_dir):
+        """
+        Check an absolute path against the patterns.
+
+        Returns True if it is ignored, False if it is explicitly not ignored,
+        and None if no pattern matches it.
+        """
+        if not self.rules or not path.startswith(self.prefix): return None
+        relpath = path[len(self.prefix):]
+        for regexp, negate, dir_only in self.rules:
+            if dir_only and not is_dir: continue
+            if regexp.match(relpath): return not negate
+        return None
+
+
+def is_ignored(patterns, path, is_dir):
+    """
+    Check if a path is ignored by a sequence of IgnorePatterns, where later
+    ones take precedence
+    """
+    for p in reversed(patterns):
+        res = p.match(path, is_dir)
+        if res is not None: return res
+    return False
+
+
+def scan(top, excludes=(), one_file_system=False, max_depth=None):
     """
-    Generate the pathnames of all project files inside the given directory
+    Generate the pathnames of all project files inside the given directory.
+
+    excludes is a list of gitignore-style patterns of paths to skip, which
+    are anchored to top if they contain a slash. .egtignore files add more
+    patterns for the directory they are in.
+
+    If one_file_system is True, do not descend into directories on other
+    file systems. If max_depth is not None, do not descend more than that
+    many directories below top.
     """
-    seen = set()
+    top = os.path.abspath(top)
+    try:
+        st = os.stat(top)
+    except OSError as e:
+        log.warning("scan: cannot access %s: %s", top, e)
+        return
+    top_dev = st.st_dev
+    # Since we follow links, prevent loops by remembering which directories
+    # we visited
+    seen = {(st.st_dev, st.st_ino)}
+    # Ignore patterns and depth of the directories yet to visit
+    pending = {top: ((IgnorePatterns(excludes, top),) if excludes else (), 0)}
+
     for root, dirs, files in os.walk(top, followlinks=True):
-        # Since we follow links, prevent loops by remembering which inodes we
-        # visited
-        st = os.stat(root)
-        if st.st_ino in seen:
-            dirs[:] = []
-            continue
-        else:
-            seen.add(st.st_ino)
+        patterns, depth = pending.pop(root, ((), 0))
+        if IGNORE_FILE in files:
+            patterns += (IgnorePatterns.load(os.path.join(root, IGNORE_FILE)),)
 
         #
         # Check files
@@ -44,14 +181,18 @@ def scan(top):
         has_dot_egt = False
         has_egt = False
         for f in files:
+            if f.endswith(".egt") or f == "ore" or f == "egt":
+                if patterns and is_ignored(patterns, os.path.join(root, f), False):
+                    log.debug("scan: ignore file %s", os.path.join(root, f))
+                    continue
             if f.endswith(".egt"):
                 # All .egt files are good
-                yield os.path.join(top, root, f)
+                yield os.path.join(root, f)
                 if f == ".egt":
                     has_dot_egt = True
             elif f == "ore":
                 # Legacy 'ore' files (TODO: remove once everyone migrated)
-                yield os.path.join(top, root, f)
+                yield os.path.join(root, f)
             elif f == "egt":
                 has_egt = True
             elif f in LEAF_FILE_MARKERS:
@@ -60,7 +201,7 @@ def scan(top):
         # If 'egt' exists, there is no '.egt' and egt isn't a script, it is
         # good
         if has_egt and not has_dot_egt:
-            fname = os.path.join(top, root, 'egt')
+            fname = os.path.join(root, 'egt')
             if not is_script(fname):
                 yield fname
             else:
@@ -72,6 +213,31 @@ def scan(top):
         if is_leaf:
             log.debug("scan: prune dir %s", root)
             dirs[:] = []
-        else:
+            continue
+        if max_depth is not None and depth >= max_depth:
+            log.debug("scan: prune dir %s: maximum depth reached", root)
+            dirs[:] = []
+            continue
+
+        keep = []
+        for d in dirs:
             # Skip hidden dirs
-            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            if d.startswith("."): continue
+            path = os.path.join(root, d)
+            if patterns and is_ignored(patterns, path, True):
+                log.debug("scan: ignore dir %s", path)
+                continue
+            try:
+                st = os.stat(path)
+            except OSError as e:
+                log.debug("scan: skip dir %s: %s", path, e)
+                continue
+            if one_file_system and st.st_dev != top_dev:
+                log.debug("scan: skip dir %s: on a different file system", path)
+                continue
+            key = (st.st_dev, st.st_ino)
+            if key in seen: continue
+            seen.add(key)
+            keep.append(d)
+            pending[path] = (patterns, depth + 1)
+        dirs[:] = keep
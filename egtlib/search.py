@@ -0,0 +1,162 @@
+# coding: utf-8
+import atexit
+import io
+import os
+import sqlite3
+import logging
+from . import timings
+
+log = logging.getLogger(__name__)
+
+
+class SearchIndex:
+    """
+    Full-text index of the contents of project files, stored in
+    <statedir>/search.sqlite.
+
+    Each nonempty line is indexed with its line number and the section of
+    the project file it is in (meta, log or body). Files are indexed again
+    only when their mtime or size change.
+    """
+    # Open indices, by state directory
+    _indices = {}
+
+    def __init__(self, statedir):
+        self.statedir = statedir
+        self.pathname = os.path.join(statedir, "search.sqlite")
+        self.db = sqlite3.connect(self.pathname)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                abspath TEXT PRIMARY KEY,
+                project TEXT NOT NULL,
+                archived INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL)
+        """)
+        self.db.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS lines USING fts5 (
+                text, abspath UNINDEXED, lineno UNINDEXED, section UNINDEXED)
+        """)
+        self.db.commit()
+
+    @classmethod
+    def get(cls, statedir):
+        """
+        Return the index for the given state directory, opening it if needed
+        """
+        res = cls._indices.get(statedir)
+        if res is None:
+            if not cls._indices:
+                atexit.register(cls.close_all)
+            res = cls._indices[statedir] = cls(statedir)
+        return res
+
+    @classmethod
+    def close_all(cls):
+        for index in cls._indices.values():
+            index.close()
+        cls._indices = {}
+
+    def close(self):
+        if self.db is None: return
+        self.db.commit()
+        self.db.close()
+        self.db = None
+
+    def update(self, fnames, statedir=None):
+        """
+        Make sure the index is up to date for the given project files,
+        indexing again those that changed since the last time
+        """
+        with timings.phase("search.update"):
+            indexed = dict(((r[0], (r[1], r[2])) for r in self.db.execute("SELECT abspath, mtime, size FROM files")))
+            for fname in fnames:
+                try:
+                    st = os.stat(fname)
+                except FileNotFoundError:
+                    self.remove(fname)
+                    continue
+                if indexed.get(fname) == (st.st_mtime, st.st_size): continue
+                self.index_file(fname, st, statedir=statedir)
+            self.db.commit()
+
+    def remove(self, fname):
+        """
+        Remove a project file from the index
+        """
+        self.db.execute("DELETE FROM lines WHERE abspath=?", (fname,))
+        self.db.execute("DELETE FROM files WHERE abspath=?", (fname,))
+
+    def index_file(self, fname, st, statedir=None):
+        """
+        Index the contents of a project file
+        """
+        from .project import Project
+        with open(fname, "rb") as fd:
+            data = fd.read()
+        proj = Project(fname, statedir=statedir)
+        proj.load(fd=io.BytesIO(data))
+
+        # Use the parsed project to find where each section starts
+        sections = []
+        if proj.meta._lineno is not None: sections.append((proj.meta._lineno, "meta"))
+        if proj.log._lineno is not None: sections.append((proj.log._lineno, "log"))
+        if proj.body._lineno is not None: sections.append((proj.body._lineno, "body"))
+
+        rows = []
+        lines = data.decode("utf-8", errors="replace").split("\n")
+        for idx, (start, section) in enumerate(sections):
+            end = sections[idx + 1][0] if idx + 1 < len(sections) else len(lines)
+            for lineno in range(start, end):
+                text = lines[lineno].strip()
+                if not text: continue
+                rows.append((text, fname, lineno + 1, section))
+
+        self.remove(fname)
+        self.db.executemany("INSERT INTO lines (text, abspath, lineno, section) VALUES (?, ?, ?, ?)", rows)
+        self.db.execute("INSERT INTO files (abspath, project, archived, mtime, size) VALUES (?, ?, ?, ?, ?)",
+                        (fname, proj.name, proj.archived, st.st_mtime, st.st_size))
+        log.debug("%s: indexed %d lines", fname, len(rows))
+
+    @classmethod
+    def make_query(cls, terms):
+        """
+        Build an FTS5 query matching lines that contain all the given terms.
+
+        Terms are matched literally, except for a trailing '*' which makes
+        them match as prefixes.
+        """
+        res = []
+        for term in terms:
+            prefix = term.endswith("*")
+            if prefix: term = term[:-1]
+            if not term: continue
+            res.append('"{}"{}'.format(term.replace('"', '""'), "*" if prefix else ""))
+        return " ".join(res)
+
+    def search(self, terms, fnames=None, sections=None, archived=False):
+        """
+        Generate (project, abspath, lineno, section, text) for all the lines
+        matching all the given terms, sorted by project and line number.
+
+        fnames and sections optionally limit the search to the given files
+        and project file sections.
+        """
+        query = self.make_query(terms)
+        if not query: return
+        sql = ["SELECT f.project, l.abspath, l.lineno, l.section, l.text"
+               " FROM lines l JOIN files f ON f.abspath = l.abspath"
+               " WHERE lines MATCH ?"]
+        params = [query]
+        if not archived:
+            sql.append("AND NOT f.archived")
+        if sections:
+            sql.append("AND l.section IN ({})".format(",".join("?" * len(sections))))
+            params.extend(sections)
+        sql.append("ORDER BY f.project, l.lineno")
+        fnames = set(fnames) if fnames is not None else None
+        for row in self.db.execute(" ".join(sql), params):
+            if fnames is not None and row[1] not in fnames: continue
+            yield row
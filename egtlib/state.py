@@ -1,6 +1,7 @@
 from .utils import atomic_writer
 from .project import Project
 from .scan import scan
+from . import timings
 from xdg import BaseDirectory
 from collections import namedtuple
 import os.path
@@ -20,6 +21,10 @@ class State:
         self.projects = {}
 
     def load(self, statedir=None):
+        with timings.phase("state.load"):
+            self._load(statedir)
+
+    def _load(self, statedir):
         if statedir is None:
             statedir = self.get_state_dir()
 
@@ -46,30 +51,48 @@ class State:
             return
 
     @classmethod
-    def rescan(cls, dirs, statedir=None):
+    def rescan(cls, dirs, statedir=None, excludes=(), one_file_system=False, max_depth=None):
         """
         Rebuild the state looking for files in the given directories.
 
         If statedir is None, the state is saved in the default state
         directory. If it is not None, it is the directory in which state is to
         be saved.
+
+        excludes, one_file_system and max_depth are passed to scan to limit
+        the directories that are searched.
         """
         if statedir is None:
             statedir = cls.get_state_dir()
 
+        # Keep the agenda index up to date with the projects we load anyway
+        from .agenda import AgendaIndex
+        agenda = AgendaIndex.get(statedir)
+
         # Read and detect duplicates
         projects = {}
         for dirname in dirs:
-            for fname in scan(dirname):
+            for fname in scan(dirname, excludes=excludes, one_file_system=one_file_system, max_depth=max_depth):
                 try:
-                    p = Project.from_file(fname)
+                    p = Project.from_file(fname, statedir=statedir)
                 except Exception as e:
                     log.exception("%s: failed to parse: %s", fname, str(e))
                     continue
                 if p.name in projects:
                     log.warn("%s: project %s already exists in %s: skipping", fname, p.name, p.abspath)
                 else:
-                    projects[p.name] = {"fname": p.abspath}
+                    # Information used to select projects without loading
+                    # them
+                    projects[p.name] = {
+                        "fname": p.abspath,
+                        "mtime": os.stat(p.abspath).st_mtime,
+                        "path": p.path,
+                        "group": p.group,
+                        "tags": sorted(p.meta.tags),
+                        "archived": p.archived,
+                    }
+                    agenda.index_project(p)
+        agenda.prune(info["fname"] for info in projects.values())
 
         # Log the difference with the old info
         #old_projects = set(self.projects.keys())
@@ -0,0 +1,125 @@
+# coding: utf-8
+import atexit
+import json
+import os
+import sqlite3
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class ProjectStateStore:
+    """
+    Database with the state of all projects, stored as one JSON document per
+    project in <statedir>/projects.sqlite.
+
+    Each change is committed right away in a short transaction, so that egt
+    commands running at the same time do not lock each other out. Waits for
+    a lock held by another process are bounded by TIMEOUT.
+    """
+    # Open stores, by state directory
+    _stores = {}
+    # Seconds to wait for another process to release the database
+    TIMEOUT = 10
+
+    def __init__(self, statedir):
+        self.statedir = statedir
+        self.pathname = os.path.join(statedir, "projects.sqlite")
+        # Manage transactions explicitly
+        self.db = sqlite3.connect(self.pathname, timeout=self.TIMEOUT, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        # Another egt process may be creating the database at the same time
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            exists = self.db.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='project_state'").fetchone()
+            if not exists:
+                self.db.execute("CREATE TABLE project_state (name TEXT PRIMARY KEY, state TEXT NOT NULL)")
+                migrated = self._migrate()
+            else:
+                migrated = []
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self._backup_migrated(migrated)
+
+    @classmethod
+    def get(cls, statedir):
+        """
+        Return the store for the given state directory, opening it if needed
+        """
+        res = cls._stores.get(statedir)
+        if res is None:
+            if not cls._stores:
+                atexit.register(cls.close_all)
+            res = cls._stores[statedir] = cls(statedir)
+        return res
+
+    @classmethod
+    def close_all(cls):
+        """
+        Close all open stores
+        """
+        for store in cls._stores.values():
+            store.close()
+        cls._stores = {}
+
+    def _migrate(self):
+        """
+        Import state from the old project-<name>.json files.
+
+        Returns the list of pathnames of the files that were imported.
+        """
+        migrated = []
+        for fn in os.listdir(self.statedir):
+            if not fn.startswith("project-") or not fn.endswith(".json"): continue
+            pathname = os.path.join(self.statedir, fn)
+            try:
+                with open(pathname, "rt") as fd:
+                    state = json.load(fd)
+            except (OSError, ValueError) as e:
+                log.warning("%s: cannot migrate project state: %s", pathname, e)
+                continue
+            self.save(fn[8:-5], state)
+            migrated.append(pathname)
+        return migrated
+
+    def _backup_migrated(self, migrated):
+        """
+        Rename the imported project-<name>.json files out of the way, keeping
+        them to be restored when downgrading egt
+        """
+        for pathname in migrated:
+            log.info("%s: migrated to %s, old file kept as %s.migrated", pathname, self.pathname, pathname)
+            try:
+                os.rename(pathname, pathname + ".migrated")
+            except OSError as e:
+                log.warning("%s: cannot rename migrated project state: %s", pathname, e)
+
+    def load(self, name):
+        """
+        Return the state dict of a project, or an empty dict if the project
+        has no state yet
+        """
+        row = self.db.execute("SELECT state FROM project_state WHERE name=?", (name,)).fetchone()
+        if row is None: return {}
+        return json.loads(row[0])
+
+    def load_all(self):
+        """
+        Return a dict mapping project names to their state dicts
+        """
+        return {name: json.loads(state) for name, state in self.db.execute("SELECT name, state FROM project_state")}
+
+    def save(self, name, state):
+        """
+        Store the state of a project. Outside of an explicit transaction, the
+        change is committed right away.
+        """
+        self.db.execute("INSERT OR REPLACE INTO project_state (name, state) VALUES (?, ?)", (name, json.dumps(state)))
+
+    def close(self):
+        if self.db is None: return
+        self.db.close()
+        self.db = None
@@ -0,0 +1,63 @@
+# coding: utf-8
+
+
+class TagDictionary:
+    """
+    Intern tags, assigning each a bit position, so that sets of tags can be
+    represented as integer bitmasks.
+    """
+    def __init__(self):
+        # Map tags to their bit values
+        self.bits = {}
+        # Tags by bit position
+        self.names = []
+
+    def bit(self, tag):
+        """
+        Return the bit value for a tag, assigning it if needed
+        """
+        res = self.bits.get(tag)
+        if res is None:
+            res = self.bits[tag] = 1 << len(self.names)
+            self.names.append(tag)
+        return res
+
+    def mask(self, tags):
+        """
+        Return the bitmask for a collection of tags
+        """
+        res = 0
+        for tag in tags:
+            res |= self.bit(tag)
+        return res
+
+    def lookup_mask(self, tags):
+        """
+        Return the bitmask for a collection of tags, ignoring tags that have
+        not been interned, without assigning new bits
+        """
+        res = 0
+        bits = self.bits
+        for tag in tags:
+            res |= bits.get(tag, 0)
+        return res
+
+    def iter_bits(self, mask):
+        """
+        Generate the bit positions set in a mask
+        """
+        while mask:
+            low = mask & -mask
+            yield low.bit_length() - 1
+            mask ^= low
+
+    def tags(self, mask):
+        """
+        Return the set of tags in a mask
+        """
+        names = self.names
+        return set(names[pos] for pos in self.iter_bits(mask))
+
+
+# Dictionary shared by all projects, so that their masks can be compared
+tag_dictionary = TagDictionary()
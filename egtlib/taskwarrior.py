@@ -0,0 +1,302 @@
+# coding: utf-8
+import asyncio
+import concurrent.futures
+import json
+import os
+import uuid
+import logging
+import taskw
+import taskw.utils
+import kitchen.text.converters
+from taskw.exceptions import TaskwarriorError
+from taskw.warrior import Status
+from . import timings
+
+log = logging.getLogger(__name__)
+
+
+def run_coroutine(coro):
+    """
+    Run a coroutine to completion and return its result.
+
+    asyncio.run() cannot be called when an event loop is already running in
+    this thread: in that case, run the coroutine in a new loop in a separate
+    thread and wait for it.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+class AsyncTaskWarrior(taskw.TaskWarriorShellout):
+    """
+    TaskWarrior client that can run independent queries concurrently, and
+    create many tasks with a single 'task import'.
+
+    prefetch() loads in one go the tasks that a sync is going to need, and
+    get_task() and filter_tasks() answer from what was prefetched when they
+    can, falling back to running 'task' like taskw does.
+
+    Unlike taskw.TaskWarrior, which can be an alias for the direct backend
+    that reads and writes TaskWarrior data files itself, this always runs the
+    'task' command, which needs to be installed.
+    """
+    # Maximum number of 'task' processes run at the same time
+    CONCURRENCY = 4
+    # Maximum number of UUIDs to pass to a single 'task' invocation
+    CHUNK_SIZE = 100
+
+    # Cached TaskWarrior version: taskw asks for it several times per command
+    _version = None
+
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        # Prefetched tasks by UUID
+        self._by_uuid = {}
+        # Prefetched results of lookups by description
+        self._by_description = {}
+        # Prefetched tasks by project name
+        self._by_project = {}
+        # True if _by_uuid contains all the tasks in the database
+        self._complete = False
+
+    @classmethod
+    def get_version(cls):
+        if AsyncTaskWarrior._version is None:
+            AsyncTaskWarrior._version = super().get_version()
+        return AsyncTaskWarrior._version
+
+    def _decode_output(self, data):
+        """
+        Decode the output of 'task', cleaning it like
+        TaskWarriorShellout._execute does
+        """
+        try:
+            res = data.decode(self.config.get("encoding", "utf-8"))
+        except UnicodeDecodeError:
+            res = kitchen.text.converters.to_unicode(data)
+        # Strip terminal control characters like bells, backspaces and form
+        # feeds
+        for c in ("\a", "\b", "\f", "\x1b"):
+            res = res.replace(c, "?")
+        return res
+
+    async def _execute_async(self, semaphore, *args, input=None):
+        """
+        Asynchronous version of taskw's _execute, returning stdout
+        """
+        command = ["task"] + self.get_configuration_override_args() + [str(arg) for arg in args]
+        # Like taskw, pass arguments as bytes without control characters
+        command = [taskw.utils.clean_ctrl_chars(arg.encode("utf-8")) for arg in command]
+        env = os.environ.copy()
+        env["TASKRC"] = self.config_filename
+        async with semaphore:
+            proc = await asyncio.create_subprocess_exec(
+                *command, env=env,
+                stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+            stdout, stderr = await proc.communicate(input)
+        stdout = self._decode_output(stdout)
+        stderr = self._decode_output(stderr)
+        if proc.returncode != 0:
+            raise TaskwarriorError(command, stderr, stdout, proc.returncode)
+        return stdout
+
+    async def _export_async(self, semaphore, *filters):
+        stdout = await self._execute_async(semaphore, *(list(filters) + ["export"]))
+        return [self._get_task_object(x) for x in json.loads(stdout)]
+
+    async def _export_uuids_async(self, semaphore, uuids):
+        """
+        Export the tasks with the given UUIDs, splitting the query in chunks
+        that run concurrently
+        """
+        uuids = list(uuids)
+        chunks = [uuids[i:i + self.CHUNK_SIZE] for i in range(0, len(uuids), self.CHUNK_SIZE)]
+        res = []
+        for tasks in await asyncio.gather(*(self._export_async(semaphore, *chunk) for chunk in chunks)):
+            res.extend(tasks)
+        return res
+
+    def _run(self, coro_func, *args):
+        """
+        Run an async method to completion, accounting its time as TaskWarrior
+        time
+        """
+        async def main():
+            semaphore = asyncio.Semaphore(self.CONCURRENCY)
+            return await coro_func(semaphore, *args)
+        with timings.phase("taskwarrior"):
+            return run_coroutine(main())
+
+    def _remember(self, tasks):
+        for task in tasks:
+            self._by_uuid[str(task["uuid"])] = task
+
+    async def _prefetch_async(self, semaphore, uuids, descriptions, projects):
+        uuids = [u for u in uuids if u not in self._by_uuid]
+        queries = [self._export_uuids_async(semaphore, uuids)]
+        # Same queries that taskw runs for get_task(description=...) and
+        # filter_tasks({"project": ...})
+        queries.extend(self._export_async(semaphore, d) for d in descriptions)
+        for p in projects:
+            queries.append(self._export_async(semaphore, *taskw.utils.encode_query({"project": p}, self.get_version())))
+        results = await asyncio.gather(*queries)
+
+        self._remember(results[0])
+        for desc, tasks in zip(descriptions, results[1:len(descriptions) + 1]):
+            self._by_description[desc] = tasks[0] if tasks else None
+            self._remember(tasks)
+        for project, tasks in zip(projects, results[len(descriptions) + 1:]):
+            self._by_project[project] = tasks
+            self._remember(tasks)
+
+        # Second round: tasks that the tasks we found depend on
+        depends = set()
+        for task in list(self._by_uuid.values()):
+            for dep in task.get("depends") or ():
+                if str(dep) not in self._by_uuid:
+                    depends.add(str(dep))
+        if depends:
+            self._remember(await self._export_uuids_async(semaphore, depends))
+
+    def prefetch(self, uuids=(), descriptions=(), projects=()):
+        """
+        Concurrently load the tasks with the given UUIDs, the first task
+        matching each description, the tasks in the given projects, and all
+        the tasks they depend on
+        """
+        if self._complete:
+            # Only lookups by description may still need running 'task'
+            descriptions = [d for d in descriptions if d not in self._by_description]
+            if not descriptions: return
+            uuids = projects = ()
+        self._run(self._prefetch_async, list(uuids), list(descriptions), list(projects))
+
+    async def _snapshot_async(self, semaphore):
+        self._remember(await self._export_async(semaphore))
+
+    def snapshot(self):
+        """
+        Load all the tasks in the database with a single 'task export'.
+
+        After this, lookups of the tasks in the snapshot and by project are
+        answered without running 'task', which is useful when syncing many
+        projects at once. Tasks not in the snapshot are still looked up with
+        'task', and remembered.
+        """
+        self.forget()
+        self._run(self._snapshot_async)
+        self._complete = True
+
+    def forget(self):
+        """
+        Drop all prefetched information
+        """
+        self._by_uuid = {}
+        self._by_description = {}
+        self._by_project = {}
+        self._complete = False
+
+    def _get_task_result(self, task):
+        """
+        Build the (id, task) result of get_task
+        """
+        if not task: return None, {}
+        if Status.is_pending(task.get("status")):
+            return task["id"], task
+        return None, task
+
+    def get_task(self, **kw):
+        if len(kw) == 1:
+            if "uuid" in kw:
+                task = self._by_uuid.get(str(kw["uuid"]))
+                if task is not None:
+                    return self._get_task_result(task)
+            elif "description" in kw and kw["description"] in self._by_description:
+                return self._get_task_result(self._by_description[kw["description"]])
+        # Tasks missing from a snapshot may have been created after it, like
+        # those that task_add looks up right after creating them
+        id, task = super().get_task(**kw)
+        if task and self._complete and self._marshal: self._remember([task])
+        return id, task
+
+    def _execute(self, *args):
+        res = super()._execute(*args)
+        # Everything but queries changes the database
+        if args and args[-1] != "export" and args[0] != "--version":
+            self._changed(args[0])
+        return res
+
+    def _changed(self, key):
+        """
+        Refresh what is known about a task after this client changed it.
+
+        key is the UUID or ID of the task, or a 'task' subcommand like 'add'
+        if the change is not about an existing task.
+        """
+        # Lookups by project and by description may give different results
+        self._by_project = {}
+        self._by_description = {}
+        key = str(key)
+        for uuid, task in list(self._by_uuid.items()):
+            if uuid != key and str(task.get("id")) != key: continue
+            # Cached tasks are always marshaled
+            marshal = self._marshal
+            self._marshal = True
+            try:
+                id, task = super().get_task(uuid=uuid)
+            finally:
+                self._marshal = marshal
+            if task:
+                self._by_uuid[uuid] = task
+            else:
+                del self._by_uuid[uuid]
+            break
+
+    def filter_tasks(self, filter_dict):
+        if list(filter_dict.keys()) == ["project"]:
+            project = filter_dict["project"]
+            tasks = self._by_project.get(project)
+            if tasks is None and self._complete:
+                # Like TaskWarrior, also match subprojects
+                prefix = project + "."
+                tasks = [t for t in self._by_uuid.values()
+                         if t.get("project") == project or (t.get("project") or "").startswith(prefix)]
+                self._by_project[project] = tasks
+            if tasks is not None: return list(tasks)
+        return super().filter_tasks(filter_dict)
+
+    async def _import_async(self, semaphore, records):
+        data = json.dumps(records).encode("utf-8")
+        await self._execute_async(semaphore, "import", "-", input=data)
+        return await self._export_uuids_async(semaphore, [r["uuid"] for r in records])
+
+    def import_tasks(self, records):
+        """
+        Create new tasks with a single 'task import'.
+
+        records is a list of dicts with the task fields, as TaskWarrior
+        expects them in its JSON import format. Returns the list of the
+        created tasks, in the same order.
+        """
+        if not records: return []
+        records = [dict(r) for r in records]
+        for r in records:
+            # Assign UUIDs ourselves, to be able to find the new tasks
+            r.setdefault("uuid", str(uuid.uuid4()))
+            r.setdefault("status", "pending")
+        tasks = self._run(self._import_async, records)
+        self._changed("import")
+        self._remember(tasks)
+        by_uuid = {str(t["uuid"]): t for t in tasks}
+        res = []
+        for r in records:
+            task = by_uuid.get(r["uuid"])
+            if task is None:
+                raise KeyError("task {} not found after import".format(r["uuid"]))
+            res.append(task)
+        return res
@@ -0,0 +1,134 @@
+# coding: utf-8
+import datetime
+import itertools
+from .tags import tag_dictionary
+
+
+def daily_totals(entries):
+    """
+    Return a dict mapping each day to the (count, minutes) of the log
+    entries that begin in it
+    """
+    daily = {}
+    for entry in entries:
+        day = entry.begin.date()
+        old = daily.get(day)
+        daily[day] = (1, entry.duration) if old is None else (old[0] + 1, old[1] + entry.duration)
+    return daily
+
+
+class TimeSeries:
+    """
+    Logged minutes and log entry counts by day, stored as prefix sums over
+    day indices, so that the totals for any range of days cost two lookups.
+
+    Entries are counted in the day they begin.
+    """
+    def __init__(self, daily=None):
+        """
+        Build the series from a dict mapping dates to (count, minutes)
+        """
+        if not daily:
+            self.first = 0
+            self.counts = [0]
+            self.minutes = [0]
+            return
+        days = sorted(daily)
+        # Ordinal of the first day, which has index 0
+        self.first = days[0].toordinal()
+        size = days[-1].toordinal() - self.first + 1
+        counts = [0] * size
+        minutes = [0] * size
+        for day, (count, mins) in daily.items():
+            idx = day.toordinal() - self.first
+            counts[idx] = count
+            minutes[idx] = mins
+        # counts[i] and minutes[i] are the totals of the days before index i
+        self.counts = [0] + list(itertools.accumulate(counts))
+        self.minutes = [0] + list(itertools.accumulate(minutes))
+
+    @classmethod
+    def from_entries(cls, entries):
+        """
+        Build the series of a sequence of log entries
+        """
+        return cls(daily_totals(entries))
+
+    def _index(self, day):
+        """
+        Return the prefix sum index of the beginning of the given day
+        """
+        idx = day.toordinal() - self.first
+        if idx < 0: return 0
+        if idx >= len(self.minutes): return len(self.minutes) - 1
+        return idx
+
+    def total(self, since, until):
+        """
+        Return (count, minutes) for the days between since and until, both
+        included
+        """
+        begin = self._index(since)
+        end = self._index(until + datetime.timedelta(days=1))
+        if end <= begin: return 0, 0
+        return self.counts[end] - self.counts[begin], self.minutes[end] - self.minutes[begin]
+
+    def rolling(self, window, until, days):
+        """
+        Generate (since, until, count, minutes) for days consecutive windows
+        of window days each, moving one day at a time, with the last one
+        ending on until
+        """
+        for i in range(days - 1, -1, -1):
+            end = until - datetime.timedelta(days=i)
+            begin = end - datetime.timedelta(days=window - 1)
+            count, mins = self.total(begin, end)
+            yield begin, end, count, mins
+
+    @property
+    def first_day(self):
+        """
+        Return the first day with data, or None if the series is empty
+        """
+        if len(self.minutes) == 1: return None
+        return datetime.date.fromordinal(self.first)
+
+    @property
+    def last_day(self):
+        """
+        Return the last day with data, or None if the series is empty
+        """
+        if len(self.minutes) == 1: return None
+        return datetime.date.fromordinal(self.first + len(self.minutes) - 2)
+
+
+class ActivitySeries:
+    """
+    Time series of the logged activity, in total, by project and by tag
+    """
+    def __init__(self, projects):
+        # (count, minutes) by day, in total, by project name and by tag mask
+        total = {}
+        by_project = {}
+        by_mask = {}
+        for p in projects:
+            daily = daily_totals(p.log.entries)
+            by_project[p.name] = daily
+            self._merge(total, daily)
+            self._merge(by_mask.setdefault(p.tag_mask, {}), daily)
+
+        # Add the totals of each combination of tags to each of its tags
+        by_tag = {}
+        for mask, daily in by_mask.items():
+            for pos in tag_dictionary.iter_bits(mask):
+                self._merge(by_tag.setdefault(tag_dictionary.names[pos], {}), daily)
+
+        self.total = TimeSeries(total)
+        self.projects = {name: TimeSeries(daily) for name, daily in by_project.items()}
+        self.tags = {tag: TimeSeries(daily) for tag, daily in by_tag.items()}
+
+    @classmethod
+    def _merge(cls, dest, daily):
+        for day, (count, mins) in daily.items():
+            old = dest.get(day)
+            dest[day] = (count, mins) if old is None else (old[0] + count, old[1] + mins)
@@ -0,0 +1,102 @@
+# coding: utf-8
+"""
+Lightweight phase timing instrumentation.
+
+Code marks interesting phases with::
+
+    with timings.phase("project.load.meta"):
+        ...
+
+When timings are not enabled, phase() returns a shared no-op context manager,
+so hooks can stay in the code at the cost of a global lookup and a function
+call.
+"""
+import time
+import sys
+
+
+class Timings:
+    """
+    Accumulate call counts and elapsed wall clock time by phase name
+    """
+    def __init__(self):
+        # Map phase names to [count, seconds]
+        self.phases = {}
+
+    def add(self, name, elapsed):
+        rec = self.phases.get(name)
+        if rec is None:
+            self.phases[name] = [1, elapsed]
+        else:
+            rec[0] += 1
+            rec[1] += elapsed
+
+    def report(self, file=sys.stderr):
+        """
+        Print a table with the timings collected so far.
+
+        Phases can be nested (for example, date parsing happens during log
+        parsing), so times are not meant to add up.
+        """
+        if not self.phases: return
+        name_len = max(len(x) for x in self.phases)
+        print("{}  {:>8}  {:>10}  {:>10}".format(
+            "phase".ljust(name_len), "calls", "total ms", "avg µs"), file=file)
+        for name, (count, elapsed) in sorted(self.phases.items(), key=lambda x: -x[1][1]):
+            print("{}  {:>8}  {:>10.1f}  {:>10.1f}".format(
+                name.ljust(name_len), count, elapsed * 1000, elapsed * 1000000 / count), file=file)
+
+
+class _Phase:
+    __slots__ = ("timings", "name", "start")
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.timings.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NoPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_no_phase = _NoPhase()
+
+# Timings object currently collecting data, or None if timings are disabled
+active = None
+
+
+def enable():
+    """
+    Start collecting timings, returning the Timings object that receives them
+    """
+    global active
+    active = Timings()
+    return active
+
+
+def disable():
+    global active
+    active = None
+
+
+def phase(name):
+    """
+    Return a context manager that accounts the time spent in it to the phase
+    with the given name
+    """
+    if active is None: return _no_phase
+    return _Phase(active, name)
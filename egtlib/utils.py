@@ -4,6 +4,11 @@ import os.path
 import os
 import fcntl
 import select
+import datetime
+from contextlib import contextmanager
+
+# Datetime returned by now() while inside frozen_now(), or None
+_frozen_now = None
 
 
 class atomic_writer(object):
@@ -33,6 +38,49 @@ class atomic_writer(object):
         return False
 
 
+def now():
+    """
+    Return the current datetime.
+
+    Inside frozen_now(), always return the same datetime, so that everything
+    computed during a command refers to the same moment.
+    """
+    if _frozen_now is not None: return _frozen_now
+    return datetime.datetime.now()
+
+
+def today():
+    """
+    Return the current date, consistently with now()
+    """
+    return now().date()
+
+
+def get_frozen_now():
+    """
+    Return the datetime frozen by frozen_now(), or None if now() is not
+    frozen
+    """
+    return _frozen_now
+
+
+@contextmanager
+def frozen_now(dt=None):
+    """
+    Make now() return dt, or the current datetime, for the duration of the
+    context. If now() is already frozen, it stays as it is.
+    """
+    global _frozen_now
+    if _frozen_now is not None:
+        yield _frozen_now
+        return
+    _frozen_now = dt if dt is not None else datetime.datetime.now()
+    try:
+        yield _frozen_now
+    finally:
+        _frozen_now = None
+
+
 def intervals_intersect(p1s, p1e, p2s, p2e):
     """
     Return True if the two intervals intersect
@@ -0,0 +1,150 @@
+# coding: utf-8
+import datetime
+import itertools
+import re
+import logging
+
+log = logging.getLogger(__name__)
+
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+
+class WorkdayCalendar:
+    """
+    Calendar of working days: all days except weekends and holidays.
+
+    Workdays are stored as cumulative counts over a range of days, extended
+    as needed a year at a time, so that counting the workdays between two
+    dates costs two lookups.
+    """
+    re_split = re.compile(r"[ ,\t]+")
+
+    def __init__(self, weekend=(5, 6), holidays=(), yearly_holidays=()):
+        # Weekdays (0 is Monday) that are not worked
+        self.weekend = frozenset(weekend)
+        # Dates of holidays
+        self.holidays = frozenset(holidays)
+        # (month, day) of holidays happening every year
+        self.yearly_holidays = frozenset(yearly_holidays)
+        # Ordinal of the first day in the cumulative counts
+        self.first = None
+        # cumulative[i] is the number of workdays before day index i
+        self.cumulative = None
+        # Calendars for projects with their own holidays, by their metadata
+        self._derived = {}
+
+    @classmethod
+    def parse_weekend(cls, val):
+        """
+        Parse a list of weekday names into a set of weekday numbers
+        """
+        res = set()
+        for name in cls.re_split.split(val.strip()):
+            if not name: continue
+            key = name[:3].lower()
+            if key not in WEEKDAYS:
+                log.warning("ignoring unknown weekday %s", name)
+                continue
+            res.add(WEEKDAYS.index(key))
+        return res
+
+    @classmethod
+    def parse_holidays(cls, vals):
+        """
+        Parse holiday dates, as YYYY-MM-DD for one day or MM-DD for a day
+        every year.
+
+        Returns a (holidays, yearly_holidays) tuple.
+        """
+        holidays = set()
+        yearly = set()
+        for val in vals:
+            try:
+                if val.count("-") == 2:
+                    holidays.add(datetime.datetime.strptime(val, "%Y-%m-%d").date())
+                else:
+                    # Parse with a leap year, to allow 02-29
+                    d = datetime.datetime.strptime("2000-" + val, "%Y-%m-%d")
+                    yearly.add((d.month, d.day))
+            except ValueError:
+                log.warning("ignoring holiday %s: please use YYYY-MM-DD or MM-DD", val)
+        return holidays, yearly
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Create a calendar from the configuration.
+
+        [config] weekend lists the weekdays that are not worked (default:
+        sat sun). The [holidays] section lists holidays as 'date =
+        description' lines, with dates as YYYY-MM-DD, or as MM-DD for
+        holidays on the same day every year. The description is required,
+        since the configuration does not allow keys without values:
+
+            [holidays]
+            2026-04-06 = Easter Monday
+            12-25 = Christmas
+        """
+        weekend = (5, 6)
+        holidays = ()
+        if config is not None:
+            val = config.get("config", "weekend", fallback=None)
+            if val is not None:
+                weekend = cls.parse_weekend(val)
+            if config.has_section("holidays"):
+                # Skip the keys that come from [DEFAULT]
+                defaults = config.defaults()
+                holidays = [key for key, val in config.items("holidays", raw=True) if key not in defaults]
+        return cls(weekend, *cls.parse_holidays(holidays))
+
+    def for_project(self, project):
+        """
+        Return the calendar for a project, which can list more holidays in
+        its Holidays metadata and change the weekend with Weekend
+        """
+        holidays = project.meta.get("holidays", None)
+        weekend = project.meta.get("weekend", None)
+        if holidays is None and weekend is None: return self
+        key = (holidays, weekend)
+        res = self._derived.get(key)
+        if res is None:
+            if holidays is not None:
+                more, more_yearly = self.parse_holidays(x for x in self.re_split.split(holidays.strip()) if x)
+            else:
+                more, more_yearly = (), ()
+            res = self._derived[key] = WorkdayCalendar(
+                self.weekend if weekend is None else self.parse_weekend(weekend),
+                self.holidays | set(more),
+                self.yearly_holidays | set(more_yearly))
+        return res
+
+    def is_workday(self, day):
+        if day.weekday() in self.weekend: return False
+        if day in self.holidays: return False
+        if (day.month, day.day) in self.yearly_holidays: return False
+        return True
+
+    def _extend(self, since, until):
+        """
+        Make sure the cumulative counts cover the days from since to until
+        """
+        first = datetime.date(since.year, 1, 1).toordinal()
+        last = datetime.date(until.year, 12, 31).toordinal()
+        if self.first is not None:
+            if first >= self.first and last < self.first + len(self.cumulative) - 1: return
+            first = min(first, self.first)
+            last = max(last, self.first + len(self.cumulative) - 2)
+        flags = (1 if self.is_workday(datetime.date.fromordinal(o)) else 0 for o in range(first, last + 1))
+        self.first = first
+        self.cumulative = [0] + list(itertools.accumulate(flags))
+
+    def workdays(self, since, until):
+        """
+        Return the number of workdays between since and until, both
+        included
+        """
+        if until < since: return 0
+        self._extend(since, until)
+        begin = since.toordinal() - self.first
+        end = until.toordinal() - self.first + 1
+        return self.cumulative[end] - self.cumulative[begin]
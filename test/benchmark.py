@@ -0,0 +1,329 @@
+# coding: utf8
+"""
+Benchmark egt on a synthetic corpus of project files.
+
+Run it as:
+
+    python3 -m test.benchmark [--projects N] [--entries M] [--output results.json]
+
+and compare runs of different commits with:
+
+    python3 -m test.benchmark --compare old.json new.json
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from configparser import RawConfigParser
+
+import egtlib
+from egtlib.project import Project
+from egtlib.state import State
+from egtlib import commands
+from egtlib import utils
+
+
+MONTHS = {
+    "en": ["january", "february", "march", "april", "may", "june", "july",
+           "august", "september", "october", "november", "december"],
+    "it": ["gennaio", "febbraio", "marzo", "aprile", "maggio", "giugno",
+           "luglio", "agosto", "settembre", "ottobre", "novembre", "dicembre"],
+}
+
+TAGS = ["work", "home", "debian", "client", "writing", "infra", "research",
+        "teaching", "ops", "frontend", "backend", "admin"]
+
+WORDS = ["wrote", "fixed", "reviewed", "tested", "deployed", "refactored",
+         "documented", "the", "parser", "report", "importer", "cache",
+         "frontend", "database", "release", "meeting", "with", "customer"]
+
+
+class FakeTaskWarrior:
+    """
+    In-memory stand-in for taskw.TaskWarrior, implementing the subset of the
+    interface used by egtlib.body
+    """
+    def __init__(self):
+        self._marshal = True
+        self.tasks = {}
+        self.last_id = 0
+
+    def _add(self, description, project, tags, **kw):
+        self.last_id += 1
+        task = {
+            "id": self.last_id,
+            "uuid": str(uuid.uuid4()),
+            "description": description,
+            "project": project,
+            "tags": list(tags),
+            "status": "pending",
+            "modified": datetime.datetime(2016, 3, 15, 9, 0),
+        }
+        task.update(kw)
+        self.tasks[task["uuid"]] = task
+        return task
+
+    def task_add(self, description, project=None, tags=(), **kw):
+        task = self._add(description, project, tags, **kw)
+        return {"id": task["uuid"]}
+
+    def get_task(self, uuid=None, description=None):
+        if uuid is not None:
+            task = self.tasks.get(str(uuid))
+            if task is None:
+                for t in self.tasks.values():
+                    if str(t["id"]) == str(uuid):
+                        task = t
+                        break
+        else:
+            task = None
+            for t in self.tasks.values():
+                if t["description"] == description:
+                    task = t
+                    break
+        if task is None: return None, {}
+        return task["id"], task
+
+    def filter_tasks(self, filter_dict):
+        project = filter_dict.get("project")
+        return [t for t in self.tasks.values() if t["project"] == project]
+
+    def prefetch(self, uuids=(), descriptions=(), projects=()):
+        pass
+
+    def import_tasks(self, records):
+        return [self._add(r["description"], r["project"], r["tags"]) for r in records]
+
+
+def random_text(rnd, words=6):
+    return " ".join(rnd.choice(WORDS) for i in range(words))
+
+
+def write_project(rnd, pathname, name, lang, entries, tw=None):
+    """
+    Write a synthetic project file with the given number of log entries
+    """
+    with open(pathname, "wt", encoding="utf-8") as fd:
+        print("Name: {}".format(name), file=fd)
+        print("Tags: {}".format(", ".join(rnd.sample(TAGS, 2))), file=fd)
+        if lang == "it":
+            print("Lang: it", file=fd)
+        if rnd.random() < 0.3:
+            print("Backup: docs", file=fd)
+            print(" archive", file=fd)
+        print(file=fd)
+
+        # Spread entries over a few years, ending today
+        today = datetime.date.today()
+        day = today - datetime.timedelta(days=max(entries, 1) * 2)
+        year = None
+        for i in range(entries):
+            day += datetime.timedelta(days=rnd.randint(1, 3))
+            if day > today: day = today
+            if day.year != year:
+                year = day.year
+                print(year, file=fd)
+            month = MONTHS[lang][day.month - 1]
+            if rnd.random() < 0.2:
+                print("{} {}:".format(day.day, month), file=fd)
+            else:
+                start = rnd.randint(8, 15)
+                print("{} {}: {}:00-{}:30".format(day.day, month, start, start + rnd.randint(0, 3)), file=fd)
+            for j in range(rnd.randint(1, 4)):
+                print(" - {}".format(random_text(rnd)), file=fd)
+        print(file=fd)
+
+        # Body with notes and tasks
+        for i in range(rnd.randint(3, 10)):
+            if rnd.random() < 0.3:
+                desc = random_text(rnd, 4)
+                if tw is not None and rnd.random() < 0.5:
+                    task = tw._add(desc, name, ["bench"])
+                    print("t{} {}".format(task["id"], desc), file=fd)
+                else:
+                    print("t {} +bench".format(desc), file=fd)
+            else:
+                print(random_text(rnd, 10), file=fd)
+
+
+def generate_corpus(root, projects=50, entries=100, seed=0, tw=None):
+    """
+    Generate a tree of synthetic projects inside root.
+
+    Returns the list of generated project file names.
+    """
+    rnd = random.Random(seed)
+    res = []
+    for i in range(projects):
+        # Nest projects at different depths, with some noise for scan
+        parts = ["area{}".format(i % 5)]
+        if i % 3: parts.append("client{}".format(i % 7))
+        if i % 4 == 0: parts.append("proj{}".format(i))
+        dirname = os.path.join(root, *parts)
+        os.makedirs(dirname, exist_ok=True)
+
+        name = "proj{}".format(i)
+        if i % 4 == 0:
+            fname = os.path.join(dirname, ".egt")
+        else:
+            fname = os.path.join(dirname, name + ".egt")
+        lang = "it" if i % 3 == 0 else "en"
+        write_project(rnd, fname, name, lang, entries, tw=tw)
+        res.append(fname)
+
+        # Directories that scan has to walk or prune
+        noise = os.path.join(dirname, "src{}".format(i))
+        os.makedirs(os.path.join(noise, "lib"), exist_ok=True)
+        if i % 2:
+            with open(os.path.join(noise, "setup.py"), "wt") as fd:
+                print("#!/usr/bin/python3", file=fd)
+        os.makedirs(os.path.join(dirname, ".hidden{}".format(i)), exist_ok=True)
+    return res
+
+
+class Benchmark:
+    def __init__(self, projects=50, entries=100, repeat=3, seed=0):
+        self.projects = projects
+        self.entries = entries
+        self.repeat = repeat
+        self.seed = seed
+        self.results = {}
+
+    def measure(self, name, func):
+        """
+        Run func self.repeat times, storing timing information under the
+        given name
+        """
+        times = []
+        for i in range(self.repeat):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        times.sort()
+        self.results[name] = {
+            "min": times[0],
+            "median": times[len(times) // 2],
+            "max": times[-1],
+            "runs": len(times),
+        }
+
+    def run_command(self, cls, statedir, **kw):
+        args = argparse.Namespace(archived=False, projects=[], **kw)
+        cmd = cls(args)
+        cmd.config = RawConfigParser()
+        cmd.make_egt = lambda filter=[]: egtlib.Egt(config=cmd.config, filter=filter, statedir=statedir)
+        with contextlib.redirect_stdout(io.StringIO()), utils.frozen_now():
+            cmd.main()
+
+    def run(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            root = os.path.join(workdir, "corpus")
+            statedir = os.path.join(workdir, "state")
+            os.makedirs(statedir)
+            tw = FakeTaskWarrior()
+            fnames = generate_corpus(root, self.projects, self.entries, self.seed, tw=tw)
+
+            self.measure("scan", lambda: list(egtlib.scan(root)))
+            self.measure("state_rescan", lambda: State.rescan([root], statedir=statedir))
+
+            def load_all():
+                for fname in fnames:
+                    Project(fname, statedir=statedir).load(cache=False)
+            self.measure("project_load", load_all)
+
+            def load_all_cached():
+                for fname in fnames:
+                    Project(fname, statedir=statedir).load()
+            self.measure("project_load_cached", load_all_cached)
+
+            def weekrpt():
+                self.run_command(commands.Weekrpt, statedir, end=None, days=7)
+            self.measure("weekrpt", weekrpt)
+
+            def summary():
+                self.run_command(commands.Summary, statedir)
+            self.measure("summary", summary)
+
+            def annotate():
+                for fname in fnames:
+                    p = Project(fname, statedir=statedir)
+                    p.body._tw = tw
+                    p.load()
+                    p.body.sync_tasks()
+                    p.log.sync()
+                    with io.StringIO() as out:
+                        p.print(out)
+            self.measure("annotate", annotate)
+
+    def to_json(self):
+        try:
+            commit = subprocess.check_output(
+                ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(__file__),
+                stderr=subprocess.DEVNULL).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            "commit": commit,
+            "date": datetime.datetime.now().isoformat(),
+            "python": sys.version.split()[0],
+            "corpus": {
+                "projects": self.projects,
+                "entries": self.entries,
+                "seed": self.seed,
+            },
+            "results": self.results,
+        }
+
+
+def compare(old, new, file=sys.stdout):
+    """
+    Print a comparison between two benchmark result dicts
+    """
+    print("{:20} {:>10} {:>10} {:>8}".format("benchmark", "old ms", "new ms", "ratio"), file=file)
+    for name, res in sorted(new["results"].items()):
+        old_res = old["results"].get(name)
+        if old_res is None:
+            print("{:20} {:>10} {:>10.1f} {:>8}".format(name, "--", res["min"] * 1000, "--"), file=file)
+        else:
+            print("{:20} {:>10.1f} {:>10.1f} {:>8.2f}".format(
+                name, old_res["min"] * 1000, res["min"] * 1000, res["min"] / old_res["min"]), file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark egt on a synthetic corpus")
+    parser.add_argument("--projects", type=int, default=50, help="number of projects to generate (default: %(default)s)")
+    parser.add_argument("--entries", type=int, default=100, help="number of log entries per project (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs of each benchmark (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for corpus generation (default: %(default)s)")
+    parser.add_argument("--output", "-o", metavar="file", help="save results as JSON to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("old", "new"), help="compare two JSON result files instead of running benchmarks")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], "rt") as fd:
+            old = json.load(fd)
+        with open(args.compare[1], "rt") as fd:
+            new = json.load(fd)
+        compare(old, new)
+        return
+
+    bench = Benchmark(projects=args.projects, entries=args.entries, repeat=args.repeat, seed=args.seed)
+    bench.run()
+    res = bench.to_json()
+    for name, r in sorted(res["results"].items()):
+        print("{:20} {:10.1f}ms".format(name, r["min"] * 1000))
+    if args.output:
+        with open(args.output, "wt") as fd:
+            json.dump(res, fd, indent=1)
+
+
+if __name__ == "__main__":
+    main()
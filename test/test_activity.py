@@ -0,0 +1,90 @@
+# coding: utf8
+import unittest
+import subprocess
+import datetime
+import os
+from .utils import ProjectTestMixin
+from egtlib.activity import ActivityIndex
+from egtlib.project import Project
+from egtlib.log import Entry
+from egtlib import git as egtgit
+
+
+class TestActivity(ProjectTestMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.repodir = os.path.join(self.workdir.name, "repo")
+        os.makedirs(self.repodir)
+        self.git("init", "-q")
+        self.git("config", "user.email", "me@example.org")
+        self.git("config", "user.name", "Me")
+        self.commit("first")
+        self.commit("by someone else", email="other@example.org")
+        self.commit("second")
+        self.proj = Project.mock(os.path.join(self.repodir, ".egt"), name="test", path=self.repodir)
+        self.proj.statedir = self.workdir.name
+
+    def tearDown(self):
+        ActivityIndex.close_all()
+        super().tearDown()
+
+    def git(self, *args):
+        subprocess.run(["git", "-C", self.repodir] + list(args), check=True)
+
+    def commit(self, message, email="me@example.org"):
+        self.git("-c", "user.email=" + email, "commit", "-q", "--allow-empty", "-m", message)
+
+    def summaries(self, index, **kw):
+        return [x[4] for x in index.commits(**kw)]
+
+    def test_update(self):
+        index = ActivityIndex.get(self.workdir.name)
+        index.update_project(self.proj)
+        self.assertEqual(self.summaries(index), ["second", "first"])
+        rows = index.commits()
+        self.assertEqual(rows[0][0], "test")
+        self.assertEqual(rows[0][1], os.path.join(self.repodir, ".git"))
+
+        # Incremental update only sees the new commit
+        self.commit("third")
+        index.update_project(self.proj)
+        self.assertEqual(self.summaries(index), ["third", "second", "first"])
+
+        # Time and repository filters
+        self.assertEqual(self.summaries(index, until=0), [])
+        self.assertEqual(self.summaries(index, gitdirs=[os.path.join(self.workdir.name, "other")]), [])
+
+    def test_collect_achievements(self):
+        begin = datetime.datetime.now() - datetime.timedelta(days=1)
+
+        # Without an index, history is read from the repository
+        self.assertIsNone(ActivityIndex.get_existing(self.workdir.name))
+        entry = Entry(begin, None, "head", [], False)
+        egtgit.collect_achievements(self.proj, entry)
+        plain = entry.body
+
+        # With an index, it gives the same results
+        ActivityIndex.get(self.workdir.name)
+        entry = Entry(begin, None, "head", [], False)
+        egtgit.collect_achievements(self.proj, entry)
+        self.assertEqual(entry.body, plain)
+        self.assertEqual(len(entry.body), 2)
+        self.assertTrue(entry.body[1].endswith("] second"))
+
+        # Commits already in the log are not added again
+        self.commit("third")
+        egtgit.collect_achievements(self.proj, entry)
+        self.assertEqual(len(entry.body), 3)
+        self.assertTrue(entry.body[2].endswith("] third"))
+
+    def test_collect_achievements_head(self):
+        begin = datetime.datetime.now() - datetime.timedelta(days=1)
+        ActivityIndex.get(self.workdir.name)
+
+        # Commits in other branches are not added
+        self.git("checkout", "-q", "-b", "feature")
+        self.commit("unmerged")
+        self.git("checkout", "-q", "-")
+        entry = Entry(begin, None, "head", [], False)
+        egtgit.collect_achievements(self.proj, entry)
+        self.assertEqual([x.split("] ")[1] for x in entry.body], ["first", "second"])
@@ -0,0 +1,63 @@
+# coding: utf8
+import unittest
+import datetime
+import os
+from .utils import ProjectTestMixin
+from egtlib.agenda import AgendaIndex
+from egtlib.project import Project
+from egtlib.statestore import ProjectStateStore
+
+
+class TestAgenda(ProjectTestMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.p1 = os.path.join(self.workdir.name, "p1.egt")
+        with open(self.p1, "wt") as fd:
+            fd.write("Name: first\nStart-date: 2016-03-01\nEnd-date: 2016-06-30\n\n"
+                     "2016\n15 march: 9:00-9:30\n - wrote tests\n\n"
+                     "t pay bills due:2016-03-20 +home\n"
+                     "t call back scheduled:tomorrow +phone\n"
+                     "t3 synced task\n")
+        self.p2 = os.path.join(self.workdir.name, "p2.egt")
+        with open(self.p2, "wt") as fd:
+            fd.write("Name: second\n\nt review due:2016-04-01 +work\n")
+        self.index = AgendaIndex.get(self.workdir.name)
+
+    def events(self, **kw):
+        return [(d.strftime("%Y-%m-%d"), kind, name, lineno, text) for d, kind, name, abspath, lineno, text in self.index.events(**kw)]
+
+    def test_agenda(self):
+        self.index.update([self.p1, self.p2])
+        self.assertEqual(self.events(), [
+            ("2016-03-01", "start-date", "first", 1, "first"),
+            ("2016-03-20", "due", "first", 9, "pay bills"),
+            ("2016-04-01", "due", "second", 3, "review"),
+            ("2016-06-30", "end-date", "first", 1, "first"),
+        ])
+        self.assertEqual(self.events(since=datetime.date(2016, 3, 20), until=datetime.date(2016, 4, 1)), [
+            ("2016-03-20", "due", "first", 9, "pay bills"),
+            ("2016-04-01", "due", "second", 3, "review"),
+        ])
+        self.assertEqual(self.events(fnames=[self.p2]), [("2016-04-01", "due", "second", 3, "review")])
+        self.assertEqual(self.index.contexts(), {"home", "phone", "work"})
+        self.assertEqual(self.index.contexts(fnames=[self.p1]), {"home", "phone"})
+
+        # Project methods give the same information
+        proj = Project.from_file(self.p1, statedir=self.workdir.name)
+        self.assertEqual(proj.contexts, {"home", "phone"})
+        self.assertEqual([t.desc for t in proj.next_events(since=datetime.date(2016, 3, 1))], ["pay bills"])
+
+    def test_task_dates(self):
+        self.index.update([self.p1])
+        self.assertEqual([x[4] for x in self.events()], ["first", "pay bills", "first"])
+
+        # Dates of synced tasks come from the project state saved by sync
+        store = ProjectStateStore.get(self.workdir.name)
+        store.save("first", {"tasks": {"ids": {"3": "uuid"}, "dates": {"3": {"due": "2016-05-01"}}}})
+        self.index.update([self.p1])
+        self.assertEqual([x[4] for x in self.events()], ["first", "pay bills", "synced task", "first"])
+
+        # Removed files are removed from the index
+        os.unlink(self.p1)
+        self.index.update([self.p1])
+        self.assertEqual(self.events(), [])
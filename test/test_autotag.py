@@ -0,0 +1,39 @@
+# coding: utf8
+import unittest
+import re
+from egtlib.egt import AutoTagger
+
+
+class TestAutoTagger(unittest.TestCase):
+    """
+    Test AutoTagger
+    """
+    rules = [
+        ("work", "/work/"),
+        ("home", "^/home"),
+        ("debian", "debian$"),
+        ("client", r"client\d+"),
+        ("named", r"(?P<x>proj)(?P=x)"),
+        ("dash", "my-stuff"),
+        ("any", ""),
+    ]
+
+    paths = [
+        "/home/enrico/work/debian",
+        "/srv/work/client12/.egt",
+        "/home/enrico/my-stuff/projproj.egt",
+        "/tmp/foo",
+    ]
+
+    def test_matches(self):
+        tagger = AutoTagger(self.rules)
+        for path in self.paths:
+            with self.subTest(path=path):
+                expected = frozenset(tag for tag, regexp in self.rules if re.search(regexp, path))
+                self.assertEqual(tagger.tags(path), expected)
+                # Cached result
+                self.assertEqual(tagger.tags(path), expected)
+
+    def test_empty(self):
+        tagger = AutoTagger.from_config(None)
+        self.assertEqual(tagger.tags("/home/enrico/work"), frozenset())
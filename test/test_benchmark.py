@@ -0,0 +1,30 @@
+# coding: utf8
+import unittest
+import tempfile
+import os
+from egtlib import scan
+from egtlib.project import Project
+from .benchmark import generate_corpus, Benchmark, FakeTaskWarrior
+
+
+class TestBenchmark(unittest.TestCase):
+    """
+    Make sure the benchmark corpus and harness keep working
+    """
+    def test_corpus(self):
+        with tempfile.TemporaryDirectory() as root:
+            tw = FakeTaskWarrior()
+            fnames = generate_corpus(root, projects=6, entries=20, tw=tw)
+            self.assertEqual(sorted(scan(root)), sorted(fnames))
+            for fname in fnames:
+                p = Project(fname, statedir=root)
+                p.load()
+                self.assertEqual(len(list(p.log.entries)), 20)
+                self.assertIn(p.meta.get("lang", "en"), ("en", "it"))
+
+    def test_run(self):
+        bench = Benchmark(projects=3, entries=5, repeat=1)
+        bench.run()
+        res = bench.to_json()
+        self.assertEqual(sorted(res["results"].keys()), [
+            "annotate", "project_load", "project_load_cached", "scan", "state_rescan", "summary", "weekrpt"])
@@ -0,0 +1,57 @@
+# coding: utf8
+import unittest
+from egtlib.egt import ProjectCatalog
+from egtlib.project import Project
+
+
+class TestCatalog(unittest.TestCase):
+    """
+    Test ProjectCatalog
+    """
+    def setUp(self):
+        self.catalog = ProjectCatalog()
+        self.foo = Project.mock("/work/foo/.egt", name="foo", tags={"work", "debian"})
+        self.bar = Project.mock("/home/bar/.egt", name="bar", tags={"home"})
+        self.baz = Project.mock("/work/baz/.egt", name="baz", tags={"work"})
+        self.old = Project.mock("/work/old/.egt", name="foo", tags={"work"})
+        self.old.meta.set("end-date", "2015-01-01")
+        self.old.archived = True
+        for p in (self.foo, self.bar, self.baz, self.old):
+            self.catalog.add(p)
+
+    def names(self, projects):
+        return [p.name for p in projects]
+
+    def test_sorted(self):
+        self.assertEqual(len(self.catalog), 4)
+        self.assertEqual(self.names(self.catalog), ["bar", "baz", "foo", "foo-2015-01-01"])
+        self.assertEqual(self.catalog.keys(), ["bar", "baz", "foo", "foo-2015-01-01"])
+        self.assertEqual(self.catalog.items()[0], ("bar", self.bar))
+        self.assertIn("baz", self.catalog)
+        self.assertIs(self.catalog.get("foo"), self.foo)
+        self.assertIsNone(self.catalog.get("missing"))
+
+    def test_indices(self):
+        self.assertEqual(self.catalog.tags(), ["debian", "home", "work"])
+        self.assertEqual(self.names(self.catalog.with_tag("work")), ["baz", "foo", "foo-2015-01-01"])
+        self.assertEqual(self.names(self.catalog.with_tag("missing")), [])
+        self.assertEqual(self.names(self.catalog.with_tags(["work", "debian"])), ["foo"])
+        self.assertEqual(self.names(self.catalog.with_tags(["work", "missing"])), [])
+        self.assertEqual(self.names(self.catalog.in_group("foo")), ["foo", "foo-2015-01-01"])
+        self.assertEqual(self.names(self.catalog.with_path("/home/bar")), ["bar"])
+        self.assertEqual(self.names(self.catalog.archived()), ["foo-2015-01-01"])
+        self.assertEqual(self.names(self.catalog.archived(False)), ["bar", "baz", "foo"])
+
+    def test_replace(self):
+        new = Project.mock("/home/baz/.egt", name="baz", tags={"home"})
+        self.catalog.add(new)
+        self.assertEqual(len(self.catalog), 4)
+        self.assertIs(self.catalog.get("baz"), new)
+        self.assertEqual(self.names(self.catalog.with_tag("work")), ["foo", "foo-2015-01-01"])
+        self.assertEqual(self.names(self.catalog.with_tag("home")), ["bar", "baz"])
+        self.assertEqual(self.names(self.catalog.with_path("/work/baz")), [])
+
+        self.catalog.remove("bar")
+        self.assertEqual(self.catalog.keys(), ["baz", "foo", "foo-2015-01-01"])
+        self.assertEqual(self.names(self.catalog.with_tag("home")), ["baz"])
+        self.assertNotIn("bar", self.catalog)
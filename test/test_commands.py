@@ -3,7 +3,13 @@ import unittest
 from .utils import ProjectTestMixin
 from configparser import ConfigParser
 import os
+import argparse
+import contextlib
+import gc
+import io
+import weakref
 from egtlib.state import State
+from egtlib.commands import PrintLog
 import egtlib
 
 body_p = """Name: test
@@ -50,6 +56,35 @@ class TestCommands(ProjectTestMixin, unittest.TestCase):
         self.assertIn("p2", names)
         self.assertEqual(len(names), 3)
 
+    def test_iter_projects(self):
+        State.rescan([self.workdir.name], statedir=self.workdir.name)
+        egt = egtlib.Egt(config=ConfigParser(), statedir=self.workdir.name)
+        loaded = []
+        orig = egt.load_project
+
+        def load_project(fname, project_fd=None):
+            loaded.append(fname)
+            return orig(fname, project_fd=project_fd)
+        egt.load_project = load_project
+
+        # In bounded mode, projects are not kept after they are generated
+        refs = []
+        for p in egt.iter_projects(order="name", bounded=True):
+            refs.append((p.name, weakref.ref(p)))
+        del p
+        # Projects have reference cycles with their log and body
+        gc.collect()
+        self.assertEqual([name for name, ref in refs], ["p1", "p2", "test"])
+        self.assertEqual([ref() for name, ref in refs], [None, None, None])
+        self.assertIsNone(egt._projects)
+
+        # Otherwise, they are reused by Egt.projects
+        del loaded[:]
+        names = [p.name for p in egt.iter_projects()]
+        self.assertEqual(sorted(names), ["p1", "p2", "test"])
+        self.assertEqual([p.name for p in egt.projects], ["p1", "p2", "test"])
+        self.assertEqual(len(loaded), 3)
+
     # TODO: test_summary
     # TODO: test_term
     # TODO: test_work
@@ -57,7 +92,58 @@ class TestCommands(ProjectTestMixin, unittest.TestCase):
     # TODO: test_grep
     # TODO: test_mrconfig
     # TODO: test_weekrpt
-    # TODO: test_printlog
+    def test_printlog(self):
+        with open(self.p1, "wt") as fd:
+            fd.write("Name: p1\n\n2016\n16 march: 9:00-10:00\n - p1 second\n14 march: 9:00-10:00\n - p1 first\n")
+        with open(self.p2, "wt") as fd:
+            fd.write("Name: p2\n\n2016\n15 march: 9:00-10:00\n - p2\n17 march: 9:00-10:00\n - p2 last\n")
+        State.rescan([self.workdir.name], statedir=self.workdir.name)
+
+        def printlog(**kw):
+            args = argparse.Namespace(archived=False, projects=[], since=None, until=None)
+            for k, v in kw.items(): setattr(args, k, v)
+            cmd = PrintLog(args)
+            cmd.make_egt = lambda filter=[]: egtlib.Egt(config=ConfigParser(), filter=filter, statedir=self.workdir.name)
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                cmd.main()
+            return [line for line in out.getvalue().splitlines() if line.startswith(" - ")]
+
+        # Logs are merged in chronological order, also when not sorted in the
+        # project file
+        self.assertEqual(printlog(), [" - p1 first", " - p2", " - wrote unit tests", " - p1 second", " - p2 last"])
+        self.assertEqual(printlog(since="2016-03-15", until="2016-03-16"), [" - p2", " - wrote unit tests", " - p1 second"])
+        self.assertEqual(printlog(projects=["p2"], until="2016-03-15"), [" - p2"])
+
+    def test_printlog_releases_projects(self):
+        State.rescan([self.workdir.name], statedir=self.workdir.name)
+        refs = []
+        test = self
+
+        class Output(io.StringIO):
+            def write(self, text):
+                # Projects are no longer alive when output is produced
+                gc.collect()
+                test.assertEqual([ref() for ref in refs], [None] * len(refs))
+                return super().write(text)
+
+        def make_egt(filter=[]):
+            egt = egtlib.Egt(config=ConfigParser(), filter=filter, statedir=self.workdir.name)
+            orig = egt.load_project
+
+            def load_project(fname, project_fd=None):
+                res = orig(fname, project_fd=project_fd)
+                refs.append(weakref.ref(res))
+                return res
+            egt.load_project = load_project
+            return egt
+
+        cmd = PrintLog(argparse.Namespace(archived=False, projects=[], since=None, until=None))
+        cmd.make_egt = make_egt
+        with contextlib.redirect_stdout(Output()) as out:
+            cmd.main()
+        self.assertEqual(len(refs), 3)
+        self.assertIn(" - wrote unit tests", out.getvalue())
+
     # TODO: test_annotate
     # TODO: test_archive
     # TODO: test_serve
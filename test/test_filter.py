@@ -1,7 +1,10 @@
 # coding: utf8
 import unittest
-from egtlib.egt import ProjectFilter
+import datetime
+import io
+from egtlib.egt import ProjectFilter, WeeklyReport
 from egtlib.project import Project
+from egtlib.tags import TagDictionary
 
 
 class TestFilter(unittest.TestCase):
@@ -38,3 +41,55 @@ class TestFilter(unittest.TestCase):
 
         p = Project.mock("test/.egt", name="foo", tags={"foo", "bar"})
         self.assertFalse(f.matches(p))
+
+
+class TestTagDictionary(unittest.TestCase):
+    def test_masks(self):
+        d = TagDictionary()
+        self.assertEqual(d.mask(["foo", "bar"]), 3)
+        self.assertEqual(d.mask(["bar", "baz"]), 6)
+        self.assertEqual(d.lookup_mask(["baz", "missing"]), 4)
+        self.assertEqual(d.tags(5), {"foo", "baz"})
+        self.assertEqual(list(d.iter_bits(6)), [1, 2])
+        self.assertEqual(d.tags(0), set())
+
+
+class TestWeeklyReport(unittest.TestCase):
+    def project(self, name, tags, log):
+        p = Project("/test/{}.egt".format(name))
+        p.load(fd=io.StringIO("Name: {}\nTags: {}\n\n2016\n{}\n".format(name, tags, log)), cache=False)
+        return p
+
+    def test_tags(self):
+        rep = WeeklyReport()
+        rep.add(self.project("foo", "work, debian", "15 march: 9:00-10:00\n16 march: 9:00-11:00"))
+        rep.add(self.project("bar", "work", "14 march: 9:00-12:00\n1 march: 9:00-12:00"))
+        rep.add(self.project("baz", "home", "1 march: 9:00-12:00"))
+        res = rep.report(end=datetime.date(2016, 3, 17), days=7)
+        self.assertEqual(res["count"], 3)
+        self.assertEqual(res["hours"], 6)
+        self.assertEqual(sorted(res["projects"]), ["bar", "foo"])
+        self.assertEqual(res["projects"]["foo"]["hours"], 3)
+        self.assertEqual(sorted(res["tags"]), ["debian", "work"])
+        self.assertEqual(res["tags"]["work"]["count"], 3)
+        self.assertEqual(res["tags"]["work"]["hours"], 6)
+        self.assertEqual(res["tags"]["debian"]["hours"], 3)
+
+    def test_period(self):
+        rep = WeeklyReport()
+        # Full-day entries end at midnight of the next day: they count only in
+        # the day they begin
+        rep.add(self.project("foo", "work", "10 march:\n - before\n11 march:\n - first day\n17 march: 9:00-10:00\n - last day\n18 march: 9:00-10:00\n - after"))
+        res = rep.report(end=datetime.date(2016, 3, 17), days=7)
+        self.assertEqual(res["begin"], datetime.date(2016, 3, 11))
+        self.assertEqual(res["until"], datetime.date(2016, 3, 17))
+        self.assertEqual(res["count"], 2)
+        self.assertEqual(res["hours"], 25)
+        self.assertEqual([e.body for e, p in res["log"]], [[" - first day"], [" - last day"]])
+
+        # Consecutive reports do not count the same entries
+        res = rep.report(end=datetime.date(2016, 3, 10), days=7)
+        self.assertEqual([e.body for e, p in res["log"]], [[" - before"]])
+        res = rep.report(end=datetime.date(2016, 3, 10), days=1)
+        self.assertEqual(res["count"], 1)
+        self.assertEqual(res["hours_per_day"], 24)
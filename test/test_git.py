@@ -0,0 +1,72 @@
+# coding: utf8
+import unittest
+import subprocess
+import datetime
+import os
+from .utils import ProjectTestMixin
+from egtlib import git as egtgit
+
+
+class TestGit(ProjectTestMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.repodir = os.path.join(self.workdir.name, "repo")
+        os.makedirs(self.repodir)
+        self.git("init", "-q")
+        self.git("config", "user.email", "me@example.org")
+        self.git("config", "user.name", "Me")
+        self.git("config", "core.abbrev", "9")
+        for i in range(3):
+            with open(os.path.join(self.repodir, "file"), "wt") as fd:
+                print(i, file=fd)
+            self.git("add", "file")
+            self.git("commit", "-q", "-m", "change {}\n\ndetails".format(i))
+
+    def git(self, *args):
+        subprocess.run(["git", "-C", self.repodir] + list(args), check=True)
+
+    def test_backends(self):
+        res = {}
+        for name, backend in egtgit.BACKENDS.items():
+            if backend is egtgit.GitPythonRepo and egtgit.git is None: continue
+            repo = backend(self.repodir)
+            self.assertEqual(repo.my_email, "me@example.org")
+            self.assertEqual(repo.abbrev_size, 9)
+            res[name] = [(c.hexsha, c.author_email, c.authored_date, c.summary) for c in repo.iter_commits()]
+            repo.close()
+            self.assertEqual([x[3] for x in res[name]], ["change 2", "change 1", "change 0"])
+        if len(res) == 2:
+            self.assertEqual(res["gitpython"], res["subprocess"])
+
+    def test_early_stop(self):
+        repo = egtgit.SubprocessRepo(self.repodir)
+        for c in repo.iter_commits():
+            break
+        self.assertEqual(c.summary, "change 2")
+
+    def test_cache(self):
+        cache = egtgit.RepoCache(max_size=1)
+        cache.set_backend("subprocess")
+        repo = cache.get(self.repodir)
+        self.assertIs(cache.get(self.repodir), repo)
+
+        other = os.path.join(self.workdir.name, "other")
+        os.makedirs(other)
+        subprocess.run(["git", "init", "-q", other], check=True)
+        cache.get(other)
+        self.assertEqual(list(cache.repos.keys()), [other])
+        self.assertIsNot(cache.get(self.repodir), repo)
+        cache.close()
+        self.assertEqual(len(cache.repos), 0)
+
+    def test_collect_achievements(self):
+        from egtlib.project import Project
+        from egtlib.log import Entry
+        proj = Project.mock(os.path.join(self.repodir, ".egt"), path=self.repodir)
+        proj.statedir = self.workdir.name
+        begin = datetime.datetime.now() - datetime.timedelta(days=1)
+        entry = Entry(begin, None, "head", [], False)
+        egtgit.collect_achievements(proj, entry)
+        self.assertEqual(len(entry.body), 3)
+        self.assertRegex(entry.body[0], r"^ - \[git:[0-9a-f]{9}\] change 0$")
+        self.assertRegex(entry.body[2], r"^ - \[git:[0-9a-f]{9}\] change 2$")
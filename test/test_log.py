@@ -5,6 +5,7 @@ from egtlib import Project
 import io
 import os
 import datetime
+from egtlib import utils
 
 
 class TestLog(ProjectTestMixin, unittest.TestCase):
@@ -151,3 +152,102 @@ class TestLog(ProjectTestMixin, unittest.TestCase):
         self.assertEqual(body_lines[4], " - new entry")
         self.assertEqual(body_lines[5], new_entry_dt3.strftime("%d %B:"))
         self.assertEqual(body_lines[6], " - new day entry")
+
+    def assertSameLog(self, log1, log2):
+        with io.StringIO() as out1:
+            log1.print(out1)
+            with io.StringIO() as out2:
+                log2.print(out2)
+                self.assertEqual(out1.getvalue(), out2.getvalue())
+
+    def testFrozenNow(self):
+        """
+        New entries are dated with the current time of the command
+        """
+        proj = Project("/test/.egt")
+        proj.load(fd=io.StringIO("2015\n15 march: 9:00-12:00\n - tested things\n8:00\n - new entry\n+\n - new day entry\n"), cache=False)
+        with utils.frozen_now(datetime.datetime(2016, 3, 20, 10, 0)):
+            proj.log.sync()
+        self.assertEqual(proj.log._entries[2].begin, datetime.datetime(2016, 3, 20, 8, 0))
+        self.assertEqual(proj.log._entries[3].begin, datetime.datetime(2016, 3, 20))
+
+    def testIncrementalParse(self):
+        """
+        Test reusing cached log entries when parts of the log did not change
+        """
+        from egtlib import timings
+        log_lines = [
+            "2015",
+            "15 march: 9:00-12:00",
+            " - tested things",
+            "16 march:",
+            " - implemented day logs",
+            "17 march: 10:00-11:00",
+            " - more things",
+        ]
+        self.write_project(log_lines)
+        proj = Project(self.projectfile, statedir=self.workdir.name)
+        proj.load()
+        self.assertEqual(len(proj.log._entries), 4)
+
+        def load_counting_dates():
+            t = timings.enable()
+            try:
+                proj = Project(self.projectfile, statedir=self.workdir.name)
+                proj.load()
+            finally:
+                timings.disable()
+            uncached = Project(self.projectfile, statedir=self.workdir.name)
+            uncached.load(cache=False)
+            self.assertSameLog(proj.log, uncached.log)
+            return proj, t.phases["log.parse_date"][0]
+
+        # Unchanged file: only the last entry is parsed again
+        proj, count = load_counting_dates()
+        self.assertEqual(len(proj.log._entries), 4)
+        self.assertEqual(count, 1)
+
+        # Extend the last entry
+        self.write_project(log_lines + [" - and even more"])
+        proj, count = load_counting_dates()
+        self.assertEqual(count, 1)
+        self.assertEqual(proj.log._entries[3].body, [" - more things", " - and even more"])
+
+        # Append a new entry
+        self.write_project(log_lines + [" - and even more", "18 march: 10:00-12:00", " - new"])
+        proj, count = load_counting_dates()
+        self.assertEqual(count, 2)
+        self.assertEqual(len(proj.log._entries), 5)
+        self.assertEqual(proj.log._entries[4].begin, datetime.datetime(2015, 3, 18, 10))
+
+        # Change the timebase: everything is parsed again
+        self.write_project(["2014"] + log_lines[1:])
+        proj, count = load_counting_dates()
+        self.assertEqual(count, 4)
+        self.assertEqual(proj.log._entries[1].begin, datetime.datetime(2014, 3, 15, 9))
+
+    def testClassify(self):
+        """
+        Test that the fast dispatch in LogParser gives the same results as
+        trying all components in order
+        """
+        from egtlib.log import LogParser, Timebase, Entry, Command
+
+        def reference(line):
+            for c in (Timebase, Entry, Command):
+                mo = c.is_start_line(line)
+                if mo: return c, mo.groupdict()
+            return None, None
+
+        samples = [
+            "2015", "2015 ", "20150", "-", "--", "----- 15 march", "- item",
+            "15 march: 9:00-12:00", "15 march: 9:00-", "15 march:", "15 march: notes",
+            " 5 march: 9:00-10:00", "  5 march:", "\t5 march:", " - body", " + ",
+            "10:00", "10:00-", "10:00-+", "9:30 +", "+", "++", "+ ", "+++",
+            "+tag: 9:00-10:00", "march 15: 9:00-10:00", "lunedì 15 marzo:", "²:",
+            "Name: test", "random text", "x", "1", "12:00: 9:00-10:00",
+        ]
+        for line in samples:
+            with self.subTest(line=line):
+                c, mo = LogParser.classify(line)
+                self.assertEqual((c, mo.groupdict() if mo else None), reference(line))
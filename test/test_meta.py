@@ -0,0 +1,84 @@
+# coding: utf8
+import unittest
+import email
+import io
+import os
+import random
+import tempfile
+from egtlib.meta import Meta, parse_headers
+from egtlib.parse import Lines
+from .benchmark import generate_corpus
+
+
+def email_headers(lines):
+    """
+    Parse header lines with the email package, as Meta used to do
+    """
+    return [(k, v.strip()) for k, v in email.message_from_string("\n".join(lines)).items()]
+
+
+def header_lines(pathname):
+    """
+    Return the lines at the start of a file that Meta.parse would read
+    """
+    res = []
+    with Lines(pathname) as lines:
+        while True:
+            line = lines.next()
+            if not line: break
+            res.append(line)
+    return res
+
+
+class TestMeta(unittest.TestCase):
+    def assertSameAsEmail(self, lines):
+        self.assertEqual(parse_headers(lines), email_headers(lines), repr(lines))
+
+    def testParse(self):
+        meta = Meta()
+        with Lines("test", fd=io.BytesIO(b"Name: test\nTAGS: foo, bar\tbaz\nBackup: docs\n archive\n\t more\n\nbody\n")) as lines:
+            meta.parse(lines)
+        self.assertEqual(meta.get("name"), "test")
+        self.assertEqual(meta.tags, {"foo", "bar", "baz"})
+        self.assertEqual(meta.get("backup"), "docs\n archive\n\t more")
+
+    def testEdgeCases(self):
+        for lines in (
+            [],
+            ["Name: foo"],
+            ["Name:foo", "Name:   bar  "],
+            ["Backup:", " docs", " archive"],
+            [" continuation first", "Name: foo"],
+            ["From someone", "Name: foo"],
+            ["Name: foo", "From someone", " continued", "Tags: a"],
+            [": no name", " continued", "Name: foo"],
+            ["Name: foo", "not a header", "Tags: a"],
+            ["Name: foo", "Space Name: bar"],
+            ["Nàme: foo", "Tags: a"],
+            ["Name: foo\rTags: a\r\n continued", "Lang: it"],
+            ["Name: foo\r\rTags: a"],
+            ["Name: foo: bar", "Tags:"],
+        ):
+            self.assertSameAsEmail(lines)
+
+    def testRandom(self):
+        rnd = random.Random(0)
+        pieces = ["Name", "Tags", "Backup", "From", " ", "\t", ":", "\r", "x", "è", ",", "-", "From "]
+        for i in range(2000):
+            lines = []
+            for j in range(rnd.randint(1, 5)):
+                lines.append("".join(rnd.choice(pieces) for k in range(rnd.randint(1, 6))))
+            self.assertSameAsEmail(lines)
+
+    def testCorpus(self):
+        """
+        Compare with the email package on all project files used in tests
+        """
+        testdata = os.path.join(os.path.dirname(__file__), "testdata")
+        fnames = []
+        for root, dirs, files in os.walk(testdata):
+            fnames.extend(os.path.join(root, f) for f in files)
+        with tempfile.TemporaryDirectory() as workdir:
+            fnames.extend(generate_corpus(workdir, projects=20, entries=2))
+            for fname in fnames:
+                self.assertSameAsEmail(header_lines(fname))
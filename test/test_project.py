@@ -1,7 +1,80 @@
 # coding: utf8
 import unittest
 from .utils import ProjectTestMixin
+from egtlib.project import Project
+from egtlib import utils
+import datetime
+import os
 
 
 class TestProject(ProjectTestMixin, unittest.TestCase):
-    pass
+    def write(self, content):
+        self.projectfile = os.path.join(self.workdir.name, ".egt")
+        with open(self.projectfile, "wt") as fd:
+            fd.write(content)
+
+    def testRewrite(self):
+        self.write("Name: test\n\n2016\n15 march: 9:00-9:30\n - wrote unit tests\n\nbody\n")
+        os.chmod(self.projectfile, 0o600)
+
+        # Serializing adds the entry duration
+        proj = Project.from_file(self.projectfile, statedir=self.workdir.name)
+        self.assertTrue(proj.rewrite(sync=False))
+        with open(self.projectfile, "rt") as fd:
+            self.assertEqual(fd.read(), "Name: test\n\n2016\n15 march: 9:00-9:30 0h 30m\n - wrote unit tests\n\nbody\n")
+        self.assertEqual(os.stat(self.projectfile).st_mode & 0o777, 0o600)
+
+        # Rewriting unchanged contents leaves the file alone
+        os.utime(self.projectfile, (1000000000, 1000000000))
+        proj = Project.from_file(self.projectfile, statedir=self.workdir.name)
+        self.assertFalse(proj.rewrite())
+        self.assertEqual(os.stat(self.projectfile).st_mtime, 1000000000)
+
+        # A change of the same size is detected
+        proj.body.content[0].line = "BODY"
+        self.assertTrue(proj.rewrite())
+        with open(self.projectfile, "rt") as fd:
+            self.assertTrue(fd.read().endswith("\nBODY\n"))
+
+    def testMemoized(self):
+        self.write("Name: test\nTags: foo\n\n2016\n15 march: 9:00-9:30\n - wrote unit tests\n16 march: 10:00-\n - still at it\n\nbody\n")
+        proj = Project.from_file(self.projectfile, statedir=self.workdir.name)
+        self.assertEqual(proj.tags, {"foo"})
+        self.assertEqual(proj.log.entry_count, 2)
+
+        with utils.frozen_now(datetime.datetime(2016, 3, 16, 12, 0)) as now:
+            self.assertEqual(proj.elapsed, 150)
+            self.assertEqual(proj.last_updated, now)
+            self.assertEqual(proj.formal_period, (datetime.date(2016, 3, 15), datetime.date(2016, 3, 16)))
+
+            # Values are computed only once
+            proj._compute_elapsed = lambda: self.fail("elapsed computed again")
+            self.assertEqual(proj.elapsed, 150)
+            del proj._compute_elapsed
+
+            # Changes to the metadata and the log invalidate memoized values
+            proj.meta.set("end-date", "2016-04-01")
+            self.assertEqual(proj.formal_period, (datetime.date(2016, 3, 15), datetime.date(2016, 4, 1)))
+            proj.meta.set("archived", "yes")
+            proj.archived = True
+            self.assertEqual(proj.name, "test-2016-04-01")
+            proj.log._entries.pop()
+            proj.log.sync()
+            self.assertEqual(proj.elapsed, 30)
+            self.assertEqual(proj.log.entry_count, 1)
+
+        # Outside of frozen_now, values depending on the current time are
+        # not memoized
+        proj.log._entries[-1].until = None
+        proj.log.version += 1
+        self.assertGreater(proj.last_updated, datetime.datetime(2016, 3, 16, 12, 0))
+
+        proj.default_tags.add("bar")
+        self.assertEqual(proj.tags, {"foo", "bar"})
+
+        # tags is a new set that callers can change, tagset is shared
+        tags = proj.tags
+        tags.add("baz")
+        self.assertEqual(proj.tags, {"foo", "bar"})
+        self.assertIs(proj.tagset, proj.tagset)
+        self.assertEqual(proj.tagset, {"foo", "bar"})
@@ -0,0 +1,119 @@
+# coding: utf8
+import unittest
+import datetime
+import io
+import os
+from configparser import ConfigParser
+import egtlib
+from egtlib.query import Query, QueryError, And, Tag, ActiveSince
+from egtlib.egt import ProjectFilter
+from egtlib.project import Project
+from egtlib.state import State
+from egtlib import utils
+from .utils import ProjectTestMixin
+
+
+class TestQuery(unittest.TestCase):
+    def setUp(self):
+        self.foo = Project.mock("/home/user/work/foo/.egt", name="foo", tags={"work", "debian"})
+        self.bar = Project.mock("/home/user/bar/.egt", name="bar", tags={"home"})
+        self.old = Project.mock("/home/user/work/old/.egt", name="foo", tags={"work"})
+        self.old.meta.set("end-date", "2015-01-01")
+        self.old.archived = True
+
+    def select(self, *args):
+        q = Query(args)
+        return [p.name for p in (self.foo, self.bar, self.old) if q.match(p)]
+
+    def test_terms(self):
+        self.assertEqual(self.select("tag:work"), ["foo", "foo-2015-01-01"])
+        self.assertEqual(self.select("+work"), ["foo", "foo-2015-01-01"])
+        self.assertEqual(self.select("-work"), ["bar"])
+        self.assertEqual(self.select("name:foo"), ["foo"])
+        self.assertEqual(self.select("name:foo*"), ["foo", "foo-2015-01-01"])
+        self.assertEqual(self.select("group:foo"), ["foo", "foo-2015-01-01"])
+        self.assertEqual(self.select("path:/home/user/work"), ["foo", "foo-2015-01-01"])
+        self.assertEqual(self.select("path:/home/user/*/foo"), ["foo"])
+        self.assertEqual(self.select("archived"), ["foo-2015-01-01"])
+
+    def test_operators(self):
+        self.assertEqual(self.select("tag:work and not archived"), ["foo"])
+        self.assertEqual(self.select("tag:work", "not", "archived"), ["foo"])
+        self.assertEqual(self.select("tag:home or tag:debian"), ["foo", "bar"])
+        self.assertEqual(self.select("tag:home or tag:work and archived"), ["bar", "foo-2015-01-01"])
+        self.assertEqual(self.select("(tag:home or tag:work) and not archived"), ["foo", "bar"])
+        self.assertEqual(self.select("not (tag:home or archived)"), ["foo"])
+        self.assertEqual(self.select('path:"/home/user/work"'), ["foo", "foo-2015-01-01"])
+
+    def test_active_since(self):
+        p = Project("/test/.egt")
+        p.load(fd=io.StringIO("2016\n15 march: 9:00-10:00\n - test\n"), cache=False)
+        with utils.frozen_now(datetime.datetime(2016, 4, 1)):
+            self.assertTrue(Query(["active-since:2016-03"]).match(p))
+            self.assertTrue(Query(["active-since:2016"]).match(p))
+            self.assertFalse(Query(["active-since:2016-03-16"]).match(p))
+
+    def test_cost(self):
+        # Checks that need the log are done last
+        q = Query(["active-since:2016-01 and tag:foo"])
+        self.assertIsInstance(q.root, And)
+        self.assertIsInstance(q.root.nodes[0], Tag)
+        self.assertIsInstance(q.root.nodes[1], ActiveSince)
+
+    def test_match_info(self):
+        q = Query(["tag:work and not archived and active-since:2016"])
+        self.assertIsNone(q.match_info({"tags": {"work"}, "archived": False}))
+        self.assertFalse(q.match_info({"tags": {"work"}, "archived": True}))
+        self.assertFalse(q.match_info({"tags": set()}))
+        self.assertIsNone(q.match_info({}))
+        self.assertTrue(Query(["name:foo or active-since:2016"]).match_info({"name": "foo"}))
+
+    def test_errors(self):
+        for args in (["tag:"], ["(tag:foo"], ["tag:foo )"], ["not"], ["active-since:march"], ["and"]):
+            with self.assertRaises(QueryError, msg=args):
+                Query(args)
+
+    def test_filter(self):
+        self.assertIsNone(ProjectFilter(["foo", "+bar"]).query)
+        self.assertIsNotNone(ProjectFilter(["tag:bar"]).query)
+        self.assertIsNotNone(ProjectFilter(["foo", "or", "bar"]).query)
+        # Keywords on their own are project names
+        for args in (["or"], ["and"], ["not"], ["or", "+work"], ["foo", "and"]):
+            self.assertFalse(Query.is_query(args), msg=args)
+        self.assertEqual(ProjectFilter(["or"]).names, {"or"})
+        self.assertTrue(Query.is_query(["not", "archived"]))
+        self.assertTrue(Query.is_query(["+work and -home"]))
+        f = ProjectFilter(["foo", "+work"])
+        self.assertTrue(f.matches_info({"name": "foo", "tags": {"work"}}))
+        self.assertFalse(f.matches_info({"name": "bar", "tags": {"work"}}))
+        self.assertIsNone(f.matches_info({"name": "foo"}))
+
+
+class TestQueryLoad(ProjectTestMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        for name, tags in (("p1", "work"), ("p2", "home"), ("p3", "work, home")):
+            with open(os.path.join(self.workdir.name, name + ".egt"), "wt") as fd:
+                fd.write("Name: {}\nTags: {}\n\n2016\n15 march: 9:00-10:00\n - test\n".format(name, tags))
+        State.rescan([self.workdir.name], statedir=self.workdir.name)
+
+    def test_skip_loading(self):
+        e = egtlib.Egt(config=ConfigParser(), filter=["tag:work and not tag:home"], statedir=self.workdir.name)
+        loaded = []
+        orig = e.load_project
+
+        def load_project(fname, project_fd=None):
+            loaded.append(os.path.basename(fname))
+            return orig(fname, project_fd=project_fd)
+        e.load_project = load_project
+        self.assertEqual([p.name for p in e.projects], ["p1"])
+        self.assertEqual(loaded, ["p1.egt"])
+
+    def test_changed_file(self):
+        # Projects changed after the scan are loaded to check them
+        fname = os.path.join(self.workdir.name, "p2.egt")
+        with open(fname, "wt") as fd:
+            fd.write("Name: p2\nTags: work\n\n2016\n15 march: 9:00-10:00\n - test\n")
+        os.utime(fname, (1000000000, 1000000000))
+        e = egtlib.Egt(config=ConfigParser(), filter=["tag:work and not tag:home"], statedir=self.workdir.name)
+        self.assertEqual([p.name for p in e.projects], ["p1", "p2"])
@@ -1,7 +1,10 @@
 import unittest
 import os
 import os.path
+import tempfile
+from unittest import mock
 from egtlib import scan
+from egtlib.scan import IgnorePatterns
 
 basedir = os.path.dirname(__file__)
 if not basedir: basedir = os.getcwd()
@@ -25,3 +28,93 @@ class TestScan(unittest.TestCase):
             "onedir/wibble.egt",
             "onedir/wobble.egt",
         ])
+
+
+class TestScanPruning(unittest.TestCase):
+    """
+    Test skipping parts of the tree
+    """
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.root = self.workdir.name
+        for name in ("a/a.egt", "a/build/b.egt", "a/keep/c.egt", "b/deep/er/d.egt", "b/e.egt", "f.egt"):
+            fname = os.path.join(self.root, name)
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
+            with open(fname, "wt") as fd:
+                fd.write("Name: {}\n".format(name))
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def scan(self, **kw):
+        return sorted(x[len(self.root) + 1:] for x in scan(self.root, **kw))
+
+    def test_all(self):
+        self.assertEqual(self.scan(), ["a/a.egt", "a/build/b.egt", "a/keep/c.egt", "b/deep/er/d.egt", "b/e.egt", "f.egt"])
+
+    def test_egtignore(self):
+        with open(os.path.join(self.root, "a", ".egtignore"), "wt") as fd:
+            fd.write("# comment\nbuild/\n*.egt\n!c.egt\n")
+        with open(os.path.join(self.root, ".egtignore"), "wt") as fd:
+            fd.write("/b/deep\n")
+        self.assertEqual(self.scan(), ["a/keep/c.egt", "b/e.egt", "f.egt"])
+
+    def test_excludes(self):
+        self.assertEqual(self.scan(excludes=["deep"]), ["a/a.egt", "a/build/b.egt", "a/keep/c.egt", "b/e.egt", "f.egt"])
+        self.assertEqual(self.scan(excludes=["/a"]), ["b/deep/er/d.egt", "b/e.egt", "f.egt"])
+        # Patterns with a slash are anchored to the top of the scan
+        self.assertEqual(self.scan(excludes=["a/keep"]), ["a/a.egt", "a/build/b.egt", "b/deep/er/d.egt", "b/e.egt", "f.egt"])
+        self.assertEqual(self.scan(excludes=["deep/er"]), ["a/a.egt", "a/build/b.egt", "a/keep/c.egt", "b/deep/er/d.egt", "b/e.egt", "f.egt"])
+        self.assertEqual(self.scan(excludes=["**/er/*.egt"]), ["a/a.egt", "a/build/b.egt", "a/keep/c.egt", "b/e.egt", "f.egt"])
+
+    def test_max_depth(self):
+        self.assertEqual(self.scan(max_depth=0), ["f.egt"])
+        self.assertEqual(self.scan(max_depth=1), ["a/a.egt", "b/e.egt", "f.egt"])
+
+    def test_loops(self):
+        os.symlink(self.root, os.path.join(self.root, "b", "loop"))
+        os.symlink(os.path.join(self.root, "a"), os.path.join(self.root, "alias"))
+        res = self.scan()
+        self.assertEqual(len(res), 6)
+        self.assertEqual(sorted(os.path.basename(x) for x in res), ["a.egt", "b.egt", "c.egt", "d.egt", "e.egt", "f.egt"])
+
+    def test_one_file_system(self):
+        orig_stat = os.stat
+
+        def fake_stat(path, *args, **kw):
+            st = orig_stat(path, *args, **kw)
+            if os.path.basename(path) == "b":
+                # Pretend b is a mount point
+                return os.stat_result((st.st_mode, st.st_ino, st.st_dev + 1) + tuple(st)[3:])
+            return st
+        with mock.patch("os.stat", fake_stat):
+            self.assertEqual(self.scan(one_file_system=True), ["a/a.egt", "a/build/b.egt", "a/keep/c.egt", "f.egt"])
+            self.assertEqual(len(self.scan()), 6)
+
+
+class TestIgnorePatterns(unittest.TestCase):
+    def match(self, pattern, path, is_dir=False):
+        return IgnorePatterns([pattern], "/base").match("/base/" + path, is_dir)
+
+    def test_patterns(self):
+        self.assertTrue(self.match("foo", "foo"))
+        self.assertTrue(self.match("foo", "a/b/foo"))
+        self.assertIsNone(self.match("foo", "foobar"))
+        self.assertIsNone(self.match("/foo", "a/foo"))
+        self.assertTrue(self.match("a/foo", "a/foo"))
+        self.assertIsNone(self.match("a/foo", "b/a/foo"))
+        self.assertIsNone(self.match("foo/", "foo"))
+        self.assertTrue(self.match("foo/", "foo", True))
+        self.assertTrue(self.match("*.egt", "a/b.egt"))
+        self.assertIsNone(self.match("a/*.egt", "a/b/c.egt"))
+        self.assertTrue(self.match("a/**/c.egt", "a/b/d/c.egt"))
+        self.assertTrue(self.match("a/**/c.egt", "a/c.egt"))
+        self.assertTrue(self.match("a/**", "a/b/c"))
+        self.assertTrue(self.match("?.egt", "x.egt"))
+        self.assertTrue(self.match("[ab].egt", "b.egt"))
+        self.assertIsNone(self.match("[!ab].egt", "b.egt"))
+        self.assertTrue(self.match("a.b", "a.b"))
+        self.assertIsNone(self.match("a.b", "axb"))
+        self.assertFalse(self.match("!foo", "foo"))
+        self.assertIsNone(IgnorePatterns(["foo"], "/base").match("/other/foo", False))
+        self.assertIsNone(self.match("# foo", "# foo"))
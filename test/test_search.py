@@ -0,0 +1,70 @@
+# coding: utf8
+import unittest
+import os
+from .utils import ProjectTestMixin
+from egtlib.search import SearchIndex
+
+
+class TestSearch(ProjectTestMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.p1 = os.path.join(self.workdir.name, "p1.egt")
+        with open(self.p1, "wt") as fd:
+            fd.write("Name: first\nTags: search\n\n2016\n15 march: 9:00-9:30\n - wrote parser\n\nremember the parser\n")
+        self.p2 = os.path.join(self.workdir.name, "p2.egt")
+        with open(self.p2, "wt") as fd:
+            fd.write("Name: second\n\nparsers everywhere\n")
+        self.index = SearchIndex(self.workdir.name)
+        self.indexed = []
+        orig = self.index.index_file
+
+        def index_file(fname, st, statedir=None):
+            self.indexed.append(fname)
+            orig(fname, st, statedir=statedir)
+        self.index.index_file = index_file
+
+    def tearDown(self):
+        self.index.close()
+        super().tearDown()
+
+    def search(self, *terms, **kw):
+        return [(name, lineno, section, text) for name, abspath, lineno, section, text in self.index.search(terms, **kw)]
+
+    def test_search(self):
+        self.index.update([self.p1, self.p2], statedir=self.workdir.name)
+        self.assertEqual(self.search("parser"), [
+            ("first", 6, "log", "- wrote parser"),
+            ("first", 8, "body", "remember the parser"),
+        ])
+        self.assertEqual(self.search("parser*"), [
+            ("first", 6, "log", "- wrote parser"),
+            ("first", 8, "body", "remember the parser"),
+            ("second", 3, "body", "parsers everywhere"),
+        ])
+        self.assertEqual(self.search("parser", "remember"), [("first", 8, "body", "remember the parser")])
+        self.assertEqual(self.search("search"), [("first", 2, "meta", "Tags: search")])
+        self.assertEqual(self.search("parser", sections=["log"]), [("first", 6, "log", "- wrote parser")])
+        self.assertEqual(self.search("parser*", fnames=[self.p2]), [("second", 3, "body", "parsers everywhere")])
+        # Query syntax is not interpreted
+        self.assertEqual(self.search('"parser" OR'), [])
+
+    def test_incremental(self):
+        self.index.update([self.p1, self.p2], statedir=self.workdir.name)
+        self.assertEqual(sorted(self.indexed), [self.p1, self.p2])
+
+        # Unchanged files are not indexed again
+        self.indexed = []
+        self.index.update([self.p1, self.p2], statedir=self.workdir.name)
+        self.assertEqual(self.indexed, [])
+
+        with open(self.p2, "at") as fd:
+            fd.write("new notes\n")
+        os.utime(self.p2, (1000000000, 1000000000))
+        self.index.update([self.p1, self.p2], statedir=self.workdir.name)
+        self.assertEqual(self.indexed, [self.p2])
+        self.assertEqual(self.search("notes"), [("second", 4, "body", "new notes")])
+
+        # Removed files are removed from the index
+        os.unlink(self.p2)
+        self.index.update([self.p1, self.p2], statedir=self.workdir.name)
+        self.assertEqual(self.search("notes"), [])
@@ -0,0 +1,44 @@
+# coding: utf8
+import unittest
+import json
+import os
+import sqlite3
+from .utils import ProjectTestMixin
+from egtlib.statestore import ProjectStateStore
+from egtlib.project import Project
+
+
+class TestStateStore(ProjectTestMixin, unittest.TestCase):
+    def test_migrate(self):
+        pathname = os.path.join(self.workdir.name, "project-testprj.json")
+        with open(pathname, "wt") as fd:
+            json.dump({"tasks": {"ids": {"1": "uuid1"}}}, fd)
+
+        p = Project.mock(os.path.join(self.workdir.name, ".egt"), name="testprj")
+        p.statedir = self.workdir.name
+        self.assertEqual(p.state.get("tasks"), {"ids": {"1": "uuid1"}})
+        self.assertFalse(os.path.exists(pathname))
+        # The old file is kept, for downgrades
+        with open(pathname + ".migrated", "rt") as fd:
+            self.assertEqual(json.load(fd), {"tasks": {"ids": {"1": "uuid1"}}})
+
+    def test_save(self):
+        p = Project.mock(os.path.join(self.workdir.name, ".egt"), name="testprj")
+        p.statedir = self.workdir.name
+        p.state.set("tasks", {"ids": {"2": "uuid2"}})
+        self.assertEqual(p.state.get("tasks"), {"ids": {"2": "uuid2"}})
+
+        # Changes are committed right away, and do not keep the database
+        # locked for other processes
+        db = sqlite3.connect(os.path.join(self.workdir.name, "projects.sqlite"), timeout=0)
+        try:
+            row = db.execute("SELECT state FROM project_state WHERE name='testprj'").fetchone()
+            self.assertEqual(json.loads(row[0]), {"tasks": {"ids": {"2": "uuid2"}}})
+            db.execute("INSERT OR REPLACE INTO project_state (name, state) VALUES ('other', '{}')")
+            db.commit()
+        finally:
+            db.close()
+
+        self.assertEqual(ProjectStateStore.get(self.workdir.name).load("other"), {})
+        p.state.set("tasks", {"ids": {}})
+        self.assertEqual(sorted(ProjectStateStore.get(self.workdir.name).load_all()), ["other", "testprj"])
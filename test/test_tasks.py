@@ -2,6 +2,14 @@
 import unittest
 from .utils import ProjectTestMixin
 from egtlib import Project
+from egtlib.statestore import ProjectStateStore
+from egtlib.taskwarrior import AsyncTaskWarrior, run_coroutine
+from unittest import mock
+from taskw.warrior import LooseVersion
+import taskw
+import asyncio
+import shutil
+import uuid
 import io
 import os
 import json
@@ -72,13 +80,43 @@ class TestTasks(ProjectTestMixin, unittest.TestCase):
         self.assertRegex(body_lines[2], r"^  t\d+ \[[^]]+\] new taskwarrior task \+tag$")
         self.assertEqual(body_lines[3], "body line3")
 
-        with open(os.path.join(self.workdir.name, "project-testprj.json"), "rt") as fd:
-            state = json.load(fd)
+        state = ProjectStateStore.get(self.workdir.name).load("testprj")
         tasks = state["tasks"]
         ids = tasks["ids"]
         self.assertEqual(len(ids), 2)
         self.assertEqual(ids[str(task.task["id"])], str(task.task["uuid"]))
 
+    def testCreateBatch(self):
+        """
+        Test creation of several new taskwarrior tasks with one import
+        """
+        self.write_project([
+            "t first task +tag",
+            "t second task",
+            "t third task due:2031-01-02",
+        ])
+        proj = Project(self.projectfile, statedir=self.workdir.name)
+        proj.body.force_load_tw(config_filename=self.taskrc)
+        proj.load()
+
+        self.assertEqual([t.can_import for t in proj.body.tasks], [True, True, False])
+
+        proj.body.sync_tasks()
+
+        ids = set()
+        for task in proj.body.tasks:
+            self.assertFalse(task.is_new)
+            self.assertIsNotNone(task.id)
+            self.assertEqual(task.task["project"], "testprj")
+            ids.add(task.id)
+        self.assertEqual(len(ids), 3)
+        self.assertEqual(proj.body.tasks[0].task["description"], "first task")
+        self.assertEqual(proj.body.tasks[0].task["tags"], ["tag", "testtag1", "testtag2"])
+        self.assertEqual(proj.body.tasks[1].task["description"], "second task")
+
+        state = ProjectStateStore.get(self.workdir.name).load("testprj")
+        self.assertEqual(len(state["tasks"]["ids"]), 3)
+
     def testCreateFromEgtWithAttributes(self):
         """
         Test creation of new taskwarrior tasks with attributes from a project file
@@ -166,8 +204,7 @@ class TestTasks(ProjectTestMixin, unittest.TestCase):
         self.assertEqual(body_lines[3], "body line1")
         self.assertEqual(body_lines[4], "body line2")
 
-        with open(os.path.join(self.workdir.name, "project-testprj.json"), "rt") as fd:
-            state = json.load(fd)
+        state = ProjectStateStore.get(self.workdir.name).load("testprj")
         tasks = state["tasks"]
         ids = tasks["ids"]
         self.assertEqual(len(ids), 2)
@@ -237,8 +274,7 @@ class TestTasks(ProjectTestMixin, unittest.TestCase):
         self.assertRegex(body_lines[1], r"^ t\d+ \[[^]]+\] task \+tag$")
         self.assertEqual(body_lines[2], "body line3")
 
-        with open(os.path.join(self.workdir.name, "project-testprj.json"), "rt") as fd:
-            state = json.load(fd)
+        state = ProjectStateStore.get(self.workdir.name).load("testprj")
         tasks = state["tasks"]
         ids = tasks["ids"]
         self.assertEqual(len(ids), 1)
@@ -314,8 +350,165 @@ class TestTasks(ProjectTestMixin, unittest.TestCase):
         self.assertRegex(body_lines[1], r"^ - \[[^]]+\] task \+tag$")
         self.assertEqual(body_lines[2], "body line3")
 
-        with open(os.path.join(self.workdir.name, "project-testprj.json"), "rt") as fd:
-            state = json.load(fd)
+        state = ProjectStateStore.get(self.workdir.name).load("testprj")
         tasks = state["tasks"]
         ids = tasks["ids"]
         self.assertEqual(len(ids), 0)
+
+
+class FakeTaskDB:
+    """
+    In-memory TaskWarrior database, answering the 'task' commands that
+    AsyncTaskWarrior and taskw run
+    """
+    def __init__(self):
+        self.tasks = []
+
+    def _new(self, fields):
+        task = {"id": len(self.tasks) + 1, "uuid": str(uuid.uuid4()), "status": "pending",
+                "entry": "20160315T090000Z", "modified": "20160315T090000Z"}
+        task.update(fields)
+        self.tasks.append(task)
+        return task
+
+    def _fields(self, args):
+        res = {}
+        for arg in args:
+            key, val = arg.split(":", 1)
+            val = val.strip('"')
+            res[key] = val.split(",") if key == "tags" else val
+        return res
+
+    def _match(self, task, flt):
+        if flt.startswith("project:"):
+            project = flt[8:]
+            return task.get("project") == project or task.get("project", "").startswith(project + ".")
+        return flt in (task["uuid"], str(task["id"]), task["description"])
+
+    def run(self, args, input=None):
+        args = [str(a) for a in args]
+        if args[0] == "add":
+            return "Created task {}.\n".format(self._new(self._fields(args[1:]))["uuid"])
+        if args[0] == "import":
+            for record in json.loads(input.decode()):
+                self._new(record)
+            return ""
+        if args[-1] == "export":
+            return json.dumps([t for t in self.tasks if not args[:-1] or any(self._match(t, f) for f in args[:-1])])
+        if args[1] == "modify":
+            for t in self.tasks:
+                if self._match(t, args[0]): t.update(self._fields(args[2:]))
+            return ""
+        raise NotImplementedError(" ".join(args))
+
+
+class TestAsyncTaskWarrior(ProjectTestMixin, unittest.TestCase):
+    """
+    Test the parts of AsyncTaskWarrior that do not need to run 'task'
+    """
+    def setUp(self):
+        super().setUp()
+        # Skip asking 'task' for its version
+        patcher = mock.patch.object(AsyncTaskWarrior, "_version", LooseVersion("2.6.2"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tw = AsyncTaskWarrior(marshal=True, config_filename=self.taskrc)
+
+    def stub_task(self):
+        """
+        Answer 'task' commands with a FakeTaskDB
+        """
+        db = FakeTaskDB()
+
+        def execute(tw, *args):
+            return db.run(args), ""
+
+        async def execute_async(tw, semaphore, *args, input=None):
+            return db.run(args, input)
+        for patcher in (mock.patch.object(taskw.TaskWarriorShellout, "_execute", execute),
+                        mock.patch.object(AsyncTaskWarrior, "_execute_async", execute_async)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return db
+
+    def test_annotate_all_new_task(self):
+        # A single new task is created with task_add after a snapshot, as
+        # annotate --all does
+        db = self.stub_task()
+        db._new({"description": "other task", "project": "other"})
+        projectfile = os.path.join(self.workdir.name, ".egt")
+        with open(projectfile, "wt") as fd:
+            print("Name: testprj\n\nt new task", file=fd)
+        proj = Project(projectfile, statedir=self.workdir.name)
+        proj.load()
+        self.tw.snapshot()
+        proj.body._tw = self.tw
+        proj.body.sync_tasks()
+
+        task = proj.body.tasks[0]
+        self.assertFalse(task.is_new)
+        self.assertEqual(task.id, 2)
+        self.assertEqual(task.task["project"], "testprj")
+        self.assertEqual([t["description"] for t in self.tw.filter_tasks({"project": "testprj"})], ["new task"])
+
+    def test_changes_after_snapshot(self):
+        db = self.stub_task()
+        old = db._new({"description": "old description", "project": "foo"})
+        self.tw.snapshot()
+        self.assertEqual([t["description"] for t in self.tw.filter_tasks({"project": "foo"})], ["old description"])
+
+        # Changes made through the client are seen by later lookups
+        self.tw.task_update({"uuid": old["uuid"], "description": "new description"})
+        self.assertEqual(self.tw.get_task(uuid=old["uuid"])[1]["description"], "new description")
+        self.assertEqual([t["description"] for t in self.tw.filter_tasks({"project": "foo"})], ["new description"])
+
+        self.tw.import_tasks([{"description": "imported", "project": "foo"}])
+        self.assertEqual(sorted(t["description"] for t in self.tw.filter_tasks({"project": "foo"})), ["imported", "new description"])
+
+    def test_filter_snapshot(self):
+        tasks = [
+            {"uuid": "a", "project": "foo", "description": "a"},
+            {"uuid": "b", "project": "foo.sub", "description": "b"},
+            {"uuid": "c", "project": "foobar", "description": "c"},
+            {"uuid": "d", "description": "d"},
+        ]
+        self.tw._remember(tasks)
+        self.tw._complete = True
+        self.assertEqual(sorted(t["uuid"] for t in self.tw.filter_tasks({"project": "foo"})), ["a", "b"])
+        self.assertEqual([t["uuid"] for t in self.tw.filter_tasks({"project": "foobar"})], ["c"])
+        self.assertEqual([t["uuid"] for t in self.tw.filter_tasks({"project": "foo.sub"})], ["b"])
+
+    def test_backend(self):
+        # Bodies use the 'task' command, whatever taskw.TaskWarrior is
+        projectfile = os.path.join(self.workdir.name, ".egt")
+        with open(projectfile, "wt") as fd:
+            print("Name: testprj", file=fd)
+        proj = Project(projectfile, statedir=self.workdir.name)
+        proj.body.force_load_tw(config_filename=self.taskrc)
+        self.assertIsInstance(proj.body.tw, AsyncTaskWarrior)
+        self.assertIsInstance(proj.body.tw, taskw.TaskWarriorShellout)
+
+    def test_run_coroutine(self):
+        async def answer():
+            return 42
+        self.assertEqual(run_coroutine(answer()), 42)
+
+        # It also works when called from code running in an event loop
+        async def nested():
+            return run_coroutine(answer())
+        self.assertEqual(asyncio.run(nested()), 42)
+
+    def test_decode_output(self):
+        self.assertEqual(self.tw._decode_output("caffè\a\x1b[1m".encode("utf-8")), "caffè??[1m")
+        self.assertEqual(self.tw._decode_output(b"caff\xe8"), "caff\ufffd")
+
+    @unittest.skipUnless(shutil.which("task"), "needs the 'task' command")
+    def test_import_snapshot(self):
+        tasks = self.tw.import_tasks([
+            {"description": "first", "project": "foo"},
+            {"description": "second", "project": "foobar"},
+        ])
+        self.assertEqual([t["description"] for t in tasks], ["first", "second"])
+        self.tw.snapshot()
+        self.assertEqual([t["description"] for t in self.tw.filter_tasks({"project": "foo"})], ["first"])
+        self.assertEqual(self.tw.get_task(uuid=tasks[1]["uuid"])[1]["description"], "second")
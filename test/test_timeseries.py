@@ -0,0 +1,49 @@
+# coding: utf8
+import unittest
+import datetime
+import io
+from egtlib.timeseries import TimeSeries, ActivitySeries
+from egtlib.project import Project
+
+
+class TestTimeSeries(unittest.TestCase):
+    def test_total(self):
+        d = datetime.date
+        ts = TimeSeries({
+            d(2016, 3, 1): (1, 60),
+            d(2016, 3, 3): (2, 90),
+            d(2016, 3, 10): (1, 30),
+        })
+        self.assertEqual(ts.first_day, d(2016, 3, 1))
+        self.assertEqual(ts.last_day, d(2016, 3, 10))
+        self.assertEqual(ts.total(d(2016, 3, 1), d(2016, 3, 10)), (4, 180))
+        self.assertEqual(ts.total(d(2016, 2, 1), d(2016, 4, 1)), (4, 180))
+        self.assertEqual(ts.total(d(2016, 3, 2), d(2016, 3, 3)), (2, 90))
+        self.assertEqual(ts.total(d(2016, 3, 4), d(2016, 3, 9)), (0, 0))
+        self.assertEqual(ts.total(d(2016, 3, 10), d(2016, 3, 10)), (1, 30))
+        self.assertEqual(ts.total(d(2016, 4, 1), d(2016, 4, 30)), (0, 0))
+        self.assertEqual(ts.total(d(2016, 3, 5), d(2016, 3, 1)), (0, 0))
+
+        self.assertEqual(list(ts.rolling(3, d(2016, 3, 4), 2)), [
+            (d(2016, 3, 1), d(2016, 3, 3), 3, 150),
+            (d(2016, 3, 2), d(2016, 3, 4), 2, 90),
+        ])
+
+        empty = TimeSeries()
+        self.assertIsNone(empty.first_day)
+        self.assertEqual(empty.total(d(2016, 3, 1), d(2016, 3, 10)), (0, 0))
+
+    def test_activity(self):
+        projects = []
+        for name, tags, log in (
+                ("foo", "work, debian", "15 march: 9:00-10:00\n16 march: 9:00-11:00"),
+                ("bar", "work", "15 march: 9:00-12:00")):
+            p = Project("/test/{}.egt".format(name))
+            p.load(fd=io.StringIO("Name: {}\nTags: {}\n\n2016\n{}\n".format(name, tags, log)), cache=False)
+            projects.append(p)
+        activity = ActivitySeries(projects)
+        day = datetime.date(2016, 3, 15)
+        self.assertEqual(activity.total.total(day, day), (2, 240))
+        self.assertEqual(activity.projects["foo"].total(day, day + datetime.timedelta(days=1)), (2, 180))
+        self.assertEqual(activity.tags["work"].total(day, day), (2, 240))
+        self.assertEqual(activity.tags["debian"].total(day, day), (1, 60))
@@ -0,0 +1,32 @@
+# coding: utf8
+import unittest
+import io
+from egtlib import timings
+
+
+class TestTimings(unittest.TestCase):
+    def tearDown(self):
+        timings.disable()
+
+    def test_disabled(self):
+        timings.disable()
+        with timings.phase("foo"):
+            pass
+        self.assertIsNone(timings.active)
+
+    def test_enabled(self):
+        t = timings.enable()
+        with timings.phase("foo"):
+            pass
+        with timings.phase("foo"):
+            pass
+        with timings.phase("bar"):
+            pass
+        self.assertEqual(t.phases["foo"][0], 2)
+        self.assertEqual(t.phases["bar"][0], 1)
+
+        with io.StringIO() as out:
+            t.report(out)
+            lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith("phase"))
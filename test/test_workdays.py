@@ -0,0 +1,85 @@
+# coding: utf8
+import unittest
+import datetime
+import io
+from configparser import ConfigParser, RawConfigParser
+from egtlib.workdays import WorkdayCalendar
+from egtlib.egt import WeeklyReport
+from egtlib.project import Project
+
+
+class TestWorkdays(unittest.TestCase):
+    def test_weekends(self):
+        d = datetime.date
+        cal = WorkdayCalendar()
+        # 2016-03-14 is a Monday
+        self.assertEqual(cal.workdays(d(2016, 3, 14), d(2016, 3, 20)), 5)
+        self.assertEqual(cal.workdays(d(2016, 3, 19), d(2016, 3, 20)), 0)
+        self.assertEqual(cal.workdays(d(2016, 3, 14), d(2016, 3, 14)), 1)
+        self.assertEqual(cal.workdays(d(2016, 3, 15), d(2016, 3, 14)), 0)
+        # Ranges across years extend the cumulative counts
+        self.assertEqual(cal.workdays(d(2015, 12, 28), d(2016, 1, 3)), 5)
+        self.assertEqual(cal.workdays(d(2014, 1, 1), d(2017, 12, 31)),
+                         sum(1 for o in range(d(2014, 1, 1).toordinal(), d(2017, 12, 31).toordinal() + 1)
+                             if datetime.date.fromordinal(o).weekday() < 5))
+
+        cal = WorkdayCalendar(weekend=(4, 5))
+        self.assertEqual(cal.workdays(d(2016, 3, 14), d(2016, 3, 20)), 5)
+        self.assertFalse(cal.is_workday(d(2016, 3, 18)))
+        self.assertTrue(cal.is_workday(d(2016, 3, 20)))
+
+    def test_holidays(self):
+        d = datetime.date
+        cal = WorkdayCalendar(holidays=[d(2016, 3, 15)], yearly_holidays=[(12, 25)])
+        self.assertEqual(cal.workdays(d(2016, 3, 14), d(2016, 3, 20)), 4)
+        self.assertFalse(cal.is_workday(d(2017, 12, 25)))
+        self.assertEqual(cal.workdays(d(2017, 12, 25), d(2017, 12, 29)), 4)
+
+    def test_config(self):
+        d = datetime.date
+        config = ConfigParser()
+        config.read_string("[config]\nweekend = fri, sat\n[holidays]\n2016-03-15 =\n12-25 = Christmas\nfoo =\n")
+        with self.assertLogs("egtlib.workdays", "WARNING"):
+            cal = WorkdayCalendar.from_config(config)
+        self.assertEqual(cal.weekend, {4, 5})
+        self.assertEqual(cal.holidays, {d(2016, 3, 15)})
+        self.assertEqual(cal.yearly_holidays, {(12, 25)})
+
+        # Keys from [DEFAULT] are not holidays
+        config = RawConfigParser()
+        config.read_string("[DEFAULT]\n2016-01-01 = not a holiday\n[holidays]\n2016-03-15 = Some holiday\n")
+        cal = WorkdayCalendar.from_config(config)
+        self.assertEqual(cal.holidays, {d(2016, 3, 15)})
+        self.assertEqual(cal.yearly_holidays, set())
+
+        cal = WorkdayCalendar.from_config(ConfigParser())
+        self.assertEqual(cal.weekend, {5, 6})
+        self.assertEqual(cal.holidays, set())
+
+    def test_project(self):
+        d = datetime.date
+        cal = WorkdayCalendar(holidays=[d(2016, 3, 15)])
+        p = Project("/test/.egt")
+        p.load(fd=io.StringIO("Name: test\nHolidays: 2016-03-16, 03-17\n\n2016\n15 march: 9:00-10:00\n"), cache=False)
+        pcal = cal.for_project(p)
+        self.assertEqual(pcal.workdays(d(2016, 3, 14), d(2016, 3, 20)), 2)
+        self.assertIs(cal.for_project(p), pcal)
+
+        p = Project("/test/.egt")
+        p.load(fd=io.StringIO("Name: test\n\n2016\n15 march: 9:00-10:00\n"), cache=False)
+        self.assertIs(cal.for_project(p), cal)
+
+    def test_weekrpt(self):
+        d = datetime.date
+        p = Project("/test/.egt")
+        p.load(fd=io.StringIO("Name: test\nTags: work\n\n2016\n15 march: 9:00-13:00\n"), cache=False)
+        rep = WeeklyReport(calendar=WorkdayCalendar(holidays=[d(2016, 3, 14)]))
+        rep.add(p)
+        res = rep.report(end=d(2016, 3, 20), days=7)
+        self.assertEqual(res["workdays"], 4)
+        self.assertEqual(res["hours_per_workday"], 1)
+        self.assertEqual(res["projects"]["test"]["hours_per_workday"], 1)
+
+        res = rep.report(end=d(2016, 3, 20), days=2)
+        self.assertEqual(res["workdays"], 0)
+        self.assertEqual(res["hours_per_workday"], 0)
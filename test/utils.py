@@ -2,6 +2,8 @@
 
 import tempfile
 import os
+from egtlib.statestore import ProjectStateStore
+from egtlib.agenda import AgendaIndex
 
 
 class ProjectTestMixin:
@@ -12,4 +14,6 @@ class ProjectTestMixin:
             print("data.location={}".format(os.path.join(self.workdir.name, "tasks")), file=fd)
 
     def tearDown(self):
+        AgendaIndex.close_all()
+        ProjectStateStore.close_all()
         self.workdir.cleanup()